@@ -1,12 +1,18 @@
-from typing import Dict, List, Optional, cast
+import threading
+from typing import Any, Dict, List, Optional
 from langchain.base_language import BaseLanguageModel
 from langchain.chains import LLMChain
 from langchain.tools import BaseTool
 from langchain.agents import ConversationalChatAgent
 from langchain.chat_models import ChatOpenAI
+from langchain.pydantic_v1 import PrivateAttr
 from knowledge.documentation import Documentation
 from knowledge.url import URL
+from agent.answer_cache import get_answer_cache
 from agent.deployed_agent import DeployedAgent
+from agent.tool_registry import ToolRegistry
+from jobs.job_runner import JobHandle, get_job_runner
+from llm.cache import use_llm_cache
 from tools.versioned_vector_store import VersionedVectorStoreTool
 import zenml_code.zenml_utils as zenml_utils
 
@@ -23,6 +29,11 @@ class InfraConfig:
         self.credentials = credentials
 
 
+# the agents educated from this process, by name, see Agent.for_job
+_educated_agents: Dict[str, "Agent"] = {}
+_educated_agents_lock = threading.Lock()
+
+
 class Agent(ConversationalChatAgent):
     # this name should be unique and will be associated with the
     # pipeline name that backs the agent.
@@ -32,8 +43,8 @@ class Agent(ConversationalChatAgent):
     # a name and personality as input from the user
     prompt: str = ""
     config: Optional[str]
-    _tools: List[BaseTool]
-    _llm: BaseLanguageModel
+    _tools: List[BaseTool] = PrivateAttr(default_factory=list)
+    _llm: Optional[BaseLanguageModel] = PrivateAttr(default=None)
 
     PREFIX: str = (
         "This is the W Agent and can answer questions on ZenML."
@@ -87,14 +98,15 @@ class Agent(ConversationalChatAgent):
         Returns:
             The agent object.
         """
-        super().__init__(name = name, llm_chain=LLMChain(llm=ChatOpenAI(), prompt=Agent.create_prompt(tools=[])))
+        llm = llm or ChatOpenAI()
+        super().__init__(name = name, llm_chain=LLMChain(llm=llm, prompt=Agent.create_prompt(tools=[])))
         # TODO check if a pipeline with that name prefix exists
         # and add a warning that we are reusing the previous registered
         # agent. if you want a new one, create a different name.
         self.config = config
         # TODO rename this to user-defined tools
         self.allowed_tools = tools
-        # self._llm = llm
+        self._llm = llm
         # TODO langsucks
         # need to also have an llm_chain as part of the class, otherwise
         # some methods that assume the presence of an llm_chain will complain
@@ -107,7 +119,9 @@ class Agent(ConversationalChatAgent):
         Returns:
             The LLM Chain powering the agent's responses.
         """
-        return self._llm
+        # the llm of the chain the agent was created with, unless one
+        # was configured since
+        return self._llm or self.llm_chain.llm
 
     def get_allowed_tools(self, version: str = None) -> List[BaseTool]:
         """Get all the tools available with the agent.
@@ -127,13 +141,38 @@ class Agent(ConversationalChatAgent):
 
         # TODO when you implement deletion of a tool, just don't add
         # that tool to the list of tools
-        knowledge_tools = Agent.knowledge_tools(name=self.name, version=version)
-        knowledge_tools.extend(self.allowed_tools)
+        # knowledge_tools returns a view of the cached tools of the
+        # pipeline, which must not be modified
+        knowledge_tools = list(Agent.knowledge_tools(name=self.name, version=version))
+        knowledge_tools.extend(self.user_tools())
+        return knowledge_tools
+
+    def user_tools(self) -> List[BaseTool]:
+        """Get the tools the user has given the agent."""
         # i have added the allowed tools thing here just to implement
         # the agent abstraction. i would love to go back to using just
         # _tools in the future.
-        knowledge_tools.extend(self._tools)
-        return knowledge_tools
+        return list(self.allowed_tools or []) + list(getattr(self, "_tools", []))
+
+    def tool_registry(self, version: int = None) -> ToolRegistry:
+        """Get the compiled tools and prompt of a version of the agent.
+
+        The registry is compiled by the compile_tools step of the pipeline
+        and loaded once per process. It is only compiled here for runs
+        from before that step existed.
+
+        Args:
+            version: The version of the agent.
+
+        Returns:
+            The tool registry of the version.
+        """
+        registry = zenml_utils.get_existing_tool_registry(
+            pipeline_name=self.name, pipeline_version=version
+        )
+        if registry is None:
+            registry = ToolRegistry(self.get_allowed_tools(version=version))
+        return registry
 
     def add_tool(self, tool: VersionedVectorStoreTool):
         self._tools.append(tool)
@@ -149,49 +188,59 @@ class Agent(ConversationalChatAgent):
     def configure_llm(self, llm: BaseLanguageModel):
         self._llm = llm
 
+    @classmethod
+    def for_job(cls, name: str, config: Optional[str] = None) -> "Agent":
+        """Get the agent an educate job runs the pipeline for.
+
+        Jobs only store the name and config of the agent, since the agent
+        holds its LLM, along with its API key. A job run by the process
+        that submitted it gets the agent that submitted it. A job run by
+        another process gets a new agent with that name and config.
+
+        Args:
+            name: The name of the agent.
+            config: The configuration of the agent.
+
+        Returns:
+            The agent.
+        """
+        with _educated_agents_lock:
+            agent = _educated_agents.get(name)
+        if agent is None:
+            agent = cls(name, config=config)
+        return agent
+
     def _get_new_data_urls(
         self,
-        project_name: str,
-        existing_tools: Dict[str, VersionedVectorStoreTool],
         docs: Documentation,
         general_urls: Optional[List[URL]] = [],
     ) -> Dict[str, List[URL]]:
-        """Get the URLs that have not been indexed yet.
+        """Get the URLs to educate the agent on.
+
+        All URLs are returned, including those that have been indexed
+        before. Whether a page needs to be indexed again depends on its
+        content, which is only known once it is fetched, so the
+        index_generator step compares the content hash of every page with
+        the manifest of the existing tool and skips the unchanged ones.
 
         Args:
-            existing_tools: The tools that already exist in the agent's toolkit.
             docs: The documentation to get the URLs from.
             general_urls: Any URLs that the agent should derive knowledge from.
 
         Returns:
             A dict of URLs with version as key and a list of URLs as values.
         """
+        # get the URLs from the documentation
+        docs_urls = docs.get_urls()
+
         # initialize a dict of versioned URLs
         versioned_urls: Dict[str, List[URL]] = {
-            docs.global_latest_version: general_urls
+            docs.global_latest_version: list(general_urls)
         }
 
-        # get the URLs from the documentation
-        docs_urls = docs.get_urls()
-
         # merge versioned_urls and docs_urls
         for version, urls in docs_urls.items():
-            versioned_urls[version].extend(urls)
-
-        # get the URLs that have not been indexed yet
-        for version in existing_tools:
-            # if the name of the tool does not match the project name,
-            # skip the tool.
-            tool = existing_tools[version]
-            names = tool.name.split("-")
-            if names[0] != project_name:
-                continue
-            # get the URLs that have not been indexed yet
-            versioned_urls[version] = [
-                url
-                for url in versioned_urls[version]
-                if url.get_hash() not in tool.urls
-            ]
+            versioned_urls.setdefault(version, []).extend(urls)
 
         return versioned_urls
 
@@ -201,7 +250,7 @@ class Agent(ConversationalChatAgent):
         docs: Documentation,
         general_urls: Optional[List[URL]] = [],
         infra_config: Optional[InfraConfig] = None,
-    ):
+    ) -> JobHandle:
         """Educate the agent on a set of documents.
 
         TODO take a parameter to specify if the general URLs should be
@@ -215,6 +264,11 @@ class Agent(ConversationalChatAgent):
         the agent's toolkit. This function should only create these
         collections for data that has not been seen yet.
 
+        The index creation runs as a background job, so this returns right
+        away, and several agents can be educated at once from one process.
+        The job stores the name and config of the agent rather than the
+        agent, whose LLM holds an API key, see Agent.for_job.
+
         Args:
             project_name: The name of the project to create the tools for.
             docs: The documentation to educate the agent on.
@@ -222,61 +276,89 @@ class Agent(ConversationalChatAgent):
                 Can be a website, a link to a YouTube video, etc.
             infra_config: The infrastructure configuration to use to run the
                 index creation.
-        """
-        docs_urls = docs.get_urls()
-        cast(List[URL], docs_urls)
-
-        # TODO if every pipeline name has the project name, then this becomes easier
-        # since you only get the tools for that specific project.
-        # get the list of tools already a part of the agent's toolkit
-        existing_tools = zenml_utils.get_existing_tools(pipeline_name=self.name)
 
-        # make a list of hashed URLs a part of the tool definition.
-        # TODO: in the future, make a part of the custom vector store?
-        # get URLs that have not been indexed yet
+        Returns:
+            The handle of the job, to follow its status and progress, wait
+            for it or cancel it.
+        """
+        # unchanged pages are skipped by the pipeline based on the
+        # manifests of the existing tools
         new_urls = self._get_new_data_urls(
-            project_name=project_name,
-            existing_tools=existing_tools,
             docs=docs,
             general_urls=general_urls,
         )
 
+        with _educated_agents_lock:
+            _educated_agents[self.name] = self
         # TODO maybe have a different pipeline name for each project?
         # call the zenml pipeline to create the index
-        zenml_utils.trigger_pipeline(
+        return get_job_runner().submit(
+            "educate",
             pipeline_name=self.name,
             project_name=project_name,
             urls=new_urls,
             infra_config=infra_config,
-            agent=self
+            agent_config=self.config,
         )
 
-    # define check status should check for completion of pipeline and also
-    # outout the pipeline version being run. can be used for deploy.
-
     # define get_versions for the agent to show all available versions
     # (pipeline versions)
 
-    def deploy(self, version: int) -> DeployedAgent:
+    def deploy(
+        self,
+        version: int,
+        cache_answers: bool = True,
+        cache_llm_calls: bool = True,
+        tool_registry: Optional[ToolRegistry] = None,
+    ) -> DeployedAgent:
         """Deploy the agent.
 
-        Deploy the agent at some endpoint.
+        Deploy the agent at some endpoint. The LLM of the deployment
+        streams if it can, so that answers can be streamed token by token.
 
         Args:
             version: the version of the agent to deploy.
+            cache_answers: whether repeated questions are answered from the
+                semantic answer cache of the version. Every version has its
+                own cache, so versions can be deployed side by side.
+            cache_llm_calls: whether LLM calls with exactly the same prompt
+                and parameters as a past call are answered from the LLM
+                cache. Calls sampled with a temperature above zero are
+                never cached unless the cache is configured to. Only the
+                LLM of this deployment opts in or out, other deployments
+                keep their own setting.
+            tool_registry: the compiled tools of the version, if they have
+                been loaded already, like by a model host.
         """
+        agent = zenml_utils.get_existing_agent(
+            pipeline_name=self.name, pipeline_version=version
+        )
+        if cache_llm_calls:
+            use_llm_cache()
+        # langchain only looks up a global cache, a model can only opt out
+        # of it, so the LLM of the deployment is a copy that does or doesn't
+        settings: Dict[str, Any] = {"cache": cache_llm_calls}
+        if "streaming" in type(agent.llm).__fields__:
+            # so that astream_answer streams the tokens of the answer
+            settings["streaming"] = True
+        agent.configure_llm(agent.llm.copy(update=settings))
 
         deployed_agent = DeployedAgent(
-            agent=zenml_utils.get_existing_agent(
-                pipeline_name=self.name, pipeline_version=version
-            ),
+            agent=agent,
             version=version,
+            answer_cache=get_answer_cache(self.name, version) if cache_answers else None,
+            tool_registry=tool_registry,
         )
 
-        # create a service out of it and deploy locally
+        # to serve it over HTTP, wrap it in a serving.agent_service.AgentService
+        # and pass that to serving.app.serve
         return deployed_agent
 
 
+# the agent field of DeployedAgent refers to Agent, which imports it
+DeployedAgent.update_forward_refs(Agent=Agent)
+
+
 """
 my agent should extend the conversational agent and implement the 
 create prompt method. override the agent.get_allowed_tools
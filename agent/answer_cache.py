@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+
+class CachedAnswer:
+    """An answer in the AnswerCache."""
+
+    def __init__(self, question: str, answer: str, created_at: float):
+        """Create a CachedAnswer object.
+
+        Args:
+            question: The question that was answered.
+            answer: The answer of the agent.
+            created_at: The unix timestamp of when the answer was cached.
+        """
+        self.question = question
+        self.answer = answer
+        self.created_at = created_at
+
+
+class AnswerCache:
+    """A semantic cache of the answers of a deployed agent.
+
+    Past questions are embedded and kept in a FAISS inner-product index
+    over normalized vectors. A new question whose cosine similarity to a
+    past one is at least `threshold` gets the stored answer, skipping the
+    agent loop altogether.
+
+    Answers expire after `ttl` seconds, and once the cache holds
+    `max_entries` answers the least recently used one is evicted. The cache
+    is bound to one version of the agent: answers given by another version
+    are never returned, and binding the cache to a new version drops them.
+    """
+
+    def __init__(
+        self,
+        embeddings: Optional[Embeddings] = None,
+        threshold: float = 0.95,
+        ttl: float = 24 * 60 * 60,
+        max_entries: int = 10_000,
+    ):
+        """Create an AnswerCache object.
+
+        Args:
+            embeddings: The embeddings used to embed questions. Defaults to
+                OpenAI embeddings.
+            threshold: The minimum cosine similarity between two questions
+                for them to have the same answer.
+            ttl: How long answers are cached for, in seconds.
+            max_entries: The maximum number of cached answers.
+        """
+        if embeddings is None:
+            from langchain.embeddings import OpenAIEmbeddings
+
+            embeddings = OpenAIEmbeddings()
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: Optional[faiss.Index] = None
+        # in least recently used order
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_key = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def bind(self, version: int) -> None:
+        """Bind the cache to a version of the agent.
+
+        The answers of any other version are dropped.
+
+        Args:
+            version: The version of the agent.
+        """
+        with self._lock:
+            if version != self.version:
+                self._clear()
+                self.version = version
+
+    def clear(self) -> None:
+        """Drop all cached answers."""
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        """Drop all cached answers. Must be called with the lock held."""
+        self._index = None
+        self._entries.clear()
+
+    def embed(self, question: str) -> np.ndarray:
+        """Returns the normalized vector of a question."""
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, question: str, version: int) -> Tuple[Optional[str], np.ndarray]:
+        """Look up the answer of the most similar past question.
+
+        Args:
+            question: The question.
+            version: The version of the agent asking.
+
+        Returns:
+            The cached answer, or None on a miss, and the vector of the
+            question so that a miss can be stored without embedding it
+            again.
+        """
+        vector = self.embed(question)
+        with self._lock:
+            if version != self.version or self._index is None or not self._entries:
+                self.misses += 1
+                return None, vector
+            similarities, keys = self._index.search(vector[None, :], 1)
+            key, similarity = int(keys[0][0]), float(similarities[0][0])
+            entry = self._entries.get(key)
+            if entry is None or similarity < self.threshold:
+                self.misses += 1
+                return None, vector
+            if time.time() - entry.created_at > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None, vector
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.answer, vector
+
+    def put(
+        self,
+        question: str,
+        answer: str,
+        version: int,
+        vector: Optional[np.ndarray] = None,
+    ) -> None:
+        """Cache the answer to a question.
+
+        Args:
+            question: The question.
+            answer: The answer of the agent.
+            version: The version of the agent that answered.
+            vector: The vector of the question returned by `lookup`, if any.
+        """
+        if vector is None:
+            vector = self.embed(question)
+        with self._lock:
+            # the answer of a version the cache is no longer bound to
+            if version != self.version:
+                return
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(len(vector)))
+            key = self._next_key
+            self._next_key += 1
+            self._index.add_with_ids(vector[None, :], np.array([key], dtype=np.int64))
+            self._entries[key] = CachedAnswer(question, answer, time.time())
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: int) -> None:
+        """Remove an answer. Must be called with the lock held."""
+        del self._entries[key]
+        self._index.remove_ids(np.array([key], dtype=np.int64))
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the number of entries, hits and misses, and the hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# the answer caches of the deployed agents, by agent name and version, so
+# that versions deployed side by side don't drop each other's answers
+_answer_caches: Dict[Tuple[str, int], AnswerCache] = {}
+_answer_caches_lock = threading.Lock()
+
+
+def get_answer_cache(agent_name: str, version: int) -> AnswerCache:
+    """Returns the answer cache of a version of an agent, creating it if needed."""
+    key = (agent_name, version)
+    with _answer_caches_lock:
+        if key not in _answer_caches:
+            _answer_caches[key] = AnswerCache()
+        return _answer_caches[key]
+
+
+def set_answer_cache(agent_name: str, version: int, cache: AnswerCache) -> None:
+    """Set the answer cache of a version of an agent, like to change its settings."""
+    with _answer_caches_lock:
+        _answer_caches[(agent_name, version)] = cache
+
+
+def drop_answer_caches(agent_name: Optional[str] = None) -> None:
+    """Clear and forget the answer caches of an agent, once its answers are stale.
+
+    The caches are cleared too, since deployed agents keep theirs.
+
+    Args:
+        agent_name: The name of the agent. If None, all caches are dropped.
+    """
+    with _answer_caches_lock:
+        for key in list(_answer_caches):
+            if agent_name is None or key[0] == agent_name:
+                _answer_caches.pop(key).clear()
@@ -1,21 +1,33 @@
 from __future__ import annotations
-from typing import Any, Dict
+import asyncio
+from typing import Any, AsyncIterator, Dict, Optional
 
 from langchain.agents import AgentExecutor
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForChainRun,
+    CallbackManagerForChainRun,
+)
+from langchain.pydantic_v1 import root_validator
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from agent.agent import Agent
-from tools.versioned_vector_store import VersionedVectorStoreTool
+from agent.answer_cache import AnswerCache
+from agent.streaming import AgentEvent, astream_events
+from agent.tool_registry import ToolRegistry
 
 
 class DeployedAgent(AgentExecutor):
-    version: int
+    version: Optional[int] = None
     # TODO make a class out of it
-    deployment_config: Dict[str, Any]
+    deployment_config: Dict[str, Any] = {}
     validator: Any
     memory: Any
     agent: Agent
+    # answers to past questions, see _cached_answer
+    answer_cache: Optional[AnswerCache] = None
+    # the compiled tools and prompt of the version
+    tool_registry: Optional[ToolRegistry] = None
 
     PROMPT: str = (
         "{prefix}"
@@ -31,19 +43,21 @@ class DeployedAgent(AgentExecutor):
 
     def get_prompt(self) -> str:
         """Returns the prompt to be used by the agent."""
-        tools = self.agent.get_allowed_tools(version=self.version)
-        # construct a string with all the tools and their
-        # names, description and version (if the tool is of type VersionedVectorStoreTool)
-        tools_str = ""
-        for tool in tools:
-            tools_str += f"\n{tool.name}: {tool.description} "
-            if isinstance(tool, VersionedVectorStoreTool):
-                tools_str += f"Version: {tool.version} \n"
-
-        return self.PROMPT.format(prefix=self.agent.PREFIX, tools=tools)
+        # the names, descriptions and versions of the tools are rendered
+        # when the registry is compiled
+        return self.PROMPT.format(
+            prefix=self.agent.PREFIX, tools=self.tool_registry.tool_block
+        )
 
     def __init__(
-        self, agent: Agent, memory, validator, deployment_config, version
+        self,
+        agent: Agent,
+        memory=None,
+        validator=None,
+        deployment_config=None,
+        version=None,
+        answer_cache: Optional[AnswerCache] = None,
+        tool_registry: Optional[ToolRegistry] = None,
     ) -> None:
         """Initializes the agent.
 
@@ -53,17 +67,113 @@ class DeployedAgent(AgentExecutor):
             validator: The validator to use.
             deployment_config: The deployment config to use.
             version: The version of the agent to use.
+            answer_cache: The semantic cache of the answers of the agent.
+                If None, every question runs the agent loop.
+            tool_registry: The compiled tools of the version. Defaults to
+                the registry the pipeline compiled for it.
         """
         from langchain.chains import LLMChain
-        from agent.agent import Agent
-        self.version = version
+        tool_registry = tool_registry or agent.tool_registry(version=version)
         # TODO langsucks right now we're overwriting the llm chain
         # which was defined at agent definition. We should define the chain
         # once and here, ideally.
-        agent.llm_chain = LLMChain(
-            llm=agent.llm,
-            prompt=Agent.create_prompt(agent.get_allowed_tools(version=version)),
+        agent.llm_chain = LLMChain(llm=agent.llm, prompt=tool_registry.prompt)
+        super().__init__(
+            agent=agent,
+            tools=list(tool_registry.tools),
+            memory=memory,
+            validator=validator,
+            deployment_config=deployment_config or {},
+            version=version,
+            answer_cache=answer_cache,
+            tool_registry=tool_registry,
         )
-        return self.from_agent_and_tools(
-            agent=agent, tools=agent.get_allowed_tools(version=version)
+        if answer_cache is not None:
+            # answers of the previously deployed version are stale
+            answer_cache.bind(version)
+
+    @root_validator()
+    def validate_tools(cls, values: Dict) -> Dict:
+        """Validate that the tools are those of the tool registry.
+
+        Replaces the check of AgentExecutor, which compares the tools with
+        those of the latest version of the agent instead of the deployed one.
+        """
+        registry = values.get("tool_registry")
+        names = [tool.name for tool in values.get("tools") or []]
+        if registry is not None and names != list(registry.names):
+            raise ValueError(
+                f"The tools ({names}) are not those of the tool registry "
+                f"({list(registry.names)})."
+            )
+        return values
+
+    def _cacheable_question(self, inputs: Dict[str, Any]) -> Optional[str]:
+        """Returns the question if its answer can come from the answer cache.
+
+        Follow-up questions depend on the conversation, so only questions
+        asked without chat history are cached.
+        """
+        if self.answer_cache is None or inputs.get("chat_history"):
+            return None
+        question = inputs.get("input")
+        return question if isinstance(question, str) else None
+
+    def _call(
+        self,
+        inputs: Dict[str, str],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        """Answer from the answer cache, or run the agent loop and cache its answer."""
+        question = self._cacheable_question(inputs)
+        if question is None:
+            return super()._call(inputs, run_manager=run_manager)
+        answer, vector = self.answer_cache.lookup(question, self.version)
+        if answer is not None:
+            return {self.agent.return_values[0]: answer}
+        outputs = super()._call(inputs, run_manager=run_manager)
+        self.answer_cache.put(
+            question, outputs[self.agent.return_values[0]], self.version, vector
         )
+        return outputs
+
+    async def _acall(
+        self,
+        inputs: Dict[str, str],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, str]:
+        """Answer from the answer cache, or run the agent loop and cache its answer."""
+        question = self._cacheable_question(inputs)
+        if question is None:
+            return await super()._acall(inputs, run_manager=run_manager)
+        # embedding the question and searching the cache block, so they
+        # run in a thread to keep the event loop serving other requests
+        loop = asyncio.get_running_loop()
+        answer, vector = await loop.run_in_executor(
+            None, self.answer_cache.lookup, question, self.version
+        )
+        if answer is not None:
+            return {self.agent.return_values[0]: answer}
+        outputs = await super()._acall(inputs, run_manager=run_manager)
+        await loop.run_in_executor(
+            None,
+            self.answer_cache.put,
+            question,
+            outputs[self.agent.return_values[0]],
+            self.version,
+            vector,
+        )
+        return outputs
+
+    def astream_answer(self, inputs: Dict[str, Any]) -> AsyncIterator[AgentEvent]:
+        """Answer a question, yielding the events of the run as they happen.
+
+        The agent's choices of tools and the documents they retrieve are
+        yielded as they happen, then the final answer token by token as the
+        LLM writes it, and finally the whole answer. Agent.deploy turns on
+        streaming for LLMs that support it. See agent.streaming.AgentEvent.
+
+        Args:
+            inputs: The inputs of the agent, like for `acall`.
+        """
+        return astream_events(self, inputs)
@@ -0,0 +1,216 @@
+import asyncio
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from langchain.callbacks.base import AsyncCallbackHandler
+from langchain.chains.base import Chain
+from langchain.schema import AgentAction
+from langchain.schema.document import Document
+
+# the start of the final answer in the JSON blob of a conversational agent
+FINAL_ANSWER_PATTERN = re.compile(
+    r'"action"\s*:\s*"Final Answer"\s*,\s*"action_input"\s*:\s*"'
+)
+ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+# the longest the output of a tool is echoed in an observation event
+MAX_OBSERVATION_LENGTH = 500
+
+
+class AgentEvent:
+    """An event of a streamed agent run.
+
+    The types of events are:
+        action: the agent chose a tool, with "tool" and "tool_input".
+        retrieval: a tool retrieved documents, with "sources".
+        observation: a tool finished, with "tool" and "output".
+        token: a piece of the final answer, with "token".
+        answer: the whole final answer, with "answer". Always the last
+            event of a run that succeeded.
+    """
+
+    def __init__(self, type: str, **data: Any):
+        """Create an AgentEvent object.
+
+        Args:
+            type: The type of the event.
+            data: The data of the event.
+        """
+        self.type = type
+        self.data = data
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the event as a JSON-serializable dict."""
+        return {"type": self.type, **self.data}
+
+    def __repr__(self) -> str:
+        return f"AgentEvent({self.to_dict()})"
+
+
+class FinalAnswerParser:
+    """Extracts the final answer from the JSON blob of an agent as it streams.
+
+    The conversational agent answers with a blob like
+    {"action": "Final Answer", "action_input": "..."}. Once the tokens fed
+    in so far show that the blob is a final answer, the characters of
+    action_input are returned as they arrive, with JSON escapes decoded.
+    """
+
+    def __init__(self):
+        """Create a FinalAnswerParser object."""
+        self._buffer = ""
+        # the position in the buffer after the opening quote of the
+        # answer, once it is found
+        self._position: Optional[int] = None
+        self.done = False
+
+    def feed(self, token: str) -> str:
+        """Add a token of the LLM output and return the new text of the answer."""
+        if self.done:
+            return ""
+        self._buffer += token
+        if self._position is None:
+            match = FINAL_ANSWER_PATTERN.search(self._buffer)
+            if match is None:
+                return ""
+            self._position = match.end()
+
+        text = []
+        buffer, i = self._buffer, self._position
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                break
+            if char != "\\":
+                text.append(char)
+                i += 1
+                continue
+            # wait for the rest of an escape sequence
+            if i + 1 == len(buffer):
+                break
+            escape = buffer[i + 1]
+            if escape == "u":
+                if i + 6 > len(buffer):
+                    break
+                text.append(chr(int(buffer[i + 2 : i + 6], 16)))
+                i += 6
+            else:
+                text.append(ESCAPES.get(escape, escape))
+                i += 2
+        self._position = i
+        return "".join(text)
+
+
+class StreamingHandler(AsyncCallbackHandler):
+    """A callback handler turning the callbacks of an agent run into AgentEvents.
+
+    Tokens are only parsed from the LLM calls of the agent itself, not from
+    the calls the tools make.
+    """
+
+    def __init__(self, queue: "asyncio.Queue[AgentEvent]"):
+        """Create a StreamingHandler object.
+
+        Args:
+            queue: The queue the events are put in.
+        """
+        self.queue = queue
+        self.streamed = False
+        self._parser = FinalAnswerParser()
+        self._tool: Optional[str] = None
+        self._tool_runs = 0
+
+    async def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: Any, **kwargs: Any
+    ) -> None:
+        if not self._tool_runs:
+            self._parser = FinalAnswerParser()
+
+    async def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
+    ) -> None:
+        if not self._tool_runs:
+            self._parser = FinalAnswerParser()
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if self._tool_runs:
+            return
+        text = self._parser.feed(token)
+        if text:
+            self.streamed = True
+            await self.queue.put(AgentEvent("token", token=text))
+
+    async def on_agent_action(self, action: AgentAction, **kwargs: Any) -> None:
+        self._tool = action.tool
+        await self.queue.put(
+            AgentEvent("action", tool=action.tool, tool_input=action.tool_input)
+        )
+
+    async def on_tool_start(
+        self, serialized: Dict[str, Any], input_str: str, **kwargs: Any
+    ) -> None:
+        self._tool_runs += 1
+
+    async def on_retriever_end(
+        self, documents: Sequence[Document], *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        sources = [document.metadata.get("source") for document in documents]
+        await self.queue.put(AgentEvent("retrieval", tool=self._tool, sources=sources))
+
+    async def on_tool_end(self, output: str, **kwargs: Any) -> None:
+        self._tool_runs -= 1
+        output = str(output)[:MAX_OBSERVATION_LENGTH]
+        await self.queue.put(AgentEvent("observation", tool=self._tool, output=output))
+
+    async def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        self._tool_runs -= 1
+
+
+async def astream_events(
+    chain: Chain, inputs: Dict[str, Any]
+) -> AsyncIterator[AgentEvent]:
+    """Run an agent and yield the events of the run as they happen.
+
+    The tokens of the final answer are only streamed if the LLM of the
+    agent streams, like a ChatOpenAI with streaming=True. Otherwise, and
+    when the answer doesn't come from the LLM at all, like answers from the
+    answer cache, the whole answer is a single token event.
+
+    Args:
+        chain: The agent executor.
+        inputs: The inputs of the agent.
+
+    Yields:
+        The events of the run, ending with the answer.
+    """
+    queue: "asyncio.Queue[Optional[AgentEvent]]" = asyncio.Queue()
+    handler = StreamingHandler(queue)
+    task = asyncio.ensure_future(chain.acall(inputs, callbacks=[handler]))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield event
+        outputs = task.result()
+    finally:
+        # the consumer went away, like a client that disconnected
+        if not task.done():
+            task.cancel()
+
+    answer = outputs[chain.output_keys[0]]
+    if not handler.streamed:
+        yield AgentEvent("token", token=answer)
+    yield AgentEvent("answer", answer=answer)
+
@@ -0,0 +1,86 @@
+from types import MappingProxyType
+from typing import Any, Iterable, Mapping, Tuple
+
+from langchain.agents import ConversationalChatAgent
+from langchain.prompts.base import BasePromptTemplate
+from langchain.tools import BaseTool
+
+from tools.versioned_vector_store import VersionedVectorStoreTool
+
+
+class ToolRegistry:
+    """The tools of a version of an agent, compiled once.
+
+    Holds the tools by name, the block describing them in the prompt of
+    the DeployedAgent, and the prompt template of the agent's LLM chain,
+    all built when the registry is compiled. The registry is immutable, so
+    deployments of the same version can share it, and it is picklable, so
+    the pipeline stores it as the output of the compile_tools step and a
+    deployment only has to load it.
+    """
+
+    def __init__(self, tools: Iterable[BaseTool]):
+        """Create a ToolRegistry object, compiling the tools.
+
+        Args:
+            tools: The tools of the agent.
+
+        Raises:
+            ValueError: If two tools have the same name.
+        """
+        tools = tuple(tools)
+        by_name = {}
+        for tool in tools:
+            if tool.name in by_name:
+                raise ValueError(f"Two tools are named {tool.name}.")
+            by_name[tool.name] = tool
+        lines = []
+        for tool in tools:
+            line = f"\n{tool.name}: {tool.description} "
+            if isinstance(tool, VersionedVectorStoreTool):
+                line += f"Version: {tool.version} \n"
+            lines.append(line)
+        # __setattr__ is disabled, see below
+        self.__dict__.update(
+            _tools=tools,
+            _by_name=by_name,
+            _tool_block="".join(lines),
+            _prompt=ConversationalChatAgent.create_prompt(tools),
+        )
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("A ToolRegistry can't be modified, compile a new one.")
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __getitem__(self, name: str) -> BaseTool:
+        return self._by_name[name]
+
+    @property
+    def tools(self) -> Tuple[BaseTool, ...]:
+        """The tools, in the order they were compiled in."""
+        return self._tools
+
+    @property
+    def by_name(self) -> Mapping[str, BaseTool]:
+        """A read-only mapping of the names of the tools to the tools."""
+        return MappingProxyType(self._by_name)
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """The names of the tools."""
+        return tuple(self._by_name)
+
+    @property
+    def tool_block(self) -> str:
+        """The description of the tools in the prompt of the DeployedAgent."""
+        return self._tool_block
+
+    @property
+    def prompt(self) -> BasePromptTemplate:
+        """The prompt template of the LLM chain of the agent."""
+        return self._prompt
@@ -0,0 +1,53 @@
+"""Compares the recursive crawl() with the Crawler engine.
+
+Run from the root of the repository:
+
+    python benchmarks/crawler_benchmark.py --pages 500 --delay 0.02
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "zenml_code"), os.path.dirname(__file__)]
+
+from urllib.parse import urlparse  # noqa: E402
+
+from fixture_site import build_site, serve_site  # noqa: E402
+from steps.crawler import Crawler  # noqa: E402
+from steps.url_scraping_utils import crawl  # noqa: E402
+
+
+def report(name: str, pages: int, seconds: float) -> None:
+    print(f"{name:<24} {pages:>6} pages  {seconds:>8.2f}s  {pages / seconds:>8.1f} pages/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--delay", type=float, default=0.02, help="per-request latency in seconds")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    server, url = serve_site(build_site(args.pages), delay=args.delay)
+    base = urlparse(url).netloc
+    # the recursive crawler needs one frame per page in the worst case
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * args.pages))
+
+    try:
+        start = time.perf_counter()
+        pages = crawl(url, base)
+        report("recursive crawl()", len(pages), time.perf_counter() - start)
+
+        crawler = Crawler(max_workers=args.workers, max_per_host=args.workers)
+        start = time.perf_counter()
+        pages = crawler.crawl(url, base)
+        report(f"Crawler({args.workers} workers)", len(pages), time.perf_counter() - start)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
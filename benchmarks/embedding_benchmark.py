@@ -0,0 +1,67 @@
+"""Measures the throughput of the EmbeddingEngine against sequential embedding.
+
+The local HashingEmbeddings backend is wrapped with a fixed delay per call
+to emulate the round trip to an embeddings API. Run from the root of the
+repository:
+
+    python benchmarks/embedding_benchmark.py --chunks 5000 --delay 0.2
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from embeddings.embedding_engine import EmbeddingEngine  # noqa: E402
+from embeddings.hashing_embeddings import HashingEmbeddings  # noqa: E402
+
+
+class DelayedEmbeddings(HashingEmbeddings):
+    """Hashing embeddings with a fixed delay per request."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def embed_documents(self, texts):
+        time.sleep(self.delay)
+        return super().embed_documents(texts)
+
+
+def report(name: str, chunks: int, seconds: float) -> None:
+    print(f"{name:<32} {chunks:>7} chunks  {seconds:>8.2f}s  {chunks / seconds:>9.1f} chunks/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--delay", type=float, default=0.2, help="latency per request in seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    texts = [
+        f"Chunk {i}: a step is a function decorated with @step that takes "
+        f"inputs and returns outputs which are tracked as artifacts. " * 8
+        for i in range(args.chunks)
+    ]
+    embeddings = DelayedEmbeddings(args.delay)
+
+    start = time.perf_counter()
+    # what FAISS.from_documents does: a single call for all texts is not
+    # possible with real providers, so batches of a fixed size are sent
+    # one after another
+    for i in range(0, len(texts), 100):
+        embeddings.embed_documents(texts[i : i + 100])
+    report("sequential, 100 per batch", len(texts), time.perf_counter() - start)
+
+    engine = EmbeddingEngine(embeddings, max_concurrency=args.concurrency)
+    start = time.perf_counter()
+    vectors = engine.embed_all(texts)
+    report(f"engine, {args.concurrency} concurrent", len(vectors), time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""A local documentation-like site to run the benchmarks against.
+
+The site is a tree of HTML pages where every page links to its parent,
+its children and a handful of siblings, similar to the navigation of a
+docs site. It is served from a background thread with an optional delay
+per request to emulate network latency.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><title>Page {index}</title></head>
+<body>
+<nav>{links}</nav>
+<main>
+<article class="md-content__inner">
+<h1>Page {index}</h1>
+<p>{body}</p>
+<h2>Usage</h2>
+<pre><code>from zenml import step, pipeline</code></pre>
+<p>{body}</p>
+</article>
+</main>
+</body>
+</html>
+"""
+
+LOREM = (
+    "ZenML is an extensible, open-source MLOps framework for creating "
+    "portable, production-ready machine learning pipelines. "
+)
+
+
+def page_name(index: int) -> str:
+    """Returns the file name of the page with the given index."""
+    return "index.html" if index == 0 else f"page_{index}.html"
+
+
+def build_site(num_pages: int, fanout: int = 8) -> str:
+    """Writes the fixture site to a temporary directory.
+
+    Args:
+        num_pages: The number of pages in the site.
+        fanout: The number of children of every page.
+
+    Returns:
+        The path to the directory holding the site.
+    """
+    root = tempfile.mkdtemp(prefix="fixture_site_")
+    for index in range(num_pages):
+        parent = (index - 1) // fanout
+        children = range(index * fanout + 1, min(index * fanout + fanout + 1, num_pages))
+        siblings = range(max(index - 2, 0), min(index + 3, num_pages))
+        targets = [parent, *children, *siblings]
+        links = "".join(
+            f'<a href="/{page_name(target)}#section">link {target}</a>'
+            for target in targets
+        )
+        with open(os.path.join(root, page_name(index)), "w") as f:
+            f.write(PAGE_TEMPLATE.format(index=index, links=links, body=LOREM * 20))
+    return root
+
+
+class _DelayedHandler(SimpleHTTPRequestHandler):
+    delay: float = 0.0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_site(root: str, delay: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """Serves the fixture site from a background thread.
+
+    Args:
+        root: The directory holding the site.
+        delay: The delay in seconds added to every request.
+
+    Returns:
+        The server, so that it can be shut down, and the URL of the root page.
+    """
+    handler = type("Handler", (_DelayedHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(handler, directory=root))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
@@ -0,0 +1,78 @@
+"""Measures the latency BM25 search and rank fusion add to a query.
+
+The corpus is made of synthetic documentation chunks mixing common words
+with identifiers. Run from the root of the repository:
+
+    python benchmarks/hybrid_benchmark.py --chunks 50000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from vector_store.bm25_index import BM25Index  # noqa: E402
+from vector_store.hybrid import reciprocal_rank_fusion  # noqa: E402
+
+WORDS = (
+    "the a step pipeline run artifact stack component orchestrator to of and "
+    "in is with for that can you your this from on cache model deploy"
+).split()
+IDENTIFIERS = [f"{prefix}_{i}" for prefix in ("enable", "get", "set", "flag") for i in range(500)]
+
+
+def make_chunk(rng: random.Random) -> str:
+    """Returns a chunk of about 150 words with a few identifiers."""
+    words = [rng.choice(WORDS) for _ in range(150)]
+    for _ in range(3):
+        words[rng.randrange(len(words))] = rng.choice(IDENTIFIERS)
+    return " ".join(words)
+
+
+def report(name: str, latencies: np.ndarray) -> None:
+    print(
+        f"{name:<24} p50 {np.percentile(latencies, 50):8.3f} ms  "
+        f"p99 {np.percentile(latencies, 99):8.3f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    texts = [make_chunk(rng) for _ in range(args.chunks)]
+    start = time.perf_counter()
+    index = BM25Index.build(np.arange(args.chunks), texts)
+    print(f"built the BM25 index of {args.chunks} chunks in {time.perf_counter() - start:.2f}s")
+
+    queries = [
+        f"how do I use {rng.choice(IDENTIFIERS)} in a {rng.choice(WORDS)} step"
+        for _ in range(args.queries)
+    ]
+    search, fusion = [], []
+    for query in queries:
+        start = time.perf_counter()
+        sparse, _ = index.search(query, args.fetch_k)
+        search.append((time.perf_counter() - start) * 1000)
+        # stand-in for the keys returned by the vector index
+        dense = rng.sample(range(args.chunks), args.fetch_k)
+        start = time.perf_counter()
+        reciprocal_rank_fusion([dense, sparse.tolist()], 4)
+        fusion.append((time.perf_counter() - start) * 1000)
+
+    report("BM25 search", np.array(search))
+    report("reciprocal rank fusion", np.array(fusion))
+
+
+if __name__ == "__main__":
+    main()
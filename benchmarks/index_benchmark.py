@@ -0,0 +1,98 @@
+"""Reports recall@k, query latency and memory of each index type.
+
+The corpus is made of synthetic unit vectors drawn around random topic
+centers, which clusters them the way embeddings of documentation chunks
+are clustered. The exact neighbours found by the flat index are the
+ground truth. Run from the root of the repository:
+
+    python benchmarks/index_benchmark.py --vectors 100000 --dim 256 --k 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from vector_store.index_types import create_index, search_parameters  # noqa: E402
+
+
+def make_vectors(count: int, dim: int, topics: int, rng: np.random.Generator) -> np.ndarray:
+    """Returns unit vectors scattered around random topic centers."""
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = centers[rng.integers(topics, size=count)]
+    vectors += 0.35 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def measure(index: faiss.Index, queries: np.ndarray, k: int, nprobe):
+    """Returns the neighbours of the queries and the latency of each query in ms."""
+    params = search_parameters(index, nprobe)
+    neighbours, latencies = [], []
+    # one query at a time, the way the agent searches
+    for query in queries:
+        start = time.perf_counter()
+        _, keys = index.search(query[None, :], k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        neighbours.append(keys[0])
+    return np.array(neighbours), np.array(latencies)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    """Returns the fraction of the true neighbours that were found."""
+    hits = sum(len(set(f.tolist()) & set(t.tolist())) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.vectors, args.dim, max(10, args.vectors // 500), rng)
+    queries = make_vectors(args.queries, args.dim, max(10, args.vectors // 500), rng)
+    keys = np.arange(args.vectors, dtype=np.int64)
+
+    print(
+        f"{args.vectors} vectors of {args.dim} dimensions, {args.queries} queries, "
+        f"recall@{args.k} against exact search\n"
+    )
+    print(
+        f"{'index':<8} {'nprobe':>6} {'build s':>8} {'MB':>8} "
+        f"{'recall':>7} {'p50 ms':>7} {'p99 ms':>7}"
+    )
+    truth = None
+    for index_type in ("flat", "sq8", "ivf", "ivfpq"):
+        start = time.perf_counter()
+        index = create_index(index_type, vectors)
+        index.add_with_ids(vectors, keys)
+        build = time.perf_counter() - start
+        size = len(faiss.serialize_index(index)) / 2**20
+        is_ivf = faiss.try_extract_index_ivf(index) is not None
+        # queries run on one thread each when serving
+        threads = faiss.omp_get_max_threads()
+        faiss.omp_set_num_threads(1)
+        for nprobe in args.nprobe if is_ivf else [None]:
+            found, latencies = measure(index, queries, args.k, nprobe)
+            if truth is None:
+                truth = found
+            print(
+                f"{index_type:<8} {nprobe or '-':>6} {build:>8.2f} {size:>8.1f} "
+                f"{recall(found, truth):>7.3f} {np.percentile(latencies, 50):>7.3f} "
+                f"{np.percentile(latencies, 99):>7.3f}"
+            )
+        faiss.omp_set_num_threads(threads)
+
+
+if __name__ == "__main__":
+    main()
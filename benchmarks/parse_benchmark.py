@@ -0,0 +1,108 @@
+"""Measures the parse time of pages and how loading them scales with processes.
+
+First, every page of the fixture site, which has the layout of an MkDocs
+Material site, is parsed with each extractor to compare the time per page
+of the doc_extraction fast path with Unstructured. Then the pages are
+written to a fresh page store for every run, so that no parsed text is
+reused, and loaded with the serial load_urls and with the
+ParallelPageLoader at every number of processes. Run from the root of the
+repository:
+
+    python benchmarks/parse_benchmark.py --pages 500 --workers 1,2,4,8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "zenml_code"), os.path.dirname(__file__)]
+
+from fixture_site import build_site, page_name  # noqa: E402
+from knowledge.page_store import PageStore  # noqa: E402
+from knowledge.url import URL  # noqa: E402
+from steps.web_loading_utils import (  # noqa: E402
+    EXTRACTORS,
+    ParallelPageLoader,
+    load_urls,
+    parse_html,
+)
+
+
+def store_site(site: str, num_pages: int) -> Tuple[PageStore, List[URL]]:
+    """Write the pages of the site to a fresh page store and return their URLs."""
+    page_store = PageStore(tempfile.mkdtemp(prefix="parse_benchmark_"))
+    urls = []
+    for index in range(num_pages):
+        with open(os.path.join(site, page_name(index)), "rb") as f:
+            digest = page_store.put(f.read())
+        urls.append(URL(f"https://docs.example.com/{page_name(index)}", content_hash=digest))
+    return page_store, urls
+
+
+def report(name: str, pages: int, seconds: float, baseline: float) -> None:
+    print(
+        f"{name:<32} {pages:>6} pages  {seconds:>8.2f}s  "
+        f"{pages / seconds:>8.1f} pages/s  {baseline / seconds:>5.2f}x"
+    )
+
+
+def report_parse_time(site: str, num_pages: int) -> None:
+    """Print the time per page of every extractor."""
+    pages = []
+    for index in range(num_pages):
+        with open(os.path.join(site, page_name(index))) as f:
+            pages.append(f.read())
+    timings = {}
+    for extractor in EXTRACTORS:
+        start = time.perf_counter()
+        for html in pages:
+            parse_html(html, extractor)
+        timings[extractor] = (time.perf_counter() - start) / num_pages
+    for extractor, seconds in timings.items():
+        print(
+            f"{extractor + ' extractor':<32} {seconds * 1000:>8.2f} ms/page  "
+            f"{timings['unstructured'] / seconds:>5.2f}x"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--workers", default="1,2,4,8", help="comma-separated process counts")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--extractor", default="auto", choices=EXTRACTORS)
+    args = parser.parse_args()
+
+    site = build_site(args.pages)
+    report_parse_time(site, args.pages)
+
+    page_store, urls = store_site(site, args.pages)
+    start = time.perf_counter()
+    documents = load_urls(urls, page_store, args.extractor)
+    baseline = time.perf_counter() - start
+    report("load_urls()", len(documents), baseline, baseline)
+
+    for workers in [int(w) for w in args.workers.split(",")]:
+        page_store, urls = store_site(site, args.pages)
+        loader = ParallelPageLoader(
+            max_workers=workers,
+            timeout=args.timeout,
+            page_store=page_store,
+            extractor=args.extractor,
+        )
+        start = time.perf_counter()
+        parallel_documents = loader.load(urls)
+        seconds = time.perf_counter() - start
+        # the same documents, in the same order
+        assert [d.page_content for d in parallel_documents] == [
+            d.page_content for d in documents
+        ]
+        report(f"ParallelPageLoader({workers} procs)", len(parallel_documents), seconds, baseline)
+
+
+if __name__ == "__main__":
+    main()
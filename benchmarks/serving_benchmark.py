@@ -0,0 +1,166 @@
+"""Load tests the async serving path of a deployed agent with a fake LLM.
+
+The agent is a DeployedAgent over a few versioned vector store tools with
+local hashing embeddings, deployed like Agent.deploy does, with its tool
+registry and answer cache, and its LLM answers after a fixed delay. So the
+measurements cover the answer cache, the agent loop, the vector searches
+and the concurrency limit of the AgentService without any network access.
+Clients send requests back to back and the service reports throughput,
+p50/p99 latency and how many requests it rejected. The same requests run
+one at a time through the synchronous agent for comparison, and a few
+more are streamed to compare the time to the first token of the answer
+with the time to the whole answer. The questions repeat, so with the
+answer cache most of them are answered from it; pass --no-answer-cache to
+measure the agent loop alone. Run from the root of the repository:
+
+    python benchmarks/serving_benchmark.py --requests 2000 --clients 64
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "zenml_code")]
+
+# the steps are imported through the pipeline, like the agent does
+import zenml_code.zenml_utils  # noqa: E402,F401
+from agent.agent import Agent  # noqa: E402
+from agent.answer_cache import AnswerCache  # noqa: E402
+from agent.deployed_agent import DeployedAgent  # noqa: E402
+from agent.tool_registry import ToolRegistry  # noqa: E402
+from embeddings.hashing_embeddings import HashingEmbeddings  # noqa: E402
+from llm.fake_llm import FakeChatModel  # noqa: E402
+from serving.agent_service import AgentService, Overloaded  # noqa: E402
+from tools.versioned_vector_store import VersionedVectorStoreTool  # noqa: E402
+from vector_store.id_map_vector_store import IDMapVectorStore  # noqa: E402
+
+WORDS = (
+    "step pipeline run artifact stack component orchestrator cache model "
+    "deploy secret service connector experiment tracker materializer"
+).split()
+
+
+def make_agent(
+    versions: int, chunks: int, latency: float, cache_answers: bool
+) -> DeployedAgent:
+    """Returns a deployed agent with one tool per version and a fake LLM."""
+    rng = random.Random(0)
+    llm = FakeChatModel(latency=latency)
+    tools = []
+    for version in range(versions):
+        store = IDMapVectorStore(HashingEmbeddings())
+        store.add_texts(
+            [" ".join(rng.choice(WORDS) for _ in range(100)) for _ in range(chunks)]
+        )
+        tools.append(
+            VersionedVectorStoreTool(
+                name=f"zenml-0.{version}",
+                description=f"Docs of version 0.{version}.",
+                version=f"0.{version}",
+                vectorstore=store,
+                llm=llm,
+            )
+        )
+    # what Agent.deploy builds from the outputs of the pipeline
+    return DeployedAgent(
+        Agent("serving-benchmark", llm=llm),
+        version=1,
+        answer_cache=AnswerCache(HashingEmbeddings()) if cache_answers else None,
+        tool_registry=ToolRegistry(tools),
+    )
+
+
+def report(name: str, count: int, seconds: float, latencies: np.ndarray) -> None:
+    print(
+        f"{name:<12} {count / seconds:8.1f} req/s  "
+        f"p50 {np.percentile(latencies, 50) * 1000:8.1f} ms  "
+        f"p99 {np.percentile(latencies, 99) * 1000:8.1f} ms"
+    )
+
+
+async def load_test(service: AgentService, requests: int, clients: int) -> None:
+    """Send requests from concurrent clients and report the results."""
+    questions = iter(range(requests))
+    latencies, rejected = [], 0
+
+    async def client() -> None:
+        nonlocal rejected
+        for i in questions:
+            start = time.perf_counter()
+            try:
+                await service.ask(f"How do I use the {WORDS[i % len(WORDS)]}?")
+            except Overloaded:
+                rejected += 1
+                # back off like a client honouring Retry-After would
+                await asyncio.sleep(0.05)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    report("async", len(latencies), time.perf_counter() - start, np.array(latencies))
+    print(f"{'':<12} {rejected} rejected, max concurrency {service.max_concurrency}")
+
+
+async def stream_test(service: AgentService, requests: int) -> None:
+    """Stream answers one at a time and report the time to their first token."""
+    first_tokens, answers = [], []
+    for i in range(requests):
+        start = time.perf_counter()
+        first_token = None
+        async for event in service.stream(f"How do I use the {WORDS[i % len(WORDS)]}?"):
+            if event.type == "token" and first_token is None:
+                first_token = time.perf_counter() - start
+        first_tokens.append(first_token)
+        answers.append(time.perf_counter() - start)
+    print(
+        f"{'stream':<12} first token p50 {np.percentile(first_tokens, 50) * 1000:8.1f} ms  "
+        f"answer p50 {np.percentile(answers, 50) * 1000:8.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--max-waiting", type=int, default=64)
+    parser.add_argument("--versions", type=int, default=4)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--sync-requests", type=int, default=20)
+    parser.add_argument("--stream-requests", type=int, default=20)
+    parser.add_argument("--no-answer-cache", action="store_true")
+    args = parser.parse_args()
+
+    agent = make_agent(
+        args.versions, args.chunks, args.latency, not args.no_answer_cache
+    )
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.sync_requests):
+        request_start = time.perf_counter()
+        agent({"input": f"How do I use the {WORDS[i % len(WORDS)]}?", "chat_history": []})
+        latencies.append(time.perf_counter() - request_start)
+    report("sync", args.sync_requests, time.perf_counter() - start, np.array(latencies))
+
+    service = AgentService(
+        agent, max_concurrency=args.max_concurrency, max_waiting=args.max_waiting
+    )
+    asyncio.run(load_test(service, args.requests, args.clients))
+    if agent.answer_cache is not None:
+        print(f"{'':<12} answer cache {agent.answer_cache.stats()}")
+
+    agent.agent.llm_chain.llm.streaming = True
+    asyncio.run(stream_test(service, args.stream_requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+from typing import List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from embeddings.embedding_cache import EmbeddingCache
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that only send texts missing from an EmbeddingCache to the provider."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache: Optional[EmbeddingCache] = None,
+        model: Optional[str] = None,
+    ):
+        """Create a CachedEmbeddings object.
+
+        Args:
+            embeddings: The embeddings to compute cache misses with.
+            cache: The cache to use. Defaults to the default EmbeddingCache.
+            model: The name the vectors are cached under. Defaults to the
+                model of the embeddings, or their class name.
+        """
+        self.embeddings = embeddings
+        self.cache = cache or EmbeddingCache()
+        self.model = model or getattr(embeddings, "model", None) or type(embeddings).__name__
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed search docs, computing only the ones that are not cached."""
+        vectors = self.cache.get_many(self.model, texts)
+        # deduplicate the misses so repeated chunks are only embedded once
+        misses = list(dict.fromkeys(text for text, v in zip(texts, vectors) if v is None))
+        if misses:
+            computed = np.asarray(self.embeddings.embed_documents(misses), dtype=np.float32)
+            self.cache.put_many(self.model, misses, computed)
+            by_text = dict(zip(misses, computed))
+            vectors = [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+        return [v.tolist() for v in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text.
+
+        Queries are rarely repeated verbatim, so they bypass the cache.
+        """
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,236 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from knowledge.http_cache import CACHE_DIR
+
+# the matrix of a model starts with room for this many vectors and doubles
+# whenever it fills up, until it reaches the size cap
+INITIAL_CAPACITY = 1024
+
+
+def text_hash(text: str) -> str:
+    """Returns the hash a text is cached under."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """A persistent cache of embeddings keyed by model and text hash.
+
+    The vectors of each model live in a memory-mapped float32 matrix on
+    disk, one row per cached text. An SQLite table maps (model, text hash)
+    to the row of the vector and tracks when it was last used. Once a model
+    holds `max_entries` vectors, the least recently used rows are evicted
+    and reused for new vectors.
+
+    The cache is keyed by content only, so it is shared across doc
+    versions and projects: a chunk that shows up unchanged in the next
+    version of the docs is never embedded twice.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 2_000_000):
+        """Create an EmbeddingCache object.
+
+        Args:
+            path: The directory holding the cache. Defaults to a directory
+                under CACHE_DIR.
+            max_entries: The maximum number of vectors cached per model.
+        """
+        self.path = path or os.path.join(CACHE_DIR, "embeddings")
+        self.max_entries = max_entries
+        self._connect()
+
+    def _connect(self) -> None:
+        """Open the index and create the schema if needed."""
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._matrices: Dict[str, np.memmap] = {}
+        # transactions are explicit, see _transaction
+        self._conn = sqlite3.connect(
+            os.path.join(self.path, "index.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS models ("
+            "model TEXT PRIMARY KEY, dim INTEGER, capacity INTEGER, next_slot INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "model TEXT, text_hash TEXT, slot INTEGER, last_used REAL, "
+            "PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (model, last_used)"
+        )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Run a block in a transaction that takes the write lock of the database.
+
+        The lock is taken before the first read, so that processes sharing
+        the cache never allocate the same rows. Must be called with the
+        lock held.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def __getstate__(self) -> Dict[str, object]:
+        # only the reference to the cache is pickled
+        return {"path": self.path, "max_entries": self.max_entries}
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.path = state["path"]
+        self.max_entries = state["max_entries"]
+        self._connect()
+
+    def _matrix_path(self, model: str) -> str:
+        """Returns the path of the matrix file of a model."""
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        return os.path.join(self.path, f"{slug}-{text_hash(model)[:8]}.f32")
+
+    def _matrix(self, model: str, dim: int, capacity: int) -> np.memmap:
+        """Map the matrix of a model, growing the file to `capacity` rows.
+
+        Must be called with the lock held.
+        """
+        matrix = self._matrices.get(model)
+        if matrix is not None and matrix.shape[0] == capacity:
+            return matrix
+        if matrix is not None:
+            matrix.flush()
+        path = self._matrix_path(model)
+        with open(path, "ab") as f:
+            f.truncate(capacity * dim * 4)
+        matrix = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+        self._matrices[model] = matrix
+        return matrix
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Look up the vectors of a batch of texts.
+
+        Args:
+            model: The name of the embedding model.
+            texts: The texts to look up.
+
+        Returns:
+            The vector of each text, or None for texts that are not cached.
+        """
+        hashes = [text_hash(text) for text in texts]
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT dim, capacity FROM models WHERE model = ?", (model,)
+            ).fetchone()
+            if row is None:
+                return [None] * len(texts)
+            matrix = self._matrix(model, *row)
+
+            slots: Dict[str, int] = {}
+            # sqlite limits the number of parameters of a query
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start : start + 500]
+                slots.update(
+                    self._conn.execute(
+                        "SELECT text_hash, slot FROM entries WHERE model = ? "
+                        f"AND text_hash IN ({','.join('?' * len(batch))})",
+                        (model, *batch),
+                    ).fetchall()
+                )
+            with self._transaction():
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    ((time.time(), model, h) for h in slots),
+                )
+            return [
+                np.array(matrix[slots[h]]) if h in slots else None for h in hashes
+            ]
+
+    def _allocate(self, model: str, dim: int, count: int) -> Tuple[List[int], np.memmap]:
+        """Allocate rows for new vectors, evicting old ones if needed.
+
+        Must be called with the lock held and inside _transaction.
+        """
+        row = self._conn.execute(
+            "SELECT dim, capacity, next_slot FROM models WHERE model = ?", (model,)
+        ).fetchone()
+        if row is None:
+            row = (dim, min(INITIAL_CAPACITY, self.max_entries), 0)
+            self._conn.execute("INSERT INTO models VALUES (?, ?, ?, ?)", (model, *row))
+        model_dim, capacity, next_slot = row
+        if model_dim != dim:
+            raise ValueError(
+                f"Vectors of model {model} have {model_dim} dimensions, got {dim}."
+            )
+
+        while next_slot + count > capacity and capacity < self.max_entries:
+            capacity = min(capacity * 2, self.max_entries)
+        fresh = min(count, capacity - next_slot)
+        slots = list(range(next_slot, next_slot + fresh))
+
+        if fresh < count:
+            # the matrix is full, reuse the rows of the least recently used
+            evicted = self._conn.execute(
+                "SELECT text_hash, slot FROM entries WHERE model = ? "
+                "ORDER BY last_used LIMIT ?",
+                (model, count - fresh),
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM entries WHERE model = ? AND text_hash = ?",
+                ((model, h) for h, _ in evicted),
+            )
+            slots.extend(slot for _, slot in evicted)
+
+        self._conn.execute(
+            "UPDATE models SET capacity = ?, next_slot = ? WHERE model = ?",
+            (capacity, next_slot + fresh, model),
+        )
+        return slots, self._matrix(model, dim, capacity)
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: np.ndarray) -> None:
+        """Cache the vectors of a batch of texts.
+
+        Args:
+            model: The name of the embedding model.
+            texts: The texts the vectors were computed from.
+            vectors: A matrix with one vector per text.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # texts that are already cached, or repeated in the batch, only need
+        # to be stored once
+        unique = {text_hash(text): i for i, text in enumerate(texts)}
+        with self._lock, self._transaction():
+            for start in range(0, len(unique), 500):
+                batch = list(unique)[start : start + 500]
+                for (h,) in self._conn.execute(
+                    "SELECT text_hash FROM entries WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    (model, *batch),
+                ).fetchall():
+                    del unique[h]
+            if not unique:
+                return
+
+            # never evict more than the cache can hold at once
+            items = list(unique.items())[-self.max_entries :]
+            slots, matrix = self._allocate(model, vectors.shape[1], len(items))
+            now = time.time()
+            for slot, (_, i) in zip(slots, items):
+                matrix[slot] = vectors[i]
+            matrix.flush()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                ((model, h, slot, now) for slot, (h, _) in zip(slots, items)),
+            )
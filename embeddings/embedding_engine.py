@@ -0,0 +1,246 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import getLogger
+from typing import Callable, Deque, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+logger = getLogger(__name__)
+
+
+def _default_token_counter() -> Callable[[str], int]:
+    """Returns a token counter, using tiktoken if it is installed."""
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        # tiktoken is missing or can't download its encoding while offline,
+        # assume roughly four characters per token for English text
+        return lambda text: len(text) // 4 + 1
+
+
+class RateLimiter:
+    """A token bucket limiting requests and tokens per minute."""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ):
+        """Create a RateLimiter object.
+
+        Args:
+            requests_per_minute: The maximum number of requests per minute.
+                If None, requests are not limited.
+            tokens_per_minute: The maximum number of tokens per minute.
+                If None, tokens are not limited.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        """Add the budget accumulated since the last refill."""
+        now = time.monotonic()
+        elapsed = (now - self._updated) / 60
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(
+                self.requests_per_minute,
+                self._requests + elapsed * self.requests_per_minute,
+            )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute
+            )
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request with the given number of tokens may be sent.
+
+        Args:
+            tokens: The number of tokens in the request.
+        """
+        # a request larger than the whole budget would wait forever
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                requests_ok = not self.requests_per_minute or self._requests >= 1
+                tokens_ok = not self.tokens_per_minute or self._tokens >= tokens
+                if requests_ok and tokens_ok:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = 0.0
+                if not requests_ok:
+                    wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+                if not tokens_ok:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+            time.sleep(wait)
+
+
+class EmbeddingEngine:
+    """Embeds large numbers of texts in parallel, token-budgeted batches.
+
+    Texts are packed, in order, into batches that stay under a token budget
+    and a maximum number of texts. Up to `max_concurrency` batches are sent
+    to the embeddings provider at once, under an optional rate limit. A
+    failing batch is retried on its own with exponential backoff, and if it
+    keeps failing it is split in halves so that a single bad text can't fail
+    its neighbours. Vectors are yielded as NumPy blocks, one per batch, in
+    the order of the texts, so that callers can write them to an index
+    without holding all of them in memory.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_tokens: int = 8000,
+        max_batch_size: int = 512,
+        max_concurrency: int = 4,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_retries: int = 3,
+        backoff_factor: float = 1.0,
+        token_counter: Optional[Callable[[str], int]] = None,
+    ):
+        """Create an EmbeddingEngine object.
+
+        Args:
+            embeddings: The embeddings provider.
+            max_batch_tokens: The maximum number of tokens in a batch.
+            max_batch_size: The maximum number of texts in a batch.
+            max_concurrency: The maximum number of batches in flight.
+            rate_limiter: The rate limit of the provider, if any.
+            max_retries: How many times a failed batch is retried before
+                it is split.
+            backoff_factor: The base of the exponential backoff between
+                retries, in seconds.
+            token_counter: A callable that counts the tokens of a text.
+                Defaults to tiktoken, or an estimate if it isn't installed.
+        """
+        self.embeddings = embeddings
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.token_counter = token_counter or _default_token_counter()
+
+    def batches(self, texts: Sequence[str]) -> Iterator[Tuple[int, int, int]]:
+        """Pack consecutive texts into token-budgeted batches.
+
+        A text that is larger than the budget on its own gets a batch of
+        its own.
+
+        Args:
+            texts: The texts to pack.
+
+        Returns:
+            An iterator of (start, end, tokens) tuples, where the batch holds
+            texts[start:end].
+        """
+        start, tokens = 0, 0
+        for i, text in enumerate(texts):
+            count = self.token_counter(text)
+            if i > start and (
+                tokens + count > self.max_batch_tokens or i - start >= self.max_batch_size
+            ):
+                yield start, i, tokens
+                start, tokens = i, 0
+            tokens += count
+        if start < len(texts):
+            yield start, len(texts), tokens
+
+    def _embed_batch(self, texts: Sequence[str], tokens: int) -> np.ndarray:
+        """Embed a batch, retrying it on failure and splitting it as a last resort.
+
+        Args:
+            texts: The texts of the batch.
+            tokens: The number of tokens in the batch.
+
+        Returns:
+            A matrix with one vector per text.
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(tokens)
+            try:
+                return np.asarray(
+                    self.embeddings.embed_documents(list(texts)), dtype=np.float32
+                )
+            except Exception as e:
+                if attempt == self.max_retries:
+                    if len(texts) == 1:
+                        raise
+                    logger.warning(
+                        f"Embedding a batch of {len(texts)} texts failed ({e}), "
+                        "splitting it."
+                    )
+                    break
+                logger.debug(f"Embedding a batch failed ({e}), retrying.")
+                time.sleep(self.backoff_factor * 2**attempt)
+
+        middle = len(texts) // 2
+        return np.vstack(
+            [
+                self._embed_batch(half, sum(self.token_counter(t) for t in half))
+                for half in (texts[:middle], texts[middle:])
+            ]
+        )
+
+    def embed(self, texts: Sequence[str]) -> Iterator[Tuple[int, np.ndarray]]:
+        """Embed texts, streaming the vectors out in blocks.
+
+        Args:
+            texts: The texts to embed.
+
+        Returns:
+            An iterator of (start, vectors) tuples in the order of the texts,
+            where vectors is a float32 matrix holding the vectors of
+            texts[start:start + len(vectors)].
+        """
+        batches = self.batches(texts)
+        in_flight: Deque[Tuple[int, Future]] = deque()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            try:
+                while True:
+                    # keep a bounded number of batches ahead of the consumer
+                    while len(in_flight) < 2 * self.max_concurrency:
+                        batch = next(batches, None)
+                        if batch is None:
+                            break
+                        start, end, tokens = batch
+                        in_flight.append(
+                            (start, executor.submit(self._embed_batch, texts[start:end], tokens))
+                        )
+                    if not in_flight:
+                        return
+                    start, future = in_flight.popleft()
+                    yield start, future.result()
+            finally:
+                for _, future in in_flight:
+                    future.cancel()
+
+    def embed_all(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts into a single matrix.
+
+        Args:
+            texts: The texts to embed.
+
+        Returns:
+            A float32 matrix with one vector per text.
+        """
+        blocks: List[np.ndarray] = [vectors for _, vectors in self.embed(texts)]
+        if not blocks:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(blocks)
@@ -0,0 +1,50 @@
+import hashlib
+import re
+from typing import List
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic local embeddings based on the hashing trick.
+
+    Every word and word bigram of a text is hashed into one of `size`
+    buckets with a hashed sign, and the resulting vector is L2 normalized.
+    The vectors carry enough lexical signal for texts that share words to
+    be close, which makes them a stand-in for a real model when testing the
+    indexing and retrieval machinery, and for measuring its throughput,
+    without network access.
+    """
+
+    def __init__(self, size: int = 256):
+        """Create a HashingEmbeddings object.
+
+        Args:
+            size: The number of dimensions of the vectors.
+        """
+        self.size = size
+        self.model = f"hashing-{size}"
+
+    def _embed(self, text: str) -> np.ndarray:
+        """Embed a single text."""
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vector = np.zeros(self.size, dtype=np.float32)
+        for feature in features:
+            digest = int.from_bytes(
+                hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little"
+            )
+            vector[digest % self.size] += 1.0 if (digest >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed search docs."""
+        return [self._embed(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text."""
+        return self._embed(text).tolist()
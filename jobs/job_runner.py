@@ -0,0 +1,434 @@
+import json
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional
+
+from jobs.progress import JobCancelled, JobContext, set_current_job
+from knowledge.http_cache import CACHE_DIR
+
+logger = getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+# how long a worker waits before claiming a job again after claiming
+# failed, like when another process holds the database, in seconds
+CLAIM_RETRY_SECONDS = 0.5
+MAX_CLAIM_RETRY_SECONDS = 30.0
+
+# the functions jobs run, by kind, see register_job_kind
+_job_kinds: Dict[str, Callable[..., Any]] = {}
+
+
+def register_job_kind(kind: str, function: Callable[..., Any]) -> None:
+    """Register the function jobs of a kind run.
+
+    Jobs are stored with their kind rather than their function, so that a
+    queued job can be run by another process that registered the kind.
+
+    Args:
+        kind: The kind of the jobs.
+        function: The function, called with the keyword arguments of a job.
+    """
+    _job_kinds[kind] = function
+
+
+def _owner() -> str:
+    """Returns the identifier of this process in the job store."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _is_alive(owner: str) -> bool:
+    """Whether the process that owns a job is still running, if it is on this host."""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        # can't tell, assume it is
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+class JobStore:
+    """A persistent queue of jobs with their status and progress.
+
+    Jobs are rows of an SQLite table holding their pickled arguments, so
+    that queued jobs survive restarts and several processes can share the
+    queue. Claiming a job is a single transaction, so each job is run by
+    exactly one worker.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """Create a JobStore object.
+
+        Args:
+            path: The path of the SQLite database. Defaults to a file under
+                CACHE_DIR.
+        """
+        self.path = path or os.path.join(CACHE_DIR, "jobs.sqlite")
+        self._connect()
+
+    def _connect(self) -> None:
+        """Open the database and create the schema if needed."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT, arguments BLOB, status TEXT, "
+            "progress TEXT, error TEXT, cancel_requested INTEGER DEFAULT 0, "
+            "owner TEXT, created_at REAL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at)"
+        )
+
+    def __getstate__(self) -> Dict[str, str]:
+        # only the reference to the database is pickled
+        return {"path": self.path}
+
+    def __setstate__(self, state: Dict[str, str]) -> None:
+        self.path = state["path"]
+        self._connect()
+
+    def add(self, kind: str, arguments: Dict[str, Any]) -> str:
+        """Queue a job and return its id."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, arguments, status, progress, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, pickle.dumps(arguments), QUEUED, "{}", time.time()),
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Mark the oldest queued job as running and return it, or None."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, arguments FROM jobs WHERE status = ? "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, owner = ?, started_at = ? WHERE id = ?",
+                        (RUNNING, _owner(), time.time(), row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"id": row[0], "kind": row[1], "arguments": pickle.loads(row[2])}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the status, progress and timestamps of a job, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, progress, error, cancel_requested, "
+                "created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "progress": json.loads(row[3]),
+            "error": row[4],
+            "cancel_requested": bool(row[5]),
+            "created_at": row[6],
+            "started_at": row[7],
+            "finished_at": row[8],
+        }
+
+    def list(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Returns all jobs, or the jobs with a status, oldest first."""
+        with self._lock:
+            if status is None:
+                rows = self._conn.execute(
+                    "SELECT id FROM jobs ORDER BY created_at"
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (status,)
+                ).fetchall()
+        return [self.get(row[0]) for row in rows]
+
+    def set_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        """Write the progress of a job."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id)
+            )
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        """Mark a job as finished with a status."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def cancel(self, job_id: str) -> None:
+        """Cancel a queued job, or request the cancellation of a running one."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)",
+                (job_id, QUEUED, RUNNING),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+
+    def cancel_requested(self, job_id: str) -> bool:
+        """Whether the cancellation of a job was requested."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def requeue_orphans(self) -> int:
+        """Queue again the running jobs of processes that died, and return how many."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, owner FROM jobs WHERE status = ?", (RUNNING,)
+            ).fetchall()
+        orphans = [job_id for job_id, owner in rows if owner and not _is_alive(owner)]
+        with self._lock:
+            for job_id in orphans:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL WHERE id = ? AND status = ?",
+                    (QUEUED, job_id, RUNNING),
+                )
+        return len(orphans)
+
+
+class JobHandle:
+    """A reference to a job, to follow its progress and cancel it."""
+
+    def __init__(self, job_id: str, store: JobStore):
+        """Create a JobHandle object.
+
+        Args:
+            job_id: The id of the job.
+            store: The store of the job.
+        """
+        self.job_id = job_id
+        self.store = store
+
+    def __repr__(self) -> str:
+        return f"JobHandle({self.job_id}, {self.status})"
+
+    def info(self) -> Dict[str, Any]:
+        """Returns the status, progress, error and timestamps of the job."""
+        info = self.store.get(self.job_id)
+        if info is None:
+            raise KeyError(f"No job with id {self.job_id}.")
+        return info
+
+    @property
+    def status(self) -> str:
+        """One of queued, running, succeeded, failed and cancelled."""
+        return self.info()["status"]
+
+    @property
+    def progress(self) -> Dict[str, Any]:
+        """The progress of the job, like {"stage": "chunks_embedded",
+        "pages_crawled": 120, "chunks_embedded": 800}."""
+        return self.info()["progress"]
+
+    def done(self) -> bool:
+        """Whether the job has finished, whatever its status."""
+        return self.status in FINISHED
+
+    def cancel(self) -> None:
+        """Cancel the job.
+
+        A queued job is cancelled right away. A running job stops the next
+        time it reports progress.
+        """
+        self.store.cancel(self.job_id)
+
+    def wait(self, timeout: Optional[float] = None, poll_interval: float = 0.5) -> str:
+        """Wait for the job to finish and return its status.
+
+        Args:
+            timeout: The maximum time to wait, in seconds. If None, wait
+                until the job finishes.
+            poll_interval: How often the status is checked, in seconds.
+
+        Raises:
+            TimeoutError: If the job didn't finish in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = self.status
+            if status in FINISHED:
+                return status
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Job {self.job_id} is still {status}.")
+            time.sleep(poll_interval)
+
+
+class JobRunner:
+    """Runs the jobs of a JobStore on a pool of worker threads.
+
+    Workers claim the oldest queued job, run the function registered for
+    its kind with the job as the current job, so that the code it runs can
+    report progress and be cancelled, and record how it finished. Jobs that
+    were running in a process that died are queued again on start.
+
+    Pipeline jobs, like "educate", are serialized by the default single
+    worker: ZenML keeps the context of the running step in a process-wide
+    singleton, so two pipelines running on threads of the same process
+    would mix up their steps.
+    """
+
+    def __init__(self, store: Optional[JobStore] = None, max_workers: int = 1):
+        """Create a JobRunner object. The workers start with the first job.
+
+        Args:
+            store: The store of the jobs. Defaults to the default JobStore.
+            max_workers: The number of jobs run at once. Only raise it if
+                no registered job kind runs a pipeline.
+        """
+        self.store = store or JobStore()
+        self.max_workers = max_workers
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._stopped = False
+
+    def start(self) -> None:
+        """Start the workers, if they haven't been started."""
+        with self._condition:
+            if self._workers:
+                return
+            self._stopped = False
+            requeued = self.store.requeue_orphans()
+            if requeued:
+                logger.info(f"Queued {requeued} jobs of stopped processes again.")
+            for i in range(self.max_workers):
+                worker = threading.Thread(
+                    target=self._work, name=f"job-worker-{i}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def stop(self) -> None:
+        """Stop the workers once they finish their current job."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.join()
+
+    def submit(self, kind: str, **arguments: Any) -> JobHandle:
+        """Queue a job and return its handle right away.
+
+        Args:
+            kind: The kind of the job, see register_job_kind.
+            arguments: The keyword arguments of the function of the kind.
+                They must be picklable.
+        """
+        if kind not in _job_kinds:
+            raise ValueError(f"Unknown job kind {kind}, register it first.")
+        job_id = self.store.add(kind, arguments)
+        self.start()
+        with self._condition:
+            self._condition.notify()
+        return JobHandle(job_id, self.store)
+
+    def get(self, job_id: str) -> JobHandle:
+        """Returns the handle of a job."""
+        return JobHandle(job_id, self.store)
+
+    def _work(self) -> None:
+        """Run jobs until stopped."""
+        retry_seconds = CLAIM_RETRY_SECONDS
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+            try:
+                job = self.store.claim()
+            except Exception:
+                logger.exception(
+                    f"Could not claim a job, retrying in {retry_seconds}s."
+                )
+                with self._condition:
+                    self._condition.wait(timeout=retry_seconds)
+                retry_seconds = min(2 * retry_seconds, MAX_CLAIM_RETRY_SECONDS)
+                continue
+            retry_seconds = CLAIM_RETRY_SECONDS
+            if job is None:
+                with self._condition:
+                    # jobs may also be queued by other processes
+                    self._condition.wait(timeout=1.0)
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        """Run a claimed job and record how it finished."""
+        job_id = job["id"]
+        context = JobContext(job_id, self.store.set_progress, self.store.cancel_requested)
+        set_current_job(context)
+        try:
+            if self.store.cancel_requested(job_id):
+                raise JobCancelled(f"Job {job_id} was cancelled.")
+            _job_kinds[job["kind"]](**job["arguments"])
+            context.flush()
+        except JobCancelled:
+            self.store.finish(job_id, CANCELLED)
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed.")
+            self.store.set_progress(job_id, context.progress)
+            self.store.finish(job_id, FAILED, error=repr(e))
+        else:
+            self.store.finish(job_id, SUCCEEDED)
+        finally:
+            set_current_job(None)
+
+
+_job_runner: Optional[JobRunner] = None
+_job_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """Returns the job runner of the process, creating it if needed."""
+    global _job_runner
+    with _job_runner_lock:
+        if _job_runner is None:
+            _job_runner = JobRunner()
+        return _job_runner
+
+
+def set_job_runner(runner: JobRunner) -> None:
+    """Set the job runner of the process, for example to change its number of workers."""
+    global _job_runner
+    with _job_runner_lock:
+        _job_runner = runner
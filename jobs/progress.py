@@ -0,0 +1,99 @@
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+# how often the progress of a job is written to the job store, in seconds
+FLUSH_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    """Raised inside a job whose cancellation was requested."""
+
+
+class JobContext:
+    """The progress of the job running in the current context.
+
+    Code running as part of a job, like the steps of the index creation
+    pipeline, reports progress with `advance` and is interrupted by it once
+    the job is cancelled. The counters are written to the job store at
+    most every FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        flush: Callable[[str, Dict[str, object]], None],
+        cancelled: Callable[[str], bool],
+    ):
+        """Create a JobContext object.
+
+        Args:
+            job_id: The id of the job.
+            flush: Writes the progress of a job.
+            cancelled: Whether the cancellation of a job was requested.
+        """
+        self.job_id = job_id
+        self._flush = flush
+        self._cancelled = cancelled
+        self._lock = threading.Lock()
+        self.progress: Dict[str, object] = {"stage": None}
+        self._flushed_at = 0.0
+
+    def advance(self, stage: str, amount: int = 1) -> None:
+        """Count progress in a stage, flushing it if it is due.
+
+        Raises:
+            JobCancelled: If the job was cancelled.
+        """
+        with self._lock:
+            self.progress["stage"] = stage
+            self.progress[stage] = int(self.progress.get(stage, 0)) + amount
+            due = time.monotonic() - self._flushed_at >= FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the progress of the job.
+
+        Raises:
+            JobCancelled: If the job was cancelled.
+        """
+        with self._lock:
+            progress = dict(self.progress)
+            self._flushed_at = time.monotonic()
+        self._flush(self.job_id, progress)
+        if self._cancelled(self.job_id):
+            raise JobCancelled(f"Job {self.job_id} was cancelled.")
+
+
+_current_job: ContextVar[Optional[JobContext]] = ContextVar("current_job", default=None)
+
+
+def current_job() -> Optional[JobContext]:
+    """Returns the job running in the current context, if any."""
+    return _current_job.get()
+
+
+def set_current_job(job: Optional[JobContext]) -> None:
+    """Set the job running in the current context."""
+    _current_job.set(job)
+
+
+def advance(stage: str, amount: int = 1) -> None:
+    """Report progress in a stage of the current job, if there is one.
+
+    Stages are named after what they count, like "pages_crawled" or
+    "chunks_embedded". Progress is only reported for jobs running in the
+    same thread, like pipelines run by the local orchestrator.
+
+    Args:
+        stage: The stage.
+        amount: How much the stage progressed.
+
+    Raises:
+        JobCancelled: If the current job was cancelled.
+    """
+    job = _current_job.get()
+    if job is not None:
+        job.advance(stage, amount)
@@ -0,0 +1,184 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# all on-disk state of the framework lives under this directory
+CACHE_DIR = os.environ.get(
+    "AGENT_FRAMEWORK_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "agent-framework"),
+)
+
+
+class CacheEntry:
+    """A cached response body along with its validators."""
+
+    def __init__(
+        self,
+        key: str,
+        headers: Dict[str, str],
+        body: bytes,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        annotations: Dict[str, Any],
+    ):
+        """Create a CacheEntry object.
+
+        Args:
+            key: The cache key of the entry.
+            headers: The response headers, with lowercase names.
+            body: The response body.
+            etag: The ETag validator, if the server sent one.
+            last_modified: The Last-Modified validator, if the server sent one.
+            annotations: Data derived from the body by its consumers.
+        """
+        self.key = key
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.annotations = annotations
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Returns the headers that revalidate this entry with the server."""
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HTTPCache:
+    """A persistent, size-bounded cache of HTTP responses.
+
+    Only responses that carry an ETag or a Last-Modified header are cached,
+    since those are the only ones that can be cheaply revalidated. When the
+    server answers a revalidation with 304 Not Modified, the cached body is
+    reused along with any annotations that consumers attached to it, such as
+    the links extracted by the crawler or the text parsed by the loader. That
+    way an unchanged page costs neither a download nor a parse.
+
+    Once the total size of the cached bodies grows past `max_bytes`, the
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = 2 * 1024**3):
+        """Create an HTTPCache object.
+
+        Args:
+            path: The path of the SQLite database backing the cache. Defaults
+                to a file under CACHE_DIR.
+            max_bytes: The maximum total size of the cached bodies.
+        """
+        self.path = path or os.path.join(CACHE_DIR, "http_cache.sqlite")
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, headers TEXT, body BLOB, size INTEGER, "
+            "etag TEXT, last_modified TEXT, annotations TEXT, last_access REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+        )
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def lookup(self, key: str) -> Optional[CacheEntry]:
+        """Get a cached entry and mark it as recently used.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The entry, or None if the key is not cached.
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT headers, body, etag, last_modified, annotations "
+                "FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        headers, body, etag, last_modified, annotations = row
+        return CacheEntry(
+            key, json.loads(headers), body, etag, last_modified, json.loads(annotations)
+        )
+
+    def store(self, key: str, headers: Dict[str, str], body: bytes) -> bool:
+        """Cache a response body, dropping any annotations of the old body.
+
+        Args:
+            key: The cache key.
+            headers: The response headers, with lowercase names.
+            body: The response body.
+
+        Returns:
+            True if the response was cached, False if it has no validators
+            or is too large to cache.
+        """
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        if (etag is None and last_modified is None) or len(body) > self.max_bytes:
+            return False
+
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(headers), body, len(body), etag, last_modified, "{}", time.time()),
+            )
+            self._total_bytes += len(body) - (row[0] if row else 0)
+            self._evict()
+        return True
+
+    def annotate(self, key: str, name: str, value: Any) -> None:
+        """Attach data derived from a cached body to its entry.
+
+        Args:
+            key: The cache key.
+            name: The name of the annotation.
+            value: A JSON-serializable value.
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT annotations FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return
+            annotations = json.loads(row[0])
+            annotations[name] = value
+            self._conn.execute(
+                "UPDATE entries SET annotations = ? WHERE key = ?",
+                (json.dumps(annotations), key),
+            )
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache fits its budget.
+
+        Must be called with the lock held and inside a transaction.
+        """
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
@@ -0,0 +1,368 @@
+import json
+import threading
+import time
+from logging import getLogger
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from knowledge.http_cache import HTTPCache
+
+logger = getLogger(__name__)
+
+# status codes that are worth retrying since they are usually transient
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class HTTPClientError(Exception):
+    """Raised when a request fails after all retries."""
+
+
+class ResponseTooLargeError(HTTPClientError):
+    """Raised when a response body exceeds the configured size cap."""
+
+    def __init__(self, message: str, status_code: int):
+        """Create a ResponseTooLargeError object.
+
+        Args:
+            message: The error message.
+            status_code: The HTTP status code of the response, which was
+                received before its body was dropped.
+        """
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class HTTPResponse:
+    """A fully read response, independent of the backend that fetched it."""
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int,
+        headers: Dict[str, str],
+        content: bytes,
+        from_cache: bool = False,
+        cache_key: Optional[str] = None,
+        annotations: Optional[Dict[str, Any]] = None,
+    ):
+        """Create an HTTPResponse object.
+
+        Args:
+            url: The final URL of the response, after redirects.
+            status_code: The HTTP status code.
+            headers: The response headers, with lowercase names.
+            content: The body of the response.
+            from_cache: Whether the body was served from the cache after the
+                server confirmed that it has not changed.
+            cache_key: The key of the response in the cache, if it is cached.
+            annotations: Data derived from the body by earlier consumers, if
+                the body was served from the cache.
+        """
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+        self.cache_key = cache_key
+        self.annotations = annotations or {}
+
+    def raise_for_status(self) -> None:
+        """Raise an HTTPClientError if the status code is not a 2xx one."""
+        if not 200 <= self.status_code < 300:
+            raise HTTPClientError(f"GET {self.url} returned {self.status_code}.")
+
+    @property
+    def charset(self) -> Optional[str]:
+        """The charset declared by the server in the Content-Type, if any."""
+        content_type = self.headers.get("content-type", "")
+        for param in content_type.split(";")[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "charset" and value:
+                return value.strip('"')
+        return None
+
+    @property
+    def encoding(self) -> str:
+        """The charset declared by the server, defaulting to UTF-8."""
+        return self.charset or "utf-8"
+
+    @property
+    def text(self) -> str:
+        """The body of the response decoded as text."""
+        try:
+            return self.content.decode(self.encoding, errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+
+class HTTPClient:
+    """A pooled HTTP client shared by all network I/O of the framework.
+
+    Connections are kept alive and reused across requests, so crawling a
+    site pays for the TCP and TLS handshakes once per host instead of once
+    per page. If `httpx` is installed with HTTP/2 support, it is used as the
+    backend so that requests to a host are multiplexed over one connection.
+    Otherwise, the client falls back to a `requests` session.
+
+    If an HTTPCache is configured, cached responses are revalidated with
+    conditional requests instead of being downloaded again.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        max_response_bytes: int = 10 * 1024 * 1024,
+        pool_maxsize: int = 32,
+        http2: bool = True,
+        headers: Optional[Dict[str, str]] = None,
+        cache: Optional[HTTPCache] = None,
+    ):
+        """Create an HTTPClient object.
+
+        Args:
+            connect_timeout: Seconds to wait for a connection to be established.
+            read_timeout: Seconds to wait between bytes of the response.
+            max_retries: How many times a failed request is retried.
+            backoff_factor: The base of the exponential backoff between
+                retries, in seconds.
+            max_response_bytes: The largest response body that is accepted.
+            pool_maxsize: The maximum number of connections kept per host.
+            http2: Whether to use HTTP/2 if it is available.
+            headers: Headers sent with every request.
+            cache: The cache to revalidate responses against, if any.
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_response_bytes = max_response_bytes
+        self.headers = headers or {}
+        self.cache = cache
+        self._httpx = None
+        self._session = None
+
+        if http2:
+            try:
+                import h2  # noqa: F401
+                import httpx
+
+                self._httpx = httpx.Client(
+                    http2=True,
+                    follow_redirects=True,
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                    limits=httpx.Limits(
+                        max_connections=pool_maxsize,
+                        max_keepalive_connections=pool_maxsize,
+                    ),
+                    headers=self.headers,
+                )
+            except ImportError:
+                logger.debug("httpx[http2] is not installed, falling back to HTTP/1.1.")
+
+        if self._httpx is None:
+            self._session = requests.Session()
+            self._session.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+
+    def _read_capped(self, url: str, status_code: int, chunks: Iterator[bytes]) -> bytes:
+        """Read a streamed body, failing once it grows past the size cap.
+
+        Args:
+            url: The URL the body belongs to, for the error message.
+            status_code: The status code of the response.
+            chunks: The chunks of the body.
+
+        Returns:
+            The full body.
+        """
+        body = bytearray()
+        for chunk in chunks:
+            body += chunk
+            if len(body) > self.max_response_bytes:
+                raise ResponseTooLargeError(
+                    f"Response from {url} exceeds {self.max_response_bytes} bytes.",
+                    status_code,
+                )
+        return bytes(body)
+
+    def _check_length(self, url: str, status_code: int, headers: Dict[str, str]) -> None:
+        """Fail early if the declared length of a body is past the size cap.
+
+        Args:
+            url: The URL the body belongs to, for the error message.
+            status_code: The status code of the response.
+            headers: The response headers, with lowercase names.
+        """
+        length = headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_response_bytes:
+            raise ResponseTooLargeError(
+                f"Response from {url} declares {length} bytes, more than "
+                f"{self.max_response_bytes}.",
+                status_code,
+            )
+
+    def _send(self, url: str, headers: Dict[str, str]) -> HTTPResponse:
+        """Perform a single GET request on the configured backend.
+
+        Args:
+            url: The URL to fetch.
+            headers: Extra headers for this request.
+
+        Returns:
+            The response.
+        """
+        if self._httpx is not None:
+            with self._httpx.stream("GET", url, headers=headers) as response:
+                response_headers = {k.lower(): v for k, v in response.headers.items()}
+                self._check_length(url, response.status_code, response_headers)
+                content = self._read_capped(url, response.status_code, response.iter_bytes())
+                return HTTPResponse(
+                    str(response.url), response.status_code, response_headers, content
+                )
+
+        with self._session.get(
+            url,
+            headers=headers,
+            stream=True,
+            timeout=(self.connect_timeout, self.read_timeout),
+        ) as response:
+            response_headers = {k.lower(): v for k, v in response.headers.items()}
+            self._check_length(url, response.status_code, response_headers)
+            content = self._read_capped(
+                url, response.status_code, response.iter_content(chunk_size=65536)
+            )
+            return HTTPResponse(response.url, response.status_code, response_headers, content)
+
+    def _send_with_retries(self, url: str, headers: Dict[str, str]) -> HTTPResponse:
+        """Perform a GET request, retrying transient failures with exponential backoff.
+
+        Args:
+            url: The URL to fetch.
+            headers: Extra headers for this request.
+
+        Returns:
+            The response. Error statuses that are not retried, or that are
+            still returned after the last retry, are returned as is.
+
+        Raises:
+            HTTPClientError: If no response could be obtained.
+        """
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self._send(url, headers)
+            except ResponseTooLargeError:
+                raise
+            except Exception as e:
+                if last_attempt:
+                    raise HTTPClientError(f"GET {url} failed: {e}") from e
+                logger.debug(f"GET {url} failed ({e}), retrying.")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                    return response
+                logger.debug(f"GET {url} returned {response.status_code}, retrying.")
+            time.sleep(self.backoff_factor * 2**attempt)
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> HTTPResponse:
+        """Fetch a URL, revalidating it against the cache if it is cached.
+
+        Args:
+            url: The URL to fetch.
+            headers: Extra headers for this request.
+
+        Returns:
+            The response. A 304 reply to a revalidation is returned as the
+            cached 200 response with `from_cache` set.
+
+        Raises:
+            HTTPClientError: If no response could be obtained.
+        """
+        headers = headers or {}
+        if self.cache is None:
+            return self._send_with_retries(url, headers)
+
+        # requests with extra headers, like an Accept header, may get a
+        # different representation, so they are cached separately
+        cache_key = url if not headers else f"{url} {json.dumps(headers, sort_keys=True)}"
+        entry = self.cache.lookup(cache_key)
+        request_headers = headers
+        if entry is not None:
+            request_headers = {**headers, **entry.conditional_headers()}
+
+        response = self._send_with_retries(url, request_headers)
+        if entry is not None and response.status_code == 304:
+            return HTTPResponse(
+                url,
+                200,
+                entry.headers,
+                entry.body,
+                from_cache=True,
+                cache_key=cache_key,
+                annotations=entry.annotations,
+            )
+        if response.status_code == 200 and self.cache.store(
+            cache_key, response.headers, response.content
+        ):
+            response.cache_key = cache_key
+        return response
+
+    def annotate(self, response: HTTPResponse, name: str, value: Any) -> None:
+        """Attach data derived from a response body to its cache entry.
+
+        The annotation is handed back with the body the next time the server
+        confirms that the body has not changed, so that consumers can skip
+        deriving it again.
+
+        Args:
+            response: The response the data was derived from.
+            name: The name of the annotation.
+            value: A JSON-serializable value.
+        """
+        response.annotations[name] = value
+        if self.cache is not None and response.cache_key is not None:
+            self.cache.annotate(response.cache_key, name, value)
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        if self._httpx is not None:
+            self._httpx.close()
+        if self._session is not None:
+            self._session.close()
+
+
+_client: Optional[HTTPClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HTTPClient:
+    """Returns the HTTP client shared by the whole process.
+
+    Returns:
+        The shared HTTPClient, created with default settings and the default
+        on-disk cache on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient(cache=HTTPCache())
+        return _client
+
+
+def set_http_client(client: HTTPClient) -> None:
+    """Replaces the HTTP client shared by the whole process.
+
+    Args:
+        client: The client to use for all subsequent requests.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None and _client is not client:
+            _client.close()
+        _client = client
@@ -0,0 +1,275 @@
+import json
+import os
+import sqlite3
+import threading
+from pydantic import BaseModel
+
+from knowledge.http_cache import CACHE_DIR
+
+
+from typing import Dict, Iterable, List, Optional
+
+
+class ManifestEntry(BaseModel):
+    """What is known about an indexed URL."""
+
+    url: str
+    # hash of the body the chunks were created from
+    content_hash: str
+    # unix timestamp of when the body was fetched
+    fetched_at: float
+    # ids of the chunks in the vector store created from the body
+    chunk_ids: List[str]
+
+
+class ManifestDiff(BaseModel):
+    """The difference between a manifest and the current state of the URLs."""
+
+    # URL hashes that are new or whose content has changed
+    changed: List[str] = []
+    # URL hashes whose content is the same as when they were indexed
+    unchanged: List[str] = []
+    # URL hashes that were indexed but are no longer present
+    removed: List[str] = []
+
+
+class ManifestStore:
+    """A persistent manifest of all URLs indexed into the vector stores.
+
+    The manifest is an SQLite table keyed by collection, the name of the
+    tool a vector store backs, and by the hash of the URL, so looking up a
+    URL is a B-tree search and diffing a whole collection is a single join
+    instead of a list membership check per URL. Tools only hold a reference
+    to the store, which keeps their artifacts small as the corpus grows.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """Create a ManifestStore object.
+
+        Args:
+            path: The path of the SQLite database. Defaults to a file under
+                CACHE_DIR.
+        """
+        self.path = path or os.path.join(CACHE_DIR, "manifest.sqlite")
+        self._connect()
+
+    def _connect(self) -> None:
+        """Open the database and create the schema if needed."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "collection TEXT, url_hash TEXT, url TEXT, content_hash TEXT, "
+            "fetched_at REAL, chunk_ids TEXT, "
+            "PRIMARY KEY (collection, url_hash)) WITHOUT ROWID"
+        )
+
+    def __getstate__(self) -> Dict[str, str]:
+        # only the reference to the database is pickled
+        return {"path": self.path}
+
+    def __setstate__(self, state: Dict[str, str]) -> None:
+        self.path = state["path"]
+        self._connect()
+
+    def get(self, collection: str, url_hash: str) -> Optional[ManifestEntry]:
+        """Get the entry of a URL.
+
+        Args:
+            collection: The collection the URL was indexed into.
+            url_hash: The hash of the URL.
+
+        Returns:
+            The entry, or None if the URL is not in the collection.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, content_hash, fetched_at, chunk_ids FROM entries "
+                "WHERE collection = ? AND url_hash = ?",
+                (collection, url_hash),
+            ).fetchone()
+        if row is None:
+            return None
+        url, content_hash, fetched_at, chunk_ids = row
+        return ManifestEntry(
+            url=url,
+            content_hash=content_hash,
+            fetched_at=fetched_at,
+            chunk_ids=json.loads(chunk_ids),
+        )
+
+    def diff(
+        self, collection: str, content_hashes: Dict[str, Optional[str]]
+    ) -> ManifestDiff:
+        """Compare a collection with the current content of its URLs.
+
+        Args:
+            collection: The collection to compare.
+            content_hashes: A dict with URL hashes as keys and the hash of
+                the current content of the URL as values. A value of None
+                means the content is unknown and is treated as changed.
+
+        Returns:
+            The URLs that need to be (re)indexed, the ones that can be
+            skipped and the ones whose chunks should be deleted.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS current ("
+                "url_hash TEXT PRIMARY KEY, content_hash TEXT)"
+            )
+            self._conn.execute("DELETE FROM current")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO current VALUES (?, ?)", content_hashes.items()
+            )
+            unchanged = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT c.url_hash FROM current c JOIN entries e "
+                    "ON e.collection = ? AND e.url_hash = c.url_hash "
+                    "WHERE e.content_hash = c.content_hash",
+                    (collection,),
+                )
+            ]
+            removed = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT url_hash FROM entries WHERE collection = ? "
+                    "AND url_hash NOT IN (SELECT url_hash FROM current)",
+                    (collection,),
+                )
+            ]
+            self._conn.execute("DELETE FROM current")
+
+        unchanged_set = set(unchanged)
+        changed = [url_hash for url_hash in content_hashes if url_hash not in unchanged_set]
+        return ManifestDiff(changed=changed, unchanged=unchanged, removed=removed)
+
+    def chunk_ids(self, collection: str, url_hashes: Iterable[str]) -> List[str]:
+        """Returns the ids of the chunks created from some URLs.
+
+        Args:
+            collection: The collection the URLs were indexed into.
+            url_hashes: The hashes of the URLs. Unknown hashes are ignored.
+        """
+        chunk_ids = []
+        with self._lock:
+            for url_hash in url_hashes:
+                row = self._conn.execute(
+                    "SELECT chunk_ids FROM entries WHERE collection = ? AND url_hash = ?",
+                    (collection, url_hash),
+                ).fetchone()
+                if row is not None:
+                    chunk_ids.extend(json.loads(row[0]))
+        return chunk_ids
+
+    def upsert(self, collection: str, entries: Dict[str, ManifestEntry]) -> None:
+        """Add or replace the entries of some URLs.
+
+        Args:
+            collection: The collection the URLs were indexed into.
+            entries: A dict with URL hashes as keys and entries as values.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        collection,
+                        url_hash,
+                        entry.url,
+                        entry.content_hash,
+                        entry.fetched_at,
+                        json.dumps(entry.chunk_ids),
+                    )
+                    for url_hash, entry in entries.items()
+                ),
+            )
+
+    def delete(self, collection: str, url_hashes: Iterable[str]) -> None:
+        """Delete the entries of some URLs.
+
+        Args:
+            collection: The collection the URLs were indexed into.
+            url_hashes: The hashes of the URLs.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM entries WHERE collection = ? AND url_hash = ?",
+                ((collection, url_hash) for url_hash in url_hashes),
+            )
+
+    def copy_collection(self, source: str, destination: str) -> None:
+        """Replace the entries of a collection with those of another one.
+
+        Args:
+            source: The collection to copy.
+            destination: The collection to overwrite.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE collection = ?", (destination,))
+            self._conn.execute(
+                "INSERT INTO entries SELECT ?, url_hash, url, content_hash, "
+                "fetched_at, chunk_ids FROM entries WHERE collection = ?",
+                (destination, source),
+            )
+
+    def stage(self, collection: str, base: Optional[str] = None) -> str:
+        """Start a staging copy of a collection for a run to write to.
+
+        The collection itself keeps describing the vector store it was
+        committed with until the staging copy is committed, so a run that
+        fails before its vector store is saved leaves it untouched.
+
+        Args:
+            collection: The collection the run updates.
+            base: The collection the staging copy starts from, or None to
+                start from an empty one.
+
+        Returns:
+            The name of the staging collection.
+        """
+        staging = f"{collection}@staging"
+        if base is None:
+            self.clear(staging)
+        else:
+            self.copy_collection(base, staging)
+        return staging
+
+    def commit(self, collection: str) -> None:
+        """Replace a collection with its staging copy, see `stage`.
+
+        Args:
+            collection: The collection to commit.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE collection = ?", (collection,))
+            self._conn.execute(
+                "UPDATE entries SET collection = ? WHERE collection = ?",
+                (collection, f"{collection}@staging"),
+            )
+
+    def clear(self, collection: str) -> None:
+        """Delete all entries of a collection.
+
+        Args:
+            collection: The collection to clear.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE collection = ?", (collection,))
+
+    def has_collection(self, collection: str) -> bool:
+        """Check whether any URL has been indexed into a collection.
+
+        Args:
+            collection: The collection to check.
+        """
+        with self._lock:
+            return (
+                self._conn.execute(
+                    "SELECT 1 FROM entries WHERE collection = ? LIMIT 1", (collection,)
+                ).fetchone()
+                is not None
+            )
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+from knowledge.http_cache import CACHE_DIR
+
+
+class PageStore:
+    """A content-addressed store of fetched page bodies.
+
+    Bodies are stored under the SHA-256 of their content, so the digest is
+    both the reference passed between pipeline steps and a fingerprint of
+    the page. Data derived from a body, like its parsed text, can be stored
+    next to it and never goes stale since the body behind a digest never
+    changes.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        """Create a PageStore object.
+
+        Args:
+            root: The directory to store the pages in. Defaults to a
+                directory under CACHE_DIR.
+        """
+        self.root = root or os.path.join(CACHE_DIR, "pages")
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, digest: str, suffix: str = "") -> str:
+        """Returns the path of a body, or of data derived from it."""
+        return os.path.join(self.root, digest[:2], digest[2:] + suffix)
+
+    def _write(self, path: str, data: bytes) -> None:
+        """Atomically write a file, so readers never see a partial body."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put(self, body: bytes, charset: Optional[str] = None) -> str:
+        """Store a page body.
+
+        Args:
+            body: The body of the page.
+            charset: The charset the server declared for the body, if any.
+                It is stored next to the body, see `charset`.
+
+        Returns:
+            The digest that references the body.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            self._write(path, body)
+        if charset and self.charset(digest) != charset:
+            self.put_derived(digest, "charset", charset)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        """Get a page body.
+
+        Args:
+            digest: The digest that references the body.
+
+        Returns:
+            The body of the page.
+        """
+        with open(self._path(digest), "rb") as f:
+            return f.read()
+
+    def charset(self, digest: str) -> Optional[str]:
+        """Get the charset the server declared for a page body.
+
+        Args:
+            digest: The digest that references the body.
+
+        Returns:
+            The charset, or None if the server didn't declare one.
+        """
+        return self.get_derived(digest, "charset")
+
+    def __contains__(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    def put_derived(self, digest: str, name: str, text: str) -> None:
+        """Store text derived from a page body.
+
+        Args:
+            digest: The digest of the body the text was derived from.
+            name: The name of the derived text, for example "text".
+            text: The derived text.
+        """
+        self._write(self._path(digest, f".{name}"), text.encode())
+
+    def get_derived(self, digest: str, name: str) -> Optional[str]:
+        """Get text derived from a page body.
+
+        Args:
+            digest: The digest of the body the text was derived from.
+            name: The name of the derived text.
+
+        Returns:
+            The derived text, or None if it has not been stored.
+        """
+        try:
+            with open(self._path(digest, f".{name}"), "rb") as f:
+                return f.read().decode()
+        except FileNotFoundError:
+            return None
@@ -11,15 +11,24 @@ class URL(BaseModel):
     url: str
     scrape: Optional[bool] = False
     url_type: Optional[URLType] = None
-
-    def __init__(self, url: str, scrape: Optional[bool] = False, url_type: Optional[URLType] = None):
+    # digest of the fetched body in the PageStore, if the page was crawled
+    content_hash: Optional[str] = None
+
+    def __init__(
+        self,
+        url: str,
+        scrape: Optional[bool] = False,
+        url_type: Optional[URLType] = None,
+        content_hash: Optional[str] = None,
+    ):
         """ "Create a URL object.
 
         Args:
             url: The URL to create.
             scrape: Whether or not to scrape the URL.
+            content_hash: The digest of the body of the URL in the PageStore.
         """
-        super().__init__(url=url, scrape=scrape)
+        super().__init__(url=url, scrape=scrape, content_hash=content_hash)
 
         url_types = self.get_url_type(url)
         self.url_type = url_types
@@ -66,11 +75,18 @@ class URL(BaseModel):
         Returns:
             True if the URL exists, False otherwise.
         """
-        import requests
+        from knowledge.http_client import (
+            HTTPClientError,
+            ResponseTooLargeError,
+            get_http_client,
+        )
 
         try:
-            response = requests.get(url)
-        except requests.exceptions.ConnectionError:
+            response = get_http_client().get(url)
+        except ResponseTooLargeError as e:
+            # the page exists, only its body is too large to be loaded
+            return e.status_code == 200
+        except HTTPClientError:
             return False
         return response.status_code == 200
 
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import langchain
+from langchain.load.dump import dumps
+from langchain.load.load import loads
+from langchain.schema import BaseCache
+from langchain.schema.cache import RETURN_VAL_TYPE
+
+from knowledge.http_cache import CACHE_DIR
+
+# the temperature in the llm_string of a serializable model, like
+# "temperature": 0.0, or of any other model, like ('temperature', 0.7)
+TEMPERATURE_PATTERN = re.compile(
+    r"""["']temperature["']\s*[:,]\s*([0-9.eE+-]+)"""
+)
+# the temperature of ChatOpenAI and OpenAI when none is passed, which
+# langchain leaves out of the llm_string
+DEFAULT_TEMPERATURE = 0.7
+
+
+def temperature_of(llm_string: str, default: float = DEFAULT_TEMPERATURE) -> float:
+    """Returns the sampling temperature of the model an llm_string describes.
+
+    Args:
+        llm_string: The string langchain describes a model and its
+            parameters with.
+        default: The temperature of models whose llm_string has none.
+    """
+    match = TEMPERATURE_PATTERN.search(llm_string)
+    if match is None:
+        return default
+    try:
+        return float(match.group(1))
+    except ValueError:
+        return default
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Returns the key of a completion: the hash of the model, its parameters and the prompt."""
+    digest = hashlib.sha256(llm_string.encode())
+    digest.update(b"\0")
+    digest.update(prompt.encode())
+    return digest.hexdigest()
+
+
+class LLMCache(BaseCache):
+    """An exact-match cache of LLM completions.
+
+    Completions are keyed by the hash of the rendered prompt and of the
+    llm_string, which holds the model and all of its parameters, so only a
+    call with exactly the same prompt to exactly the same model is answered
+    from the cache. Within the agent loop this catches retries and the
+    identical tool selection prompts of repeated questions.
+
+    The most recently used completions are kept in memory and all of them
+    in an SQLite table, so they survive restarts. Completions sampled with
+    a temperature above zero are different on every call, so they bypass
+    the cache unless `cache_sampled` is set.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_memory_entries: int = 1024,
+        cache_sampled: bool = False,
+    ):
+        """Create an LLMCache object.
+
+        Args:
+            path: The path of the SQLite database. Defaults to a file under
+                CACHE_DIR.
+            max_memory_entries: The maximum number of completions kept in
+                memory.
+            cache_sampled: Whether completions sampled with a temperature
+                above zero are cached too.
+        """
+        self.path = path or os.path.join(CACHE_DIR, "llm_cache.sqlite")
+        self.max_memory_entries = max_memory_entries
+        self.cache_sampled = cache_sampled
+        self._connect()
+
+    def _connect(self) -> None:
+        """Open the database, create the schema if needed and reset the counters."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, generations TEXT, created_at REAL) WITHOUT ROWID"
+        )
+        # in least recently used order
+        self._memory: "OrderedDict[str, RETURN_VAL_TYPE]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # only the reference to the database and the settings are pickled
+        return {
+            "path": self.path,
+            "max_memory_entries": self.max_memory_entries,
+            "cache_sampled": self.cache_sampled,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._connect()
+
+    def _bypass(self, llm_string: str) -> bool:
+        """Whether the completions of a model are not cached."""
+        return not self.cache_sampled and temperature_of(llm_string) > 0
+
+    def _remember(self, key: str, generations: RETURN_VAL_TYPE) -> None:
+        """Keep a completion in memory. Must be called with the lock held."""
+        self._memory[key] = generations
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """Look up the completion of a prompt by a model.
+
+        Args:
+            prompt: The rendered prompt.
+            llm_string: The string describing the model and its parameters.
+
+        Returns:
+            The cached generations, or None on a miss.
+        """
+        if self._bypass(llm_string):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        key = cache_key(prompt, llm_string)
+        with self._lock:
+            generations = self._memory.get(key)
+            if generations is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return generations
+            row = self._conn.execute(
+                "SELECT generations FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            generations = [loads(generation) for generation in json.loads(row[0])]
+            self._remember(key, generations)
+            self.hits += 1
+            return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """Cache the completion of a prompt by a model.
+
+        Args:
+            prompt: The rendered prompt.
+            llm_string: The string describing the model and its parameters.
+            return_val: The generations of the model.
+        """
+        if self._bypass(llm_string):
+            return
+        key = cache_key(prompt, llm_string)
+        generations = json.dumps([dumps(generation) for generation in return_val])
+        with self._lock:
+            self._remember(key, list(return_val))
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO completions VALUES (?, ?, ?)",
+                    (key, generations, time.time()),
+                )
+
+    def clear(self, **kwargs: Any) -> None:
+        """Drop all cached completions, in memory and on disk."""
+        with self._lock:
+            self._memory.clear()
+            with self._conn:
+                self._conn.execute("DELETE FROM completions")
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the number of hits, misses and bypassed calls, and the hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_lock = threading.Lock()
+# the global cache of langchain that use_llm_cache replaced, while it is
+# replaced
+_replaced_cache: Optional[List[Optional[BaseCache]]] = None
+
+
+def get_llm_cache() -> LLMCache:
+    """Returns the LLM cache of the deployed agents, creating it if needed."""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache()
+        return _llm_cache
+
+
+def set_llm_cache(cache: LLMCache) -> None:
+    """Set the LLM cache of the deployed agents, for example to change its settings."""
+    global _llm_cache
+    with _llm_cache_lock:
+        _llm_cache = cache
+
+
+def use_llm_cache(enabled: bool = True) -> None:
+    """Make langchain answer LLM calls from the LLM cache, or stop it.
+
+    langchain looks its cache up globally on every LLM call. Disabling
+    the LLM cache restores the global cache that was set before it was
+    enabled, if any.
+
+    Args:
+        enabled: Whether LLM calls go through the LLM cache.
+    """
+    global _replaced_cache
+    cache = get_llm_cache() if enabled else None
+    with _llm_cache_lock:
+        if enabled:
+            if _replaced_cache is None:
+                _replaced_cache = [langchain.llm_cache]
+            langchain.llm_cache = cache
+        elif _replaced_cache is not None:
+            langchain.llm_cache = _replaced_cache[0]
+            _replaced_cache = None
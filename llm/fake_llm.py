@@ -0,0 +1,108 @@
+import asyncio
+import json
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import ChatGeneration, ChatResult
+from langchain.schema.messages import AIMessage, BaseMessage
+
+# the tools listed in the prompt of a ConversationalChatAgent
+TOOL_PATTERN = re.compile(r"^> ([^:\n]+):", re.MULTILINE)
+TOOL_RESPONSE_PREFIX = "TOOL RESPONSE:"
+FORMAT_INSTRUCTIONS_MARKER = "RESPONSE FORMAT INSTRUCTIONS"
+
+
+def _action(action: str, action_input: str) -> str:
+    """Returns an action in the markdown format of the conversational agent."""
+    blob = json.dumps({"action": action, "action_input": action_input}, indent=4)
+    return f"```json\n{blob}\n```"
+
+
+class FakeChatModel(BaseChatModel):
+    """A chat model that answers locally after a fixed delay.
+
+    It follows the protocol of the ConversationalChatAgent: asked with the
+    agent prompt, it first calls the first tool listed with the question,
+    then gives the start of the tool response as the final answer. Any
+    other prompt, like the one of the QA chain of a tool, gets `answer`.
+    This exercises the whole agent loop, including vector searches, so
+    the serving path can be load tested offline without paying for tokens.
+    """
+
+    # the delay of every call, in seconds
+    latency: float = 0.05
+    # the answer to prompts that are not agent prompts
+    answer: str = "This is a fake answer."
+    # whether the agent is made to call a tool before answering
+    use_tools: bool = True
+    # whether responses are streamed word by word to the callbacks, after
+    # `latency` and then `token_latency` per word
+    streaming: bool = False
+    token_latency: float = 0.01
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"latency": self.latency, "answer": self.answer, "use_tools": self.use_tools}
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        """Split a response into the tokens it is streamed in."""
+        return re.findall(r"\s*\S+", text)
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        """Returns the response to a prompt."""
+        text = "\n".join(str(message.content) for message in messages)
+        if FORMAT_INSTRUCTIONS_MARKER not in text:
+            return self.answer
+        last = str(messages[-1].content)
+        if last.startswith(TOOL_RESPONSE_PREFIX):
+            observation = last[len(TOOL_RESPONSE_PREFIX) :].split("USER'S INPUT")[0]
+            observation = observation.strip().strip("-").strip()
+            return _action("Final Answer", observation[:200] or self.answer)
+        tools = TOOL_PATTERN.findall(text)
+        if not self.use_tools or not tools:
+            return _action("Final Answer", self.answer)
+        question = last.rsplit("\n", 1)[-1].strip()
+        return _action(tools[0].strip(), question)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        content = self._respond(messages)
+        if self.streaming and run_manager is not None:
+            for token in self._tokens(content):
+                time.sleep(self.token_latency)
+                run_manager.on_llm_new_token(token)
+        message = AIMessage(content=content)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        content = self._respond(messages)
+        if self.streaming and run_manager is not None:
+            for token in self._tokens(content):
+                await asyncio.sleep(self.token_latency)
+                await run_manager.on_llm_new_token(token)
+        message = AIMessage(content=content)
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,206 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.chains.base import Chain
+from langchain.schema.messages import AIMessage, BaseMessage, HumanMessage
+
+from agent.streaming import AgentEvent, astream_events
+from vector_store.search_executor import set_search_executor
+
+# the number of recent requests the latency percentiles are computed over
+LATENCY_WINDOW = 10_000
+
+
+class Overloaded(Exception):
+    """Raised when a request arrives while the service is full."""
+
+
+def chat_messages(chat_history: Sequence[Tuple[str, str]]) -> List[BaseMessage]:
+    """Returns the messages of a chat history given as (human, ai) pairs."""
+    messages: List[BaseMessage] = []
+    for human, ai in chat_history:
+        messages.append(HumanMessage(content=human))
+        messages.append(AIMessage(content=ai))
+    return messages
+
+
+class AgentService:
+    """Answers questions with a deployed agent, many conversations at a time.
+
+    Requests run the agent loop asynchronously on the event loop: the LLM
+    calls are awaited and the vector searches of the tools run in the
+    search thread pool, so a single process can have many conversations
+    in flight. At most `max_concurrency` requests run the agent at once.
+    Up to `max_waiting` more wait for a slot, and requests beyond that are
+    rejected with Overloaded right away, so that a burst of traffic turns
+    into fast errors clients can retry instead of an ever-growing queue.
+
+    The agent should have no memory: conversations are independent and
+    every request brings its own chat history.
+    """
+
+    def __init__(
+        self,
+        agent: Chain,
+        max_concurrency: int = 16,
+        max_waiting: int = 64,
+        timeout: Optional[float] = 60.0,
+        search_threads: Optional[int] = None,
+    ):
+        """Create an AgentService object.
+
+        Args:
+            agent: The deployed agent, or any agent executor.
+            max_concurrency: The maximum number of requests running the
+                agent at once.
+            max_waiting: The maximum number of requests waiting to run.
+            timeout: The maximum time a request runs the agent for, in
+                seconds. If None, requests are not timed out.
+            search_threads: If set, the number of threads vector searches
+                run in.
+        """
+        self.agent = agent
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        if search_threads is not None:
+            set_search_executor(
+                ThreadPoolExecutor(search_threads, thread_name_prefix="vector-search")
+            )
+        # created on the first request, in the event loop of the service
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def _inputs(
+        self, question: str, chat_history: Optional[Sequence[Tuple[str, str]]]
+    ) -> Dict[str, Any]:
+        """Returns the inputs of the agent for a question."""
+        inputs: Dict[str, Any] = {"input": question}
+        if getattr(self.agent, "memory", None) is None:
+            inputs["chat_history"] = chat_messages(chat_history or [])
+        return inputs
+
+    async def _acquire(self) -> None:
+        """Wait for a slot to run the agent in.
+
+        Raises:
+            Overloaded: If too many requests are waiting already.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise Overloaded(
+                f"{self.running} requests are running and {self.waiting} are waiting."
+            )
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+    async def ask(
+        self, question: str, chat_history: Optional[Sequence[Tuple[str, str]]] = None
+    ) -> str:
+        """Answer a question.
+
+        Args:
+            question: The question.
+            chat_history: The previous turns of the conversation, as
+                (human, ai) pairs.
+
+        Returns:
+            The answer of the agent.
+
+        Raises:
+            Overloaded: If the service is full.
+            asyncio.TimeoutError: If the agent took longer than `timeout`.
+        """
+        await self._acquire()
+        start = time.perf_counter()
+        self.running += 1
+        try:
+            outputs = await asyncio.wait_for(
+                self.agent.acall(self._inputs(question, chat_history)), self.timeout
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+        self.completed += 1
+        self._latencies.append(time.perf_counter() - start)
+        return outputs[self.agent.output_keys[0]]
+
+    async def stream(
+        self, question: str, chat_history: Optional[Sequence[Tuple[str, str]]] = None
+    ) -> AsyncIterator[AgentEvent]:
+        """Answer a question, yielding the events of the agent run as they happen.
+
+        The request holds its slot until the answer is complete or the
+        consumer stops iterating. `timeout` applies between events rather
+        than to the whole run, since the consumer sees its progress.
+
+        Args:
+            question: The question.
+            chat_history: The previous turns of the conversation, as
+                (human, ai) pairs.
+
+        Yields:
+            The events of the run, see agent.streaming.AgentEvent.
+
+        Raises:
+            Overloaded: If the service is full, before any event.
+            asyncio.TimeoutError: If the agent went longer than `timeout`
+                without an event.
+        """
+        await self._acquire()
+        inputs = self._inputs(question, chat_history)
+        stream_answer = getattr(self.agent, "astream_answer", None)
+        events = (
+            stream_answer(inputs)
+            if stream_answer is not None
+            else astream_events(self.agent, inputs)
+        )
+        start = time.perf_counter()
+        self.running += 1
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                yield event
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+            # stops the run if it is still going
+            await events.aclose()
+        self.completed += 1
+        self._latencies.append(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the request counters and the latency percentiles, in seconds."""
+        latencies = np.array(self._latencies)
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "p50_latency": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "p99_latency": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
@@ -0,0 +1,199 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from fastapi import Depends, FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+from agent.streaming import AgentEvent
+from serving.agent_service import AgentService, Overloaded
+from serving.model_host import ModelHost
+
+# how long clients are told to wait before retrying a rejected request
+RETRY_AFTER_SECONDS = 1
+TIMED_OUT = "The agent timed out."
+
+
+class Question(BaseModel):
+    """The body of a request to /ask."""
+
+    question: str
+    # the previous turns of the conversation, as (human, ai) pairs
+    chat_history: List[Tuple[str, str]] = []
+
+
+def sse(event: AgentEvent) -> str:
+    """Returns an event in the format of server-sent events."""
+    return f"event: {event.type}\ndata: {json.dumps(event.to_dict())}\n\n"
+
+
+def _overloaded(error: Overloaded) -> JSONResponse:
+    """Returns the response to a request rejected by a full service."""
+    return JSONResponse(
+        {"detail": str(error)},
+        status_code=503,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+
+def _detail(error: Exception) -> str:
+    """Returns the description of an error of the agent for the client."""
+    if isinstance(error, asyncio.TimeoutError):
+        return TIMED_OUT
+    return str(error) or type(error).__name__
+
+
+def _failed(error: Exception) -> JSONResponse:
+    """Returns the response to a request the agent failed to answer."""
+    status_code = 504 if isinstance(error, asyncio.TimeoutError) else 500
+    return JSONResponse({"detail": _detail(error)}, status_code=status_code)
+
+
+def create_app(service: AgentService) -> FastAPI:
+    """Returns an HTTP app answering questions with an agent service.
+
+    Endpoints:
+        POST /ask: answers {"question", "chat_history"} with {"answer"}.
+            Responds 503 with a Retry-After header when the service is
+            full, 504 when the agent times out and 500 when it fails,
+            with the error in "detail".
+        POST /ask/stream: answers the same body with server-sent events,
+            one per AgentEvent, named after its type. The final answer
+            streams as "token" events and the last event is "answer",
+            or "error" if the agent failed. Responds like /ask if the
+            agent fails before its first event, and times out when it
+            goes longer than the timeout of the service between events.
+        GET /stats: the counters and latencies of the service.
+        GET /health: whether the app is up.
+
+    Args:
+        service: The service answering the questions.
+    """
+    app = FastAPI()
+
+    async def get_service() -> AgentService:
+        return service
+
+    _add_routes(app, "", get_service)
+
+    @app.get("/stats")
+    async def stats() -> Dict[str, Any]:
+        return service.stats()
+
+    @app.get("/health")
+    async def health() -> Dict[str, str]:
+        return {"status": "ok"}
+
+    return app
+
+
+def create_host_app(host: ModelHost) -> FastAPI:
+    """Returns an HTTP app answering questions with the agents of a model host.
+
+    Endpoints:
+        POST /agents/{name}/{version}/ask and
+        POST /agents/{name}/{version}/ask/stream: like the endpoints of
+            create_app, for a version of an agent. The version is deployed
+            on its first request.
+        GET /metrics: the residency metrics and the request counters of
+            each agent.
+        GET /health: whether the app is up.
+
+    Args:
+        host: The model host serving the agents.
+    """
+    app = FastAPI()
+
+    async def get_service(name: str, version: int) -> AgentService:
+        # deploying loads artifacts, which blocks
+        return await asyncio.get_running_loop().run_in_executor(
+            None, host.service, name, version
+        )
+
+    _add_routes(app, "/agents/{name}/{version}", get_service)
+
+    @app.get("/metrics")
+    async def metrics() -> Dict[str, Any]:
+        return host.metrics()
+
+    @app.get("/health")
+    async def health() -> Dict[str, str]:
+        return {"status": "ok"}
+
+    return app
+
+
+def _add_routes(app: FastAPI, prefix: str, get_service: Any) -> None:
+    """Add the question endpoints to an app.
+
+    Args:
+        app: The app.
+        prefix: The path the endpoints are under.
+        get_service: A FastAPI dependency returning the service answering.
+    """
+
+    @app.post(f"{prefix}/ask")
+    async def ask(question: Question, service: AgentService = Depends(get_service)) -> Any:
+        try:
+            answer = await service.ask(question.question, question.chat_history)
+        except Overloaded as e:
+            return _overloaded(e)
+        except Exception as e:
+            return _failed(e)
+        return {"answer": answer}
+
+    @app.post(f"{prefix}/ask/stream")
+    async def ask_stream(
+        question: Question, service: AgentService = Depends(get_service)
+    ) -> Any:
+        events = service.stream(question.question, question.chat_history)
+        # wait for a slot before responding, so that a full service can
+        # still answer 503
+        try:
+            first = await events.__anext__()
+        except Overloaded as e:
+            return _overloaded(e)
+        except Exception as e:
+            return _failed(e)
+
+        async def body() -> AsyncIterator[str]:
+            yield sse(first)
+            try:
+                async for event in events:
+                    yield sse(event)
+            except Exception as e:
+                # the status has been sent already
+                yield sse(AgentEvent("error", detail=_detail(e)))
+
+        return StreamingResponse(
+            body(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+
+def serve(service: AgentService, host: str = "127.0.0.1", port: int = 8000) -> None:
+    """Serve an agent service over HTTP until interrupted.
+
+    Args:
+        service: The service answering the questions.
+        host: The host to listen on.
+        port: The port to listen on.
+    """
+    import uvicorn
+
+    uvicorn.run(create_app(service), host=host, port=port)
+
+
+def serve_host(host: ModelHost, host_name: str = "127.0.0.1", port: int = 8000) -> None:
+    """Serve the agents of a model host over HTTP until interrupted.
+
+    Args:
+        host: The model host serving the agents.
+        host_name: The host to listen on.
+        port: The port to listen on.
+    """
+    import uvicorn
+
+    uvicorn.run(create_host_app(host), host=host_name, port=port)
@@ -0,0 +1,134 @@
+import threading
+from functools import partial
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from agent.agent import Agent
+from agent.deployed_agent import DeployedAgent
+from serving.agent_service import AgentService
+from vector_store.lazy_vector_store import LazyVectorStore, StoreResidency
+from vector_store.persistence import store_opener
+from vector_store.shared_vector_store import VersionView
+import zenml_code.zenml_utils as zenml_utils
+
+DEFAULT_MEMORY_BUDGET = 8 * 2**30
+
+
+class ModelHost:
+    """Serves many versions of many agents from one process.
+
+    An agent version is deployed on its first request. Its tools are
+    loaded with lazy stand-ins for their vector stores, so deploying is
+    cheap and a store is only loaded when a question is first routed to
+    it. The loaded stores of all agents share one StoreResidency, which
+    keeps them under a memory budget by dropping the least recently used
+    ones. `prewarm` loads the stores of the hot agents up front, and
+    `metrics` reports the hits, loads and evictions of each agent, which
+    is what hosts are sized with.
+
+    Every agent version gets its own AgentService and answer cache.
+    """
+
+    def __init__(
+        self,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        in_memory: bool = False,
+        cache_answers: bool = True,
+        cache_llm_calls: bool = True,
+        **service_kwargs: Any,
+    ):
+        """Create a ModelHost object.
+
+        Args:
+            memory_budget: The maximum size of the loaded vector stores,
+                in bytes.
+            in_memory: Whether vector stores are read into memory instead
+                of being memory-mapped.
+            cache_answers: Whether each agent version caches its answers.
+            cache_llm_calls: Whether LLM calls go through the LLM cache.
+            service_kwargs: The arguments of the AgentService of each agent
+                version, like max_concurrency.
+        """
+        self.residency = StoreResidency(memory_budget, in_memory=in_memory)
+        self.cache_answers = cache_answers
+        self.cache_llm_calls = cache_llm_calls
+        self.service_kwargs = service_kwargs
+        self._lock = threading.Lock()
+        self._services: Dict[Tuple[str, int], AgentService] = {}
+        # held while an agent version is deployed, so that it is deployed once
+        self._deploying: Dict[Tuple[str, int], threading.Lock] = {}
+
+    def _lazy_store(self, name: str, path: str, uri: Optional[str]) -> LazyVectorStore:
+        """Returns a lazy stand-in for a store of an agent."""
+        return LazyVectorStore(path, uri, name, self.residency)
+
+    def _deploy(self, name: str, version: int) -> DeployedAgent:
+        """Deploy a version of an agent with lazily loaded vector stores."""
+        # a fresh copy of the tools, whose stores are opened lazily
+        with store_opener(partial(self._lazy_store, name)):
+            registry = zenml_utils.get_existing_tool_registry(
+                pipeline_name=name, pipeline_version=version, cache=False
+            )
+        return Agent(name).deploy(
+            version,
+            cache_answers=self.cache_answers,
+            cache_llm_calls=self.cache_llm_calls,
+            tool_registry=registry,
+        )
+
+    def service(self, name: str, version: int) -> AgentService:
+        """Returns the service of a version of an agent, deploying it if needed.
+
+        Args:
+            name: The name of the agent.
+            version: The version of the agent.
+        """
+        key = (name, version)
+        with self._lock:
+            if key in self._services:
+                return self._services[key]
+            deploying = self._deploying.setdefault(key, threading.Lock())
+        with deploying:
+            with self._lock:
+                if key in self._services:
+                    return self._services[key]
+            service = AgentService(self._deploy(name, version), **self.service_kwargs)
+            with self._lock:
+                self._services[key] = service
+                self._deploying.pop(key, None)
+            return service
+
+    def prewarm(self, agents: Iterable[Tuple[str, int]]) -> None:
+        """Deploy agent versions and load their vector stores while they fit.
+
+        Args:
+            agents: The (name, version) pairs of the agents, hottest first.
+                Stores stop being loaded at the first one that doesn't fit
+                in the memory budget, so that the coldest agents don't evict
+                the hottest ones.
+        """
+        for name, version in agents:
+            service = self.service(name, version)
+            for tool in service.agent.tool_registry.tools:
+                store = getattr(tool, "vectorstore", None)
+                if isinstance(store, VersionView):
+                    store = store.store
+                if not isinstance(store, LazyVectorStore):
+                    continue
+                if self.residency.is_resident(store.path):
+                    continue
+                if not self.residency.fits(store.path, store.uri):
+                    return
+                store.load()
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the residency metrics and the request counters of each agent."""
+        metrics: Dict[str, Dict[str, Any]] = {
+            name: {"stores": store_metrics, "versions": {}}
+            for name, store_metrics in self.residency.metrics().items()
+        }
+        with self._lock:
+            services = dict(self._services)
+        for (name, version), service in services.items():
+            agent_metrics = metrics.setdefault(name, {"stores": {}, "versions": {}})
+            agent_metrics["versions"][str(version)] = service.stats()
+        return metrics
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the modules are imported like the steps and the agent import them
+sys.path[:0] = [ROOT, os.path.join(ROOT, "zenml_code")]
+
+# keep the on-disk state of the tests out of the user's cache
+os.environ.setdefault(
+    "AGENT_FRAMEWORK_CACHE_DIR", tempfile.mkdtemp(prefix="agent_framework_tests_")
+)
@@ -0,0 +1,69 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict
+
+from fastapi.testclient import TestClient
+
+# the steps are imported through the pipeline, like the agent does
+import zenml_code.zenml_utils  # noqa: F401
+from agent.streaming import AgentEvent
+from serving.agent_service import AgentService
+from serving.app import TIMED_OUT, create_app
+
+
+class _Agent:
+    """An agent whose runs fail, or stall, after some events."""
+
+    memory = None
+    output_keys = ["output"]
+
+    def __init__(self, events, error: Exception = None, stall: float = 0.0):
+        self.events = events
+        self.error = error
+        self.stall = stall
+
+    async def acall(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+        raise self.error
+
+    async def astream_answer(self, inputs: Dict[str, Any]) -> AsyncIterator[AgentEvent]:
+        for event in self.events:
+            yield event
+        await asyncio.sleep(self.stall)
+        if self.error is not None:
+            raise self.error
+        yield AgentEvent("answer", answer="done")
+
+
+def _client(agent: _Agent, timeout: float = 5.0) -> TestClient:
+    return TestClient(create_app(AgentService(agent, timeout=timeout)))
+
+
+def test_ask_responds_with_the_error_of_the_agent():
+    response = _client(_Agent([], error=ValueError("no tools"))).post(
+        "/ask", json={"question": "How?"}
+    )
+
+    assert response.status_code == 500
+    assert response.json() == {"detail": "no tools"}
+
+
+def test_stream_responds_with_an_error_before_the_first_event():
+    client = _client(_Agent([], error=ValueError("no tools")))
+
+    response = client.post("/ask/stream", json={"question": "How?"})
+
+    assert response.status_code == 500
+    assert response.json() == {"detail": "no tools"}
+    assert client.get("/stats").json()["failed"] == 1
+
+
+def test_stream_times_out_between_events():
+    agent = _Agent([AgentEvent("action", tool="docs", tool_input="how")], stall=1.0)
+    client = _client(agent, timeout=0.1)
+
+    response = client.post("/ask/stream", json={"question": "How?"})
+
+    assert response.status_code == 200
+    assert "event: action" in response.text
+    assert f'"detail": "{TIMED_OUT}"' in response.text
+    stats = client.get("/stats").json()
+    assert (stats["failed"], stats["running"]) == (1, 0)
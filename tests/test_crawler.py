@@ -0,0 +1,41 @@
+from typing import Dict, List
+
+import pytest
+
+from steps.crawler import Crawler
+
+SITE: Dict[str, List[str]] = {
+    "https://docs.example.com/": ["https://docs.example.com/a"],
+    "https://docs.example.com/a": ["https://docs.example.com/b"],
+    "https://docs.example.com/b": ["https://docs.example.com/c"],
+    "https://docs.example.com/c": [],
+}
+
+
+def _fetcher(fetched: List[str]):
+    def fetch(url: str) -> str:
+        fetched.append(url)
+        return "".join(f'<a href="{link}">link</a>' for link in SITE[url])
+
+    return fetch
+
+
+@pytest.mark.parametrize("max_depth", [0, 1, 2])
+def test_pages_at_max_depth_are_returned_without_being_fetched(max_depth):
+    fetched: List[str] = []
+    crawler = Crawler(fetch=_fetcher(fetched), max_depth=max_depth)
+
+    pages = crawler.crawl("https://docs.example.com/", "docs.example.com")
+
+    assert pages == set(list(SITE)[: max_depth + 1])
+    assert fetched == list(SITE)[:max_depth]
+
+
+def test_unbounded_crawl_fetches_every_page():
+    fetched: List[str] = []
+    crawler = Crawler(fetch=_fetcher(fetched))
+
+    pages = crawler.crawl("https://docs.example.com/", "docs.example.com")
+
+    assert pages == set(SITE)
+    assert sorted(fetched) == sorted(SITE)
@@ -0,0 +1,76 @@
+import pytest
+from langchain.chat_models import ChatOpenAI
+from langchain.llms.fake import FakeListLLM
+from langchain.tools import Tool
+
+# the steps are imported through the pipeline, like the agent does
+import zenml_code.zenml_utils as zenml_utils
+from agent.agent import Agent
+from agent.deployed_agent import DeployedAgent
+from agent.tool_registry import ToolRegistry
+
+ANSWER = '```json\n{"action": "Final Answer", "action_input": "Use a stack."}\n```'
+
+
+def _tool(name: str) -> Tool:
+    return Tool(name=name, description=f"Search {name}.", func=lambda query: "")
+
+
+def test_deployed_agent_uses_the_tools_and_prompt_of_the_registry():
+    registry = ToolRegistry([_tool("docs"), _tool("blog")])
+    agent = Agent("docs", llm=FakeListLLM(responses=[ANSWER]))
+
+    deployed = DeployedAgent(agent, version=3, tool_registry=registry)
+
+    assert deployed.version == 3
+    assert deployed.tool_registry is registry
+    assert [tool.name for tool in deployed.tools] == ["docs", "blog"]
+    assert deployed.agent.llm_chain.prompt == registry.prompt
+    outputs = deployed({"input": "How do I deploy?", "chat_history": []})
+    assert outputs["output"] == "Use a stack."
+
+
+def test_deployed_agent_rejects_tools_not_in_the_registry():
+    registry = ToolRegistry([_tool("docs")])
+    values = {"tools": [_tool("docs"), _tool("blog")], "tool_registry": registry}
+
+    with pytest.raises(ValueError):
+        DeployedAgent.validate_tools(values)
+
+
+def test_tool_registry_rejects_duplicate_names():
+    with pytest.raises(ValueError):
+        ToolRegistry([_tool("docs"), _tool("docs")])
+
+
+def test_tool_registry_is_immutable():
+    registry = ToolRegistry([_tool("docs")])
+
+    assert "docs" in registry
+    assert registry.names == ("docs",)
+    assert "docs: Search docs." in registry.tool_block
+    with pytest.raises(AttributeError):
+        registry.tools = ()
+    with pytest.raises(TypeError):
+        registry.by_name["blog"] = _tool("blog")
+
+
+def test_deployed_agents_stream_the_tokens_of_their_llm(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    llm = ChatOpenAI()
+    monkeypatch.setattr(
+        zenml_utils,
+        "get_existing_agent",
+        lambda pipeline_name, pipeline_version: Agent(pipeline_name, llm=llm),
+    )
+
+    deployed = Agent("docs", llm=llm).deploy(
+        1,
+        cache_answers=False,
+        cache_llm_calls=False,
+        tool_registry=ToolRegistry([_tool("docs")]),
+    )
+
+    assert deployed.agent.llm.streaming
+    assert deployed.agent.llm_chain.llm.streaming
+    assert not llm.streaming
@@ -0,0 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from embeddings.embedding_cache import EmbeddingCache
+
+
+def test_caches_sharing_a_directory_never_allocate_the_same_rows(tmp_path):
+    # like the caches of several processes
+    caches = [EmbeddingCache(str(tmp_path)) for _ in range(4)]
+    batches = [
+        [f"text {i} of cache {c}" for i in range(50)] for c in range(len(caches))
+    ]
+
+    def put(c):
+        for i, text in enumerate(batches[c]):
+            caches[c].put_many("model", [text], np.full((1, 4), 100 * c + i))
+
+    with ThreadPoolExecutor(max_workers=len(caches)) as executor:
+        list(executor.map(put, range(len(caches))))
+
+    reader = EmbeddingCache(str(tmp_path))
+    for c, texts in enumerate(batches):
+        vectors = reader.get_many("model", texts)
+        assert [vector[0] for vector in vectors] == [100 * c + i for i in range(50)]
@@ -0,0 +1,162 @@
+import pytest
+from langchain.docstore.document import Document
+from langchain.text_splitter import CharacterTextSplitter
+
+# the steps are imported through the pipeline, like the agent does
+import zenml_code.zenml_utils  # noqa: F401
+from knowledge.manifest import ManifestStore
+from steps.index_generator import _delta, _embeddings, _page_key, _retarget_sources
+from steps.web_loading_utils import failed_document
+
+VERSION = "0.47.0"
+URL_A = f"https://docs.example.com/{VERSION}/a"
+URL_B = f"https://docs.example.com/{VERSION}/b"
+
+
+def _page(url: str, text: str) -> Document:
+    return Document(page_content=text, metadata={"source": url, "content_hash": text})
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return ManifestStore(str(tmp_path / "manifest.sqlite"))
+
+
+@pytest.fixture
+def text_splitter():
+    return CharacterTextSplitter(chunk_size=20, chunk_overlap=0, separator=" ")
+
+
+def _index(manifest, text_splitter, documents):
+    delta = _delta("docs", VERSION, documents, manifest, text_splitter)
+    manifest.delete("docs", delta.removed_pages)
+    manifest.upsert("docs", delta.new_entries)
+    return delta
+
+
+def test_delta_only_returns_changed_chunks(manifest, text_splitter):
+    first = _index(
+        manifest,
+        text_splitter,
+        [_page(URL_A, "alpha beta gamma delta"), _page(URL_B, "one two three")],
+    )
+    assert len(first.new_ids) == 3
+    assert first.stale_ids == set() and first.removed_pages == []
+
+    second = _index(
+        manifest,
+        text_splitter,
+        [_page(URL_A, "alpha beta gamma epsilon"), _page(URL_B, "one two three")],
+    )
+    assert [chunk.page_content for chunk in second.new_chunks] == ["epsilon"]
+    assert len(second.stale_ids) == 1
+    assert list(second.new_entries) == [_page_key(URL_A, VERSION)]
+
+
+def test_delta_replaces_chunks_whose_section_was_renamed(manifest, text_splitter):
+    def page(heading):
+        # the HTML of the page changed, but only in its heading
+        document = _page(URL_A, "alpha beta gamma")
+        document.metadata.update(content_hash=heading, sections=[(0, heading)])
+        return document
+
+    first = _index(manifest, text_splitter, [page("Intro")])
+    assert [chunk.metadata["heading_path"] for chunk in first.new_chunks] == ["Intro"]
+
+    second = _index(manifest, text_splitter, [page("Overview")])
+
+    assert [chunk.metadata["heading_path"] for chunk in second.new_chunks] == [
+        "Overview"
+    ]
+    assert second.stale_ids == set(first.new_ids)
+
+
+def test_delta_removes_pages_that_are_gone(manifest, text_splitter):
+    first = _index(
+        manifest, text_splitter, [_page(URL_A, "alpha"), _page(URL_B, "one two three")]
+    )
+
+    second = _index(manifest, text_splitter, [_page(URL_A, "alpha")])
+
+    assert second.removed_pages == [_page_key(URL_B, VERSION)]
+    assert second.stale_ids == set(first.new_entries[_page_key(URL_B, VERSION)].chunk_ids)
+
+
+def test_delta_keeps_pages_that_failed_to_load(manifest, text_splitter):
+    _index(manifest, text_splitter, [_page(URL_A, "alpha"), _page(URL_B, "one two three")])
+
+    delta = _index(manifest, text_splitter, [_page(URL_A, "alpha"), failed_document(URL_B)])
+
+    assert delta.removed_pages == [] and delta.stale_ids == set()
+    assert delta.new_ids == [] and delta.new_entries == {}
+    assert manifest.get("docs", _page_key(URL_B, VERSION)) is not None
+
+
+def test_unknown_embedding_backends_are_rejected():
+    with pytest.raises(ValueError, match="opneai"):
+        _embeddings("opneai")
+
+
+def test_retarget_sources_points_copied_chunks_at_the_new_version():
+    from embeddings.hashing_embeddings import HashingEmbeddings
+    from vector_store.id_map_vector_store import IDMapVectorStore
+
+    base = IDMapVectorStore(HashingEmbeddings())
+    base.add_texts(
+        ["alpha", "beta"],
+        metadatas=[{"source": URL_A}, {"source": "https://example.com/blog"}],
+        ids=["a-1", "b-1"],
+    )
+
+    copy = base.copy()
+    _retarget_sources(copy, VERSION, "0.48.0")
+
+    assert sorted(d.metadata["source"] for d in copy.docstore.values()) == [
+        "https://docs.example.com/0.48.0/a",
+        "https://example.com/blog",
+    ]
+    # the store it was copied from is untouched
+    assert URL_A in [d.metadata["source"] for d in base.docstore.values()]
+
+
+def test_shared_index_only_returns_the_views_of_the_indexed_versions(
+    manifest, text_splitter
+):
+    from langchain.llms.fake import FakeListLLM
+
+    from embeddings.embedding_engine import EmbeddingEngine
+    from embeddings.hashing_embeddings import HashingEmbeddings
+    from steps.index_generator import _generate_shared
+    from tools.versioned_vector_store import VersionedVectorStoreTool
+    from vector_store.shared_vector_store import SharedVectorStore
+
+    embeddings = HashingEmbeddings()
+
+    def index(version, existing_tools):
+        pages = [_page(f"https://docs.example.com/{version}/a", f"alpha {version}")]
+        return _generate_shared(
+            "docs",
+            {version: pages},
+            existing_tools,
+            manifest,
+            EmbeddingEngine(embeddings),
+            text_splitter,
+            SharedVectorStore(embeddings),
+        )
+
+    views = index("0.46.0", {})
+    existing_tools = {
+        "0.46.0": VersionedVectorStoreTool(
+            name="docs-0.46.0",
+            description="Docs of version 0.46.0.",
+            vectorstore=views["0.46.0"],
+            llm=FakeListLLM(responses=[""]),
+            version="0.46.0",
+        )
+    }
+
+    # like a later run that only indexes another version
+    views = index(VERSION, existing_tools)
+
+    assert list(views) == [VERSION]
+    assert "0.46.0" in views[VERSION].store.versions
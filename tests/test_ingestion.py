@@ -0,0 +1,148 @@
+from typing import Dict, List, Optional
+
+import pytest
+from langchain.text_splitter import CharacterTextSplitter
+
+# the steps are imported through the pipeline, like the agent does
+import zenml_code.zenml_utils  # noqa: F401
+import knowledge.http_client as http_client
+from embeddings.embedding_engine import EmbeddingEngine
+from embeddings.hashing_embeddings import HashingEmbeddings
+from knowledge.http_client import HTTPClientError, HTTPResponse
+from knowledge.manifest import ManifestStore
+from knowledge.page_store import PageStore
+from knowledge.url import URL
+from steps.index_generator import _page_key
+from steps.ingestion import IngestionEngine, map_ordered, prefetch
+from vector_store.id_map_vector_store import IDMapVectorStore
+
+VERSION = "1.0"
+
+
+def _html(text: str) -> bytes:
+    return (
+        '<html><body><article class="md-content__inner">'
+        f"<p>{text}</p></article></body></html>"
+    ).encode()
+
+
+class _UnreachableClient:
+    def get(self, url, headers=None):
+        raise HTTPClientError(f"GET {url} failed")
+
+
+class _NotFoundClient:
+    def get(self, url, headers=None):
+        return HTTPResponse(url, 404, {"content-type": "text/html"}, _html("not found"))
+
+
+@pytest.fixture
+def page_store(tmp_path):
+    return PageStore(str(tmp_path / "pages"))
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return ManifestStore(str(tmp_path / "manifest.sqlite"))
+
+
+@pytest.fixture
+def ingestion(page_store, manifest, monkeypatch):
+    monkeypatch.setattr(http_client, "_client", _UnreachableClient())
+    return IngestionEngine(
+        EmbeddingEngine(HashingEmbeddings()),
+        CharacterTextSplitter(chunk_size=20, chunk_overlap=0, separator=" "),
+        manifest,
+        page_store=page_store,
+        batch_size=2,
+        queue_size=2,
+        parse_workers=2,
+    )
+
+
+def _urls(page_store: PageStore, pages: Dict[str, Optional[str]]) -> List[URL]:
+    """URLs of pages whose bodies are in the store, or unreachable if None."""
+    return [
+        URL(
+            f"https://docs.example.com/{VERSION}/{name}",
+            content_hash=None if text is None else page_store.put(_html(text)),
+        )
+        for name, text in pages.items()
+    ]
+
+
+def _texts(vector_store: IDMapVectorStore) -> List[str]:
+    return sorted(document.page_content for document in vector_store.docstore.values())
+
+
+def test_ingest_applies_only_the_delta(ingestion, page_store, manifest):
+    vector_store = IDMapVectorStore(HashingEmbeddings())
+    ingestion.ingest(
+        "docs",
+        VERSION,
+        _urls(page_store, {"a": "alpha beta gamma delta", "b": "one two", "c": "gone"}),
+        vector_store,
+    )
+    assert _texts(vector_store) == ["alpha beta gamma", "delta", "gone", "one two"]
+
+    embedded: List[str] = []
+    embed_documents = ingestion.engine.embeddings.embed_documents
+    ingestion.engine.embeddings.embed_documents = lambda texts: (
+        embedded.extend(texts) or embed_documents(texts)
+    )
+    ingestion.ingest(
+        "docs",
+        VERSION,
+        _urls(page_store, {"a": "alpha beta gamma epsilon", "b": "one two"}),
+        vector_store,
+    )
+
+    assert embedded == ["epsilon"]
+    assert _texts(vector_store) == ["alpha beta gamma", "epsilon", "one two"]
+    page_c = _page_key(f"https://docs.example.com/{VERSION}/c", VERSION)
+    assert manifest.get("docs", page_c) is None
+
+
+def test_ingest_keeps_pages_that_failed_to_load(ingestion, page_store, manifest):
+    vector_store = IDMapVectorStore(HashingEmbeddings())
+    ingestion.ingest("docs", VERSION, _urls(page_store, {"a": "alpha", "b": "one"}), vector_store)
+
+    ingestion.ingest("docs", VERSION, _urls(page_store, {"a": "alpha", "b": None}), vector_store)
+
+    assert _texts(vector_store) == ["alpha", "one"]
+    page_b = _page_key(f"https://docs.example.com/{VERSION}/b", VERSION)
+    assert manifest.get("docs", page_b) is not None
+
+
+def test_ingest_keeps_pages_that_answer_with_an_error(
+    ingestion, page_store, manifest, monkeypatch
+):
+    vector_store = IDMapVectorStore(HashingEmbeddings())
+    ingestion.ingest("docs", VERSION, _urls(page_store, {"a": "alpha", "b": "one"}), vector_store)
+    monkeypatch.setattr(http_client, "_client", _NotFoundClient())
+
+    ingestion.ingest("docs", VERSION, _urls(page_store, {"a": "alpha", "b": None}), vector_store)
+
+    assert _texts(vector_store) == ["alpha", "one"]
+    page_b = _page_key(f"https://docs.example.com/{VERSION}/b", VERSION)
+    assert manifest.get("docs", page_b) is not None
+
+
+def test_prefetch_raises_errors_of_the_producer():
+    def produce():
+        yield 1
+        raise ValueError("crawl failed")
+
+    items = prefetch(produce(), size=1)
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_map_ordered_keeps_the_order_of_the_items():
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(map_ordered(lambda x: x * x, range(10), executor, ahead=3)) == [
+            x * x for x in range(10)
+        ]
@@ -0,0 +1,121 @@
+import pickle
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+from langchain.chat_models import ChatOpenAI
+
+# the steps are imported through the pipeline, like the agent does
+import zenml_code.zenml_utils  # noqa: F401
+import jobs.job_runner as job_runner
+from agent.agent import Agent
+from jobs.job_runner import (
+    CANCELLED,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    JobRunner,
+    JobStore,
+    register_job_kind,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def test_claim_takes_the_oldest_queued_job_once(store):
+    first = store.add("echo", {"n": 1})
+    second = store.add("echo", {"n": 2})
+
+    job = store.claim()
+    assert (job["id"], job["kind"], job["arguments"]) == (first, "echo", {"n": 1})
+    assert store.get(first)["status"] == RUNNING
+    assert store.claim()["id"] == second
+    assert store.claim() is None
+
+
+def test_cancel_stops_queued_jobs_and_flags_running_ones(store):
+    running = store.add("echo", {})
+    store.claim()
+    queued = store.add("echo", {})
+
+    store.cancel(queued)
+    store.cancel(running)
+
+    assert store.get(queued)["status"] == CANCELLED
+    assert store.claim() is None
+    assert store.get(running)["status"] == RUNNING
+    assert store.cancel_requested(running)
+
+
+class _LockedStore(JobStore):
+    """A store whose first claims fail like a database locked by another process."""
+
+    failures = 2
+
+    def claim(self):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return super().claim()
+
+
+def test_workers_retry_claiming_after_an_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_runner, "CLAIM_RETRY_SECONDS", 0.01)
+    calls = []
+    register_job_kind("echo", lambda n: calls.append(n))
+    runner = JobRunner(_LockedStore(str(tmp_path / "jobs.sqlite")), max_workers=1)
+
+    try:
+        handle = runner.submit("echo", n=1)
+        assert handle.wait(timeout=10, poll_interval=0.01) == SUCCEEDED
+    finally:
+        runner.stop()
+    assert calls == [1]
+
+
+def test_jobs_run_one_at_a_time_by_default(store):
+    running = []
+    overlapped = []
+
+    def pipeline(n):
+        running.append(n)
+        overlapped.append(len(running) > 1)
+        time.sleep(0.05)
+        running.remove(n)
+
+    register_job_kind("pipeline", pipeline)
+    runner = JobRunner(store)
+
+    try:
+        handles = [runner.submit("pipeline", n=n) for n in range(3)]
+        for handle in handles:
+            assert handle.wait(timeout=10, poll_interval=0.01) == SUCCEEDED
+    finally:
+        runner.stop()
+    assert overlapped == [False, False, False]
+
+
+def test_educate_jobs_store_the_name_of_the_agent_not_its_llm(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    # no workers, so that the job stays queued
+    monkeypatch.setattr(job_runner, "_job_runner", JobRunner(store, max_workers=0))
+    agent = Agent("docs", llm=ChatOpenAI(temperature=0, openai_api_key="sk-secret"))
+    docs = SimpleNamespace(get_urls=lambda: {"0.1": ["https://docs.example.com"]})
+    docs.global_latest_version = "0.1"
+
+    handle = agent.educate("zenml", docs)
+
+    row = store._conn.execute(
+        "SELECT arguments FROM jobs WHERE id = ?", (handle.job_id,)
+    ).fetchone()
+    assert b"sk-secret" not in row[0]
+    arguments = pickle.loads(row[0])
+    assert "agent" not in arguments
+    assert arguments["pipeline_name"] == "docs"
+    assert store.get(handle.job_id)["status"] == QUEUED
+    # the worker of this process runs the pipeline for the same agent
+    assert Agent.for_job("docs") is agent
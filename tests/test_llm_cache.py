@@ -0,0 +1,84 @@
+import langchain
+import pytest
+from langchain.cache import InMemoryCache
+from langchain.chat_models import ChatOpenAI
+from langchain.llms.fake import FakeListLLM
+from langchain.schema import Generation
+from langchain.tools import Tool
+
+# the steps are imported through the pipeline, like the agent does
+import zenml_code.zenml_utils  # noqa: F401
+import llm.cache as llm_cache
+import zenml_code.zenml_utils as zenml_utils
+from agent.agent import Agent
+from agent.tool_registry import ToolRegistry
+from llm.cache import LLMCache, get_llm_cache, set_llm_cache, use_llm_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(langchain, "llm_cache", None)
+    monkeypatch.setattr(llm_cache, "_replaced_cache", None)
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite"))
+    set_llm_cache(cache)
+    return cache
+
+
+def test_the_calls_of_an_agent_llm_without_sampling_are_cached(cache, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    llm_string = Agent("docs", llm=ChatOpenAI(temperature=0)).llm._get_llm_string()
+
+    cache.update("prompt", llm_string, [Generation(text="answer")])
+
+    assert cache.lookup("prompt", llm_string) == [Generation(text="answer")]
+    assert cache.stats()["bypassed"] == 0
+
+
+def test_sampled_calls_bypass_the_cache(cache):
+    llm_string = '{"kwargs": {"temperature": 0.7}}'
+
+    cache.update("prompt", llm_string, [Generation(text="answer")])
+
+    assert cache.lookup("prompt", llm_string) is None
+    assert cache.stats()["bypassed"] == 1
+
+
+def test_disabling_the_llm_cache_restores_the_previous_global_cache(cache):
+    previous = InMemoryCache()
+    langchain.llm_cache = previous
+
+    use_llm_cache(True)
+    use_llm_cache(True)
+    assert langchain.llm_cache is get_llm_cache() is cache
+
+    use_llm_cache(False)
+    assert langchain.llm_cache is previous
+    use_llm_cache(False)
+    assert langchain.llm_cache is previous
+
+
+@pytest.mark.parametrize("cache_llm_calls", [True, False])
+def test_deployments_opt_in_or_out_of_the_llm_cache_on_their_own(
+    cache, monkeypatch, cache_llm_calls
+):
+    llm = FakeListLLM(responses=["unused"])
+    monkeypatch.setattr(
+        zenml_utils,
+        "get_existing_agent",
+        lambda pipeline_name, pipeline_version: Agent(pipeline_name, llm=llm),
+    )
+
+    deployed = Agent("docs", llm=llm).deploy(
+        1,
+        cache_answers=False,
+        cache_llm_calls=cache_llm_calls,
+        tool_registry=ToolRegistry(
+            [Tool(name="docs", description="Search docs.", func=lambda query: "")]
+        ),
+    )
+
+    assert deployed.agent.llm.cache is cache_llm_calls
+    assert deployed.agent.llm_chain.llm.cache is cache_llm_calls
+    # the models of other deployments are left as they are
+    assert llm.cache is None
+    assert langchain.llm_cache is (cache if cache_llm_calls else None)
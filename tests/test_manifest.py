@@ -0,0 +1,81 @@
+import pytest
+
+from embeddings.hashing_embeddings import HashingEmbeddings
+from knowledge.manifest import ManifestEntry, ManifestStore
+from materializers.vector_store_materializer import VectorStoresMaterializer, commit_on_save
+from vector_store.id_map_vector_store import IDMapVectorStore
+
+
+def _entry(content_hash: str) -> ManifestEntry:
+    return ManifestEntry(
+        url="https://docs.example.com/a",
+        content_hash=content_hash,
+        fetched_at=0.0,
+        chunk_ids=[content_hash],
+    )
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return ManifestStore(str(tmp_path / "manifest.sqlite"))
+
+
+def test_staged_changes_are_only_visible_once_committed(manifest):
+    manifest.upsert("docs", {"a": _entry("old")})
+
+    staging = manifest.stage("docs", "docs")
+    manifest.upsert(staging, {"a": _entry("new"), "b": _entry("b")})
+
+    assert manifest.get("docs", "a").content_hash == "old"
+    assert manifest.get("docs", "b") is None
+
+    manifest.commit("docs")
+
+    assert manifest.get("docs", "a").content_hash == "new"
+    assert manifest.get("docs", "b") is not None
+    assert not manifest.has_collection(staging)
+
+
+def test_stage_starts_from_the_base_collection(manifest):
+    manifest.upsert("docs-1", {"a": _entry("a")})
+    manifest.upsert("docs-2@staging", {"stale": _entry("stale")})
+
+    staging = manifest.stage("docs-2", "docs-1")
+
+    assert manifest.get(staging, "a") is not None
+    assert manifest.get(staging, "stale") is None
+    assert manifest.get(manifest.stage("docs-2"), "a") is None
+
+
+def test_materializer_commits_the_manifest_after_saving(manifest, tmp_path):
+    embeddings = HashingEmbeddings()
+    store = IDMapVectorStore(embeddings)
+    store.add_texts(["alpha"], ids=["a-1"])
+    staging = manifest.stage("docs")
+    manifest.upsert(staging, {"a": _entry("a")})
+    commit_on_save(store, manifest, "docs")
+
+    VectorStoresMaterializer(str(tmp_path / "artifact")).save({"1.0": store})
+
+    assert manifest.get("docs", "a") is not None
+    loaded = VectorStoresMaterializer(str(tmp_path / "artifact")).load(dict)
+    assert [d.page_content for d in loaded["1.0"].similarity_search("alpha", k=1)] == ["alpha"]
+
+
+def test_failed_save_leaves_the_manifest_untouched(manifest, monkeypatch, tmp_path):
+    import materializers.vector_store_materializer as materializer
+
+    def fail(*args, **kwargs):
+        raise OSError("artifact store unavailable")
+
+    store = IDMapVectorStore(HashingEmbeddings())
+    store.add_texts(["alpha"], ids=["a-1"])
+    manifest.upsert("docs", {"a": _entry("old")})
+    manifest.upsert(manifest.stage("docs", "docs"), {"a": _entry("new")})
+    commit_on_save(store, manifest, "docs")
+    monkeypatch.setattr(materializer, "save_store", fail)
+
+    with pytest.raises(OSError):
+        VectorStoresMaterializer(str(tmp_path / "artifact")).save({"1.0": store})
+
+    assert manifest.get("docs", "a").content_hash == "old"
@@ -0,0 +1,117 @@
+import pickle
+
+import pytest
+from langchain.llms.fake import FakeListLLM
+
+# the steps are imported through the pipeline, like the agent does
+import zenml_code.zenml_utils as zenml_utils
+from agent.agent import Agent
+from agent.answer_cache import get_answer_cache
+from agent.tool_registry import ToolRegistry
+from embeddings.hashing_embeddings import HashingEmbeddings
+from serving.model_host import ModelHost
+from tools.versioned_vector_store import VersionedVectorStoreTool
+from vector_store.id_map_vector_store import IDMapVectorStore
+from vector_store.lazy_vector_store import LazyVectorStore, StoreResidency
+from vector_store.persistence import load_store, save_store, store_size
+
+
+def _save(directory, texts):
+    store = IDMapVectorStore(HashingEmbeddings())
+    store.add_texts(texts, ids=[f"{directory.name}-{i}" for i in range(len(texts))])
+    save_store(store, str(directory))
+    return str(directory)
+
+
+@pytest.fixture
+def stores(tmp_path):
+    return [
+        _save(tmp_path / name, [f"{name} page {i}" for i in range(200)])
+        for name in ("docs", "blog", "forum")
+    ]
+
+
+def test_residency_evicts_the_least_recently_used_stores(stores):
+    size = store_size(stores[0])
+    residency = StoreResidency(memory_budget=2 * size + size // 2)
+
+    first = residency.get(stores[0], None, "docs")
+    residency.get(stores[1], None, "docs")
+    assert residency.get(stores[0], None, "docs") is first
+    assert residency.fits(stores[2], None) is False
+    residency.get(stores[2], None, "blog")
+
+    assert residency.is_resident(stores[0])
+    assert not residency.is_resident(stores[1])
+    assert residency.resident_bytes <= residency.memory_budget
+    metrics = residency.metrics()
+    assert metrics["docs"]["loads"] == 2
+    assert metrics["docs"]["hits"] == 1
+    assert metrics["docs"]["evictions"] == 1
+    assert metrics["blog"]["resident_stores"] == 1
+
+
+@pytest.fixture
+def host_of(monkeypatch, stores):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    llm = FakeListLLM(responses=["unused"])
+    registry = ToolRegistry(
+        VersionedVectorStoreTool(
+            name=f"tool-{i}",
+            description="Search the docs.",
+            vectorstore=load_store(path),
+            llm=llm,
+            version="1",
+        )
+        for i, path in enumerate(stores)
+    )
+    # like a registry the pipeline stored
+    stored = pickle.dumps(registry)
+    monkeypatch.setattr(
+        zenml_utils,
+        "get_existing_tool_registry",
+        lambda pipeline_name, pipeline_version, cache: pickle.loads(stored),
+    )
+    monkeypatch.setattr(
+        zenml_utils,
+        "get_existing_agent",
+        lambda pipeline_name, pipeline_version: Agent(pipeline_name, llm=llm),
+    )
+
+    def host_of(memory_budget):
+        return ModelHost(memory_budget=memory_budget, cache_llm_calls=False)
+
+    return host_of
+
+
+def test_service_deploys_a_version_once_with_lazy_stores(host_of, stores):
+    host = host_of(memory_budget=10 * store_size(stores[0]))
+
+    service = host.service("docs", 1)
+
+    assert host.service("docs", 1) is service
+    assert service.agent.version == 1
+    tools = service.agent.tool_registry.tools
+    assert all(isinstance(tool.vectorstore, LazyVectorStore) for tool in tools)
+    assert not any(host.residency.is_resident(path) for path in stores)
+
+
+def test_prewarm_stops_at_the_first_store_that_does_not_fit(host_of, stores):
+    size = store_size(stores[0])
+    host = host_of(memory_budget=2 * size + size // 2)
+
+    host.prewarm([("docs", 1)])
+
+    assert [host.residency.is_resident(path) for path in stores] == [True, True, False]
+    assert host.metrics()["docs"]["stores"]["evictions"] == 0
+
+
+def test_versions_deployed_side_by_side_keep_their_own_answer_cache(host_of, stores):
+    host = host_of(memory_budget=10 * store_size(stores[0]))
+
+    first = host.service("docs", 1).agent.answer_cache
+    second = host.service("docs", 2).agent.answer_cache
+
+    assert first is not second
+    assert (first.version, second.version) == (1, 2)
+    assert get_answer_cache("docs", 1) is first
@@ -0,0 +1,28 @@
+import pytest
+
+from embeddings.hashing_embeddings import HashingEmbeddings
+from vector_store.id_map_vector_store import IDMapVectorStore
+from vector_store.persistence import load_store, save_store
+
+TEXTS = [f"page {i} about topic {i % 7}" for i in range(1200)]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "sq8", "ivf"])
+def test_saved_stores_load_memory_mapped_and_stay_writable(tmp_path, index_type):
+    store = IDMapVectorStore(HashingEmbeddings(), index_type=index_type)
+    store.add_texts(TEXTS, ids=[f"chunk-{i}" for i in range(len(TEXTS))])
+    save_store(store, str(tmp_path))
+
+    loaded = load_store(str(tmp_path))
+
+    assert loaded.path == str(tmp_path)
+    assert len(loaded) == len(TEXTS)
+    query = store.embedding.embed_query(TEXTS[3])
+    assert loaded.similarity_search_by_vector(query, k=1)[0].page_content == TEXTS[3]
+
+    # the first modification copies the store into memory
+    loaded.delete(["chunk-3"])
+    assert loaded.path is None
+    assert len(loaded) == len(TEXTS) - 1
+    results = loaded.similarity_search_by_vector(query, k=5)
+    assert TEXTS[3] not in [document.page_content for document in results]
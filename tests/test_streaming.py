@@ -0,0 +1,30 @@
+from agent.streaming import FinalAnswerParser
+
+
+def _feed(tokens):
+    parser = FinalAnswerParser()
+    return [parser.feed(token) for token in tokens], parser
+
+
+def test_final_answer_parser_streams_the_answer():
+    pieces, parser = _feed(
+        ['{"action": "Final', ' Answer", "action_input": "Use ', "a stack", '."}']
+    )
+
+    assert pieces == ["", "Use ", "a stack", "."]
+    assert parser.done
+
+
+def test_final_answer_parser_decodes_escapes_split_across_tokens():
+    pieces, _ = _feed(
+        ['{"action": "Final Answer", "action_input": "a\\', 'nb \\u00', "e9", '"}']
+    )
+
+    assert "".join(pieces) == "a\nb é"
+
+
+def test_final_answer_parser_ignores_tool_actions():
+    pieces, parser = _feed(['{"action": "docs", "action_input": "stacks"}'])
+
+    assert pieces == [""]
+    assert not parser.done
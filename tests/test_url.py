@@ -0,0 +1,30 @@
+import pytest
+
+import knowledge.http_client as http_client
+from knowledge.http_client import HTTPClientError, HTTPResponse, ResponseTooLargeError
+from knowledge.url import URL
+
+
+class _Client:
+    def __init__(self, result):
+        self.result = result
+
+    def get(self, url, headers=None):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+@pytest.mark.parametrize(
+    "result, exists",
+    [
+        (HTTPResponse("https://example.com", 200, {}, b"page"), True),
+        (HTTPResponse("https://example.com", 404, {}, b""), False),
+        (ResponseTooLargeError("too large", 200), True),
+        (ResponseTooLargeError("too large", 404), False),
+        (HTTPClientError("unreachable"), False),
+    ],
+)
+def test_url_exists(monkeypatch, result, exists):
+    monkeypatch.setattr(http_client, "_client", _Client(result))
+    assert URL.url_exists("https://example.com") is exists
@@ -0,0 +1,100 @@
+import pytest
+
+import knowledge.http_client as http_client
+from knowledge.http_client import HTTPClientError, HTTPResponse
+from knowledge.page_store import PageStore
+from knowledge.url import URL
+from steps.web_loading_utils import (
+    ParallelPageLoader,
+    decode_html,
+    failed_document,
+    load_url,
+    load_urls,
+    parse_stored_body,
+)
+
+PAGE = (
+    '<html><body><article class="md-content__inner">'
+    "<h1>Café</h1><p>Crème brûlée</p></article></body></html>"
+)
+
+
+@pytest.mark.parametrize(
+    "body, charset",
+    [
+        (PAGE.encode("utf-8"), None),
+        (PAGE.encode("latin-1"), "ISO-8859-1"),
+        (PAGE.replace("<html>", '<html><meta charset="latin-1">').encode("latin-1"), None),
+        (PAGE.encode("cp1252"), None),
+        (PAGE.encode("utf-8-sig"), "ISO-8859-1"),
+        (PAGE.encode("utf-8"), "no-such-charset"),
+    ],
+)
+def test_decode_html(body, charset):
+    assert "<h1>Café</h1><p>Crème brûlée</p>" in decode_html(body, charset)
+
+
+def test_parse_stored_body_uses_the_declared_charset(tmp_path):
+    page_store = PageStore(str(tmp_path))
+    digest = page_store.put(PAGE.encode("latin-1"), "ISO-8859-1")
+
+    text, sections = parse_stored_body(page_store, digest)
+
+    assert page_store.charset(digest) == "ISO-8859-1"
+    assert text == "Café\n\nCrème brûlée"
+    assert sections == [(0, "Café")]
+
+
+class _UnreachableClient:
+    def get(self, url, headers=None):
+        raise HTTPClientError(f"GET {url} failed")
+
+
+class _NotFoundClient:
+    def get(self, url, headers=None):
+        return HTTPResponse(url, 404, {"content-type": "text/html"}, PAGE.encode())
+
+
+def test_load_url_rejects_error_pages(monkeypatch):
+    monkeypatch.setattr(http_client, "_client", _NotFoundClient())
+
+    with pytest.raises(HTTPClientError):
+        load_url("https://docs.example.com/gone")
+
+
+@pytest.mark.parametrize("keep_failed", [False, True])
+def test_load_urls_keeps_failed_pages_on_request(monkeypatch, tmp_path, keep_failed):
+    monkeypatch.setattr(http_client, "_client", _UnreachableClient())
+    page_store = PageStore(str(tmp_path))
+    digest = page_store.put(PAGE.encode("utf-8"))
+    urls = [
+        URL("https://docs.example.com/a", content_hash=digest),
+        URL("https://docs.example.com/b"),
+    ]
+
+    documents = load_urls(urls, page_store, keep_failed=keep_failed)
+
+    assert documents[0].page_content == "Café\n\nCrème brûlée"
+    if keep_failed:
+        assert documents[1] == failed_document("https://docs.example.com/b")
+    else:
+        assert len(documents) == 1
+
+
+def test_parallel_page_loader_parses_pages_in_worker_processes(monkeypatch, tmp_path):
+    monkeypatch.setattr(http_client, "_client", _UnreachableClient())
+    page_store = PageStore(str(tmp_path))
+    digest = page_store.put(PAGE.encode("utf-8"))
+    urls = [
+        URL("https://docs.example.com/b"),
+        URL("https://docs.example.com/a", content_hash=digest),
+    ]
+
+    loader = ParallelPageLoader(max_workers=2, page_store=page_store)
+    documents = loader.load(urls, keep_failed=True)
+
+    assert documents[0] == failed_document("https://docs.example.com/b")
+    assert documents[1].page_content == "Café\n\nCrème brûlée"
+    # the worker stored the text next to the body
+    text, _ = parse_stored_body(page_store, digest)
+    assert text == documents[1].page_content
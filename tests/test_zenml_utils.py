@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+from zenml.enums import ExecutionStatus
+
+import zenml_code.zenml_utils as zenml_utils
+import agent.answer_cache as answer_cache
+from agent.answer_cache import AnswerCache, set_answer_cache
+from embeddings.hashing_embeddings import HashingEmbeddings
+from zenml_code.zenml_utils import ZenMLMetadata
+
+
+class _Output:
+    def __init__(self, value):
+        self.value = value
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return self.value
+
+
+def _run(value, status=ExecutionStatus.COMPLETED):
+    return SimpleNamespace(
+        id=uuid4(),
+        status=status,
+        steps={"get_tools": SimpleNamespace(output=_Output(value))},
+    )
+
+
+class _Client:
+    runs = []
+    queries = 0
+
+    def get_pipeline(self, name_id_or_prefix, version=None):
+        _Client.queries += 1
+        return SimpleNamespace(runs=list(_Client.runs))
+
+
+def test_last_run_is_looked_up_again_after_the_ttl(monkeypatch):
+    monkeypatch.setattr(zenml_utils, "Client", _Client)
+    first = _run("first tools")
+    _Client.runs, _Client.queries = [first], 0
+    clock = [100.0]
+    monkeypatch.setattr(zenml_utils.time, "monotonic", lambda: clock[0])
+    metadata = ZenMLMetadata(last_run_ttl=60.0)
+
+    assert metadata.step_output("docs", "get_tools") == "first tools"
+    # another process runs the pipeline
+    _Client.runs = [_run("second tools"), first]
+    clock[0] += 30
+    assert metadata.step_output("docs", "get_tools") == "first tools"
+    assert _Client.queries == 1
+
+    clock[0] += 31
+    assert metadata.step_output("docs", "get_tools") == "second tools"
+    assert _Client.queries == 2
+    assert not any(key[2] == first.id for key in metadata._outputs)
+
+
+def test_outputs_of_a_run_that_is_still_the_last_stay_cached(monkeypatch):
+    monkeypatch.setattr(zenml_utils, "Client", _Client)
+    run = _run("tools")
+    _Client.runs, _Client.queries = [run], 0
+    metadata = ZenMLMetadata(last_run_ttl=0.0)
+
+    assert metadata.step_output("docs", "get_tools") == "tools"
+    assert metadata.step_output("docs", "get_tools") == "tools"
+
+    assert _Client.queries == 2
+    assert run.steps["get_tools"].output.loads == 1
+
+
+def test_steps_of_a_running_pipeline_get_the_tools_of_the_last_completed_run(
+    monkeypatch,
+):
+    monkeypatch.setattr(zenml_utils, "Client", _Client)
+    # the run of the step, whose get_tools step hasn't run yet
+    current = _run(None, status=ExecutionStatus.RUNNING)
+    _Client.runs = [current, _run("failed tools", ExecutionStatus.FAILED), _run("tools")]
+    metadata = ZenMLMetadata()
+
+    assert metadata.step_output("docs", "get_tools") == "tools"
+    assert current.steps["get_tools"].output.loads == 0
+
+
+def _cache_answer(agent_name: str, version: int) -> AnswerCache:
+    cache = AnswerCache(HashingEmbeddings())
+    cache.bind(version)
+    cache.put("How do I deploy?", "Use a stack.", version)
+    set_answer_cache(agent_name, version, cache)
+    return cache
+
+
+def test_new_runs_drop_the_answers_of_the_agent(monkeypatch):
+    monkeypatch.setattr(zenml_utils, "Client", _Client)
+    _Client.runs = [_run("first tools")]
+    metadata = ZenMLMetadata(last_run_ttl=0.0)
+    metadata.step_output("docs", "get_tools")
+    deployed = _cache_answer("docs", 1)
+    other = _cache_answer("blog", 1)
+
+    # another process runs the pipeline
+    _Client.runs = [_run("second tools")]
+    metadata.step_output("docs", "get_tools")
+
+    assert len(deployed) == 0
+    assert ("docs", 1) not in answer_cache._answer_caches
+    assert len(other) == 1
+
+    metadata.invalidate("blog")
+
+    assert len(other) == 0
@@ -1,15 +1,61 @@
-from typing import List
+import asyncio
+from typing import Optional
+from langchain.callbacks.manager import AsyncCallbackManagerForToolRun
+from langchain.load.dump import dumpd
 from langchain.tools import VectorStoreQATool
 
+from knowledge.manifest import ManifestStore
 from policies.base_unknown_policy import UnknownPolicy
 from policies.ignore import IgnorePolicy
+from vector_store.search_executor import get_search_executor
 
 class VersionedVectorStoreTool(VectorStoreQATool):
-    urls: List[str]
     version: str
+    # reference to the store that records the URLs indexed into the vector
+    # store under the name of the tool, along with the hash of their content
+    # and the ids of their chunks
+    manifest: Optional[ManifestStore] = None
     # TODO should this be a UnknownPolicy instead?
     # that way we can pass in params easily, for example
     # slack bot info, etc.
     # OTOH, if we keep it this way, people would first
     # initialize the policy -> lot of boilerplate code
-    unknown_policy: UnknownPolicy = IgnorePolicy()
\ No newline at end of file
+    unknown_policy: UnknownPolicy = IgnorePolicy()
+
+    async def _arun(
+        self,
+        query: str,
+        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+    ) -> str:
+        """Use the tool asynchronously.
+
+        The vector search runs in the search thread pool and the LLM call
+        of the QA chain is awaited, instead of running the whole tool in
+        a thread like langchain does by default.
+        """
+        from langchain.chains.retrieval_qa.base import RetrievalQA
+
+        chain = RetrievalQA.from_chain_type(
+            self.llm, retriever=self.vectorstore.as_retriever()
+        )
+        retriever_run = None
+        if run_manager is not None:
+            # report the retrieval to the callbacks, like streaming handlers
+            retriever_run = await run_manager.get_child().on_retriever_start(
+                dumpd(chain.retriever), query
+            )
+        try:
+            documents = await asyncio.get_running_loop().run_in_executor(
+                get_search_executor(), chain.retriever.get_relevant_documents, query
+            )
+        except Exception as e:
+            if retriever_run is not None:
+                await retriever_run.on_retriever_error(e)
+            raise
+        if retriever_run is not None:
+            await retriever_run.on_retriever_end(documents)
+        return await chain.combine_documents_chain.arun(
+            input_documents=documents,
+            question=query,
+            callbacks=run_manager.get_child() if run_manager else None,
+        )
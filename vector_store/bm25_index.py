@@ -0,0 +1,213 @@
+import hashlib
+import os
+import re
+from collections import Counter
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# terms in more than this fraction of the documents, like "the" or the
+# name of the project, barely change the ranking but have the longest
+# postings, so they are skipped at query time unless the index is tiny
+MAX_DOCUMENT_FREQUENCY = 0.5
+MIN_DOCUMENTS_TO_SKIP = 100
+
+# words, identifiers like enable_cache or zenml.steps.StepContext, and CLI
+# flags like --enable-cache, without their leading dashes
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+(?:[.\-/:][A-Za-z0-9_]+)*")
+PART_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+ARRAYS = (
+    "term_hashes",
+    "idf",
+    "offsets",
+    "postings_docs",
+    "postings_tfs",
+    "doc_norms",
+    "doc_keys",
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a text into lowercase terms for BM25.
+
+    Identifiers are kept whole so that exact matches score highest, and
+    are also split on punctuation, underscores and camel case, so that
+    `StepContext` matches "step context" and the other way around.
+
+    Args:
+        text: The text to tokenize.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text):
+        terms.append(token.lower())
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(part.lower() for part in parts)
+    return terms
+
+
+def _term_hash(term: str) -> int:
+    """Returns the int64 hash a term is stored under."""
+    return int.from_bytes(
+        hashlib.blake2b(term.encode(), digest_size=8).digest(), "little", signed=True
+    )
+
+
+class BM25Index:
+    """An in-process inverted index scoring chunks with BM25.
+
+    The index is a set of flat NumPy arrays: the sorted hashes of the terms
+    with their IDF, and for each term a slice of the postings arrays
+    holding the documents it appears in and how often. Looking up a term
+    is a binary search, and scoring a query adds up the contributions of
+    the postings of its terms with vectorized NumPy operations. The arrays
+    can be saved and memory-mapped like the vector index.
+
+    Documents are identified by the same int64 keys as in the vector
+    index, so results of both can be fused.
+    """
+
+    def __init__(
+        self,
+        term_hashes: np.ndarray,
+        idf: np.ndarray,
+        offsets: np.ndarray,
+        postings_docs: np.ndarray,
+        postings_tfs: np.ndarray,
+        doc_norms: np.ndarray,
+        doc_keys: np.ndarray,
+        k1: float = 1.2,
+    ):
+        """Create a BM25Index object. Use `build` or `load` instead.
+
+        Args:
+            term_hashes: The sorted hashes of the terms.
+            idf: The inverse document frequency of each term.
+            offsets: The start of the postings of each term, plus the end.
+            postings_docs: The documents of the postings.
+            postings_tfs: The term frequencies of the postings.
+            doc_norms: The length normalization of each document.
+            doc_keys: The key of each document.
+            k1: The term frequency saturation of BM25.
+        """
+        self.term_hashes = term_hashes
+        self.idf = idf
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.doc_norms = doc_norms
+        self.doc_keys = doc_keys
+        self.k1 = k1
+
+    def __len__(self) -> int:
+        return len(self.doc_keys)
+
+    @classmethod
+    def build(
+        cls, keys: Sequence[int], texts: Iterable[str], k1: float = 1.2, b: float = 0.75
+    ) -> "BM25Index":
+        """Build an index over some documents.
+
+        Args:
+            keys: The key of each document.
+            texts: The text of each document.
+            k1: The term frequency saturation of BM25.
+            b: How much BM25 normalizes by document length.
+
+        Returns:
+            The index.
+        """
+        hashes: List[int] = []
+        docs: List[int] = []
+        tfs: List[int] = []
+        lengths: List[int] = []
+        for doc, text in enumerate(texts):
+            terms = tokenize(text)
+            lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                hashes.append(_term_hash(term))
+                docs.append(doc)
+                tfs.append(count)
+
+        hash_array = np.array(hashes, dtype=np.int64)
+        order = np.lexsort((np.array(docs, dtype=np.int64), hash_array))
+        hash_array = hash_array[order]
+        term_hashes, starts, document_frequency = np.unique(
+            hash_array, return_index=True, return_counts=True
+        )
+        num_docs = len(lengths)
+        idf = np.log1p((num_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+        lengths_array = np.array(lengths, dtype=np.float32)
+        average_length = lengths_array.mean() if num_docs else 1.0
+        return cls(
+            term_hashes=term_hashes,
+            idf=idf.astype(np.float32),
+            offsets=np.append(starts, len(hash_array)).astype(np.int64),
+            postings_docs=np.array(docs, dtype=np.int32)[order],
+            postings_tfs=np.array(tfs, dtype=np.float32)[order],
+            doc_norms=(k1 * (1 - b + b * lengths_array / max(average_length, 1.0))).astype(
+                np.float32
+            ),
+            doc_keys=np.array(keys, dtype=np.int64),
+            k1=k1,
+        )
+
+    def mask(self, keys: np.ndarray) -> np.ndarray:
+        """Returns a boolean mask of the documents whose keys are in `keys`."""
+        return np.isin(self.doc_keys, keys)
+
+    def search(
+        self, query: str, k: int = 4, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the keys and scores of the best matching documents.
+
+        Args:
+            query: The query.
+            k: The maximum number of documents to return.
+            mask: If set, only the documents it selects are returned.
+
+        Returns:
+            The keys of the documents and their scores, best first.
+            Documents that match no term of the query are not returned.
+        """
+        num_docs = len(self.doc_keys)
+        max_postings = (
+            MAX_DOCUMENT_FREQUENCY * num_docs if num_docs >= MIN_DOCUMENTS_TO_SKIP else num_docs
+        )
+        scores = np.zeros(num_docs, dtype=np.float32)
+        for term_hash in {_term_hash(term) for term in tokenize(query)}:
+            i = int(np.searchsorted(self.term_hashes, term_hash))
+            if i == len(self.term_hashes) or self.term_hashes[i] != term_hash:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            if end - start > max_postings:
+                continue
+            docs = self.postings_docs[start:end]
+            tfs = self.postings_tfs[start:end]
+            scores[docs] += self.idf[i] * tfs * (self.k1 + 1) / (tfs + self.doc_norms[docs])
+
+        if mask is not None:
+            scores[~mask] = 0
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return np.asarray(self.doc_keys[matches]), scores[matches]
+
+    def save(self, directory: str) -> None:
+        """Write the arrays of the index to a directory."""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        np.save(os.path.join(directory, "k1.npy"), np.float32(self.k1))
+
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index":
+        """Memory-map an index written by `save`."""
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in ARRAYS
+        }
+        k1 = float(np.load(os.path.join(directory, "k1.npy")))
+        return cls(k1=k1, **arrays)
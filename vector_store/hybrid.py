@@ -0,0 +1,76 @@
+from typing import Any, ClassVar, Collection, Dict, List, Sequence
+
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain.docstore.document import Document
+from langchain.vectorstores.base import VectorStoreRetriever
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[int]], k: int, rrf_k: int = 60
+) -> List[int]:
+    """Fuse rankings of keys with reciprocal rank fusion.
+
+    Every key scores the sum of 1 / (rrf_k + rank) over the rankings it
+    appears in, which favours keys ranked well by several retrievers
+    without having to make their scores comparable.
+
+    Args:
+        rankings: The rankings to fuse, best key first.
+        k: The number of keys to return.
+        rrf_k: The constant damping the weight of the top ranks.
+
+    Returns:
+        The k best keys.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.__getitem__, reverse=True)[:k]
+
+
+class HybridRetriever(VectorStoreRetriever):
+    """A retriever that adds "hybrid" search to the search types of a vector store.
+
+    Hybrid search fuses dense results with BM25 results, which is what
+    finds exact identifiers, like class names and CLI flags, that
+    embeddings tend to miss. The vector store has to implement
+    `hybrid_search`.
+    """
+
+    allowed_search_types: ClassVar[Collection[str]] = (
+        "similarity",
+        "similarity_score_threshold",
+        "mmr",
+        "hybrid",
+    )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if self.search_type == "hybrid":
+            return self.vectorstore.hybrid_search(query, **self.search_kwargs)
+        return super()._get_relevant_documents(query, run_manager=run_manager)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if self.search_type == "hybrid":
+            return self.vectorstore.hybrid_search(query, **self.search_kwargs)
+        return await super()._aget_relevant_documents(query, run_manager=run_manager)
+
+
+def as_hybrid_retriever(vectorstore: Any, **kwargs: Any) -> HybridRetriever:
+    """Returns a HybridRetriever of a vector store, searching with "hybrid" by default.
+
+    Args:
+        vectorstore: The vector store, which implements `hybrid_search`.
+        kwargs: The arguments of `VectorStore.as_retriever`.
+    """
+    tags = kwargs.pop("tags", None) or []
+    tags.extend(vectorstore._get_retriever_tags())
+    kwargs.setdefault("search_type", "hybrid")
+    return HybridRetriever(vectorstore=vectorstore, **kwargs, tags=tags)
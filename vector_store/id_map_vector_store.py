@@ -0,0 +1,390 @@
+import hashlib
+import os
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores.base import VectorStore, VectorStoreRetriever
+
+from vector_store.bm25_index import BM25Index
+from vector_store.hybrid import as_hybrid_retriever, reciprocal_rank_fusion
+from vector_store.index_types import (
+    MIN_TRAINING_POINTS,
+    check_index_type,
+    create_index,
+    is_fallback,
+    search_parameters,
+)
+
+
+def chunk_key(chunk_id: str) -> int:
+    """Returns the int64 key FAISS stores a chunk under.
+
+    The key is derived from the chunk id alone, so the same chunk has the
+    same key in every index and across runs.
+    """
+    digest = hashlib.blake2b(chunk_id.encode(), digest_size=8).digest()
+    # keep the key positive, FAISS uses -1 for missing results
+    return int.from_bytes(digest, "little") & 0x7FFFFFFFFFFFFFFF
+
+
+class IDMapVectorStore(VectorStore):
+    """A FAISS vector store addressed by stable chunk ids.
+
+    The index is wrapped in an `IndexIDMap2`, so vectors are stored under a
+    key derived from their chunk id rather than under their position. That
+    makes `upsert` and `delete` real in-place operations on the index, and
+    lets a store be updated with the delta of a change instead of being
+    rebuilt.
+
+    The index can be exact ("flat") or, for large corpora, partitioned or
+    compressed ("ivf", "ivfpq", "sq8"). These are trained on the vectors of
+    the first upsert, and a store that starts out too small to train them
+    uses a flat index until it has grown enough.
+
+    A BM25 index of the chunks can be built next to the vector index, for
+    hybrid search. It is dropped when the chunks change, and has to be
+    built again with `build_bm25`.
+
+    A store opened with `persistence.load_store` is backed by memory-mapped
+    files. Such a store pickles to a reference to its files instead of its
+    contents, and is copied into memory on its first modification.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        dim: Optional[int] = None,
+        index_type: str = "flat",
+        nprobe: int = 16,
+    ):
+        """Create an IDMapVectorStore object.
+
+        Args:
+            embedding: The embeddings used to embed queries and texts.
+            dim: The number of dimensions of the vectors of a flat index.
+                If None, it is taken from the first vectors that are added.
+                Other index types are always created on the first upsert.
+            index_type: The type of the index, one of "flat", "ivf",
+                "ivfpq" and "sq8".
+            nprobe: The number of clusters an IVF index scans per query.
+        """
+        check_index_type(index_type)
+        self.embedding = embedding
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.index = None
+        self.docstore: Mapping[int, Document] = {}
+        self.chunk_ids: Mapping[int, str] = {}
+        self.bm25: Optional[BM25Index] = None
+        # the local directory and artifact URI of the files backing the store
+        self.path: Optional[str] = None
+        self.uri: Optional[str] = None
+        if dim is not None and index_type == "flat":
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+    def _train(self, vectors: np.ndarray) -> None:
+        """Create the index from the vectors of an upsert.
+
+        The vectors of a flat index standing in for a trained one are
+        moved into the new index, and take part in its training.
+        """
+        if self.index is None:
+            self.index = create_index(self.index_type, vectors)
+            return
+        keys = faiss.vector_to_array(self.index.id_map)
+        existing = self.index.index.reconstruct_n(0, self.index.ntotal)
+        self.index = create_index(self.index_type, np.vstack([existing, vectors]))
+        self.index.add_with_ids(existing, keys)
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self.docstore)
+
+    def __reduce_ex__(self, protocol: int) -> Any:
+        if self.path is not None:
+            from vector_store.persistence import open_store
+
+            # stores backed by files only pickle a reference to them
+            return open_store, (self.path, self.uri)
+        return super().__reduce_ex__(protocol)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        if self.path is not None:
+            return {"path": self.path, "uri": self.uri}
+        state = self.__dict__.copy()
+        if self.index is not None:
+            state["index"] = faiss.serialize_index(self.index)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        if "index" not in state:
+            # a reference to files pickled before open_store existed
+            from vector_store.persistence import load_store, resolve
+
+            state = load_store(*resolve(state["path"], state["uri"])).__dict__
+        elif state["index"] is not None:
+            state["index"] = faiss.deserialize_index(state["index"])
+        # stores pickled before index types were configurable
+        state.setdefault("index_type", "flat")
+        state.setdefault("nprobe", 16)
+        state.setdefault("bm25", None)
+        self.__dict__.update(state)
+
+    def _make_writable(self) -> None:
+        """Copy a store backed by read-only files into memory."""
+        if self.path is None:
+            return
+        if self.index is not None:
+            from vector_store.persistence import INDEX_FILE
+
+            # memory-mapped IVF lists can't be cloned, read the file again
+            self.index = faiss.read_index(os.path.join(self.path, INDEX_FILE))
+        self.docstore = dict(self.docstore)
+        self.chunk_ids = dict(self.chunk_ids)
+        self.path = None
+        self.uri = None
+
+    def copy(self) -> "IDMapVectorStore":
+        """Returns an independent copy of the store."""
+        store = type(self)(self.embedding, index_type=self.index_type, nprobe=self.nprobe)
+        if self.index is not None and self.path is not None:
+            from vector_store.persistence import INDEX_FILE
+
+            store.index = faiss.read_index(os.path.join(self.path, INDEX_FILE))
+        elif self.index is not None:
+            store.index = faiss.clone_index(self.index)
+        store.docstore = dict(self.docstore)
+        store.chunk_ids = dict(self.chunk_ids)
+        # the BM25 index is never modified, only replaced
+        store.bm25 = self.bm25
+        return store
+
+    def upsert(
+        self, ids: Sequence[str], vectors: np.ndarray, documents: Sequence[Document]
+    ) -> None:
+        """Add chunks, replacing any chunks with the same ids.
+
+        Args:
+            ids: The ids of the chunks.
+            vectors: A matrix with the vector of each chunk.
+            documents: The documents of the chunks.
+        """
+        self._make_writable()
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.index is None or (
+            is_fallback(self.index, self.index_type)
+            and self.index.ntotal + len(vectors) >= MIN_TRAINING_POINTS[self.index_type]
+        ):
+            self._train(vectors)
+        keys = np.array([chunk_key(chunk_id) for chunk_id in ids], dtype=np.int64)
+        self._remove_keys(keys)
+        self.index.add_with_ids(vectors, keys)
+        self.bm25 = None
+        for key, chunk_id, document in zip(keys.tolist(), ids, documents):
+            self.docstore[key] = document
+            self.chunk_ids[key] = chunk_id
+
+    def _remove_keys(self, keys: np.ndarray) -> None:
+        """Remove the vectors and documents stored under some keys."""
+        present = np.array([key for key in keys.tolist() if key in self.docstore], dtype=np.int64)
+        if len(present) == 0:
+            return
+        self.index.remove_ids(present)
+        self.bm25 = None
+        for key in present.tolist():
+            del self.docstore[key]
+            del self.chunk_ids[key]
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete chunks by id. Unknown ids are ignored.
+
+        Args:
+            ids: The ids of the chunks to delete.
+
+        Returns:
+            True once the chunks are deleted.
+        """
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        self._make_writable()
+        if self.index is not None:
+            self._remove_keys(np.array([chunk_key(i) for i in ids], dtype=np.int64))
+        return True
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Embed texts and upsert them.
+
+        Args:
+            texts: The texts to add.
+            metadatas: The metadata of each text.
+            ids: The ids of the chunks. Defaults to the hash of each text.
+
+        Returns:
+            The ids of the added chunks.
+        """
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [hashlib.sha256(text.encode()).hexdigest() for text in texts]
+        if texts:
+            vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+            documents = [
+                Document(page_content=text, metadata=metadata)
+                for text, metadata in zip(texts, metadatas)
+            ]
+            self.upsert(ids, vectors, documents)
+        return ids
+
+    def _search(
+        self,
+        embedding: List[float],
+        k: int,
+        nprobe: Optional[int] = None,
+        selector: Optional[faiss.IDSelector] = None,
+    ) -> List[Tuple[int, float]]:
+        """Returns the keys of the chunks closest to a vector with their L2 distance."""
+        if self.index is None or not self.docstore:
+            return []
+        vector = np.asarray([embedding], dtype=np.float32)
+        params = search_parameters(self.index, nprobe or self.nprobe, selector)
+        distances, keys = self.index.search(vector, k, params=params)
+        return [
+            (key, float(distance))
+            for key, distance in zip(keys[0].tolist(), distances[0].tolist())
+            if key != -1
+        ]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        nprobe: Optional[int] = None,
+        selector: Optional[faiss.IDSelector] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        """Returns the documents closest to a vector along with their L2 distance.
+
+        Args:
+            embedding: The vector to search with.
+            k: The number of documents to return.
+            nprobe: The number of clusters an IVF index scans. Defaults to
+                the nprobe of the store.
+            selector: If set, only the chunks whose keys it selects are searched.
+        """
+        return [
+            (self.docstore[key], distance)
+            for key, distance in self._search(embedding, k, nprobe, selector)
+        ]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score_by_vector(
+                embedding, k, **kwargs
+            )
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k, **kwargs
+        )
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(
+            self.embedding.embed_query(query), k, **kwargs
+        )
+
+    def _similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        # FAISS returns squared L2 distances, which lie in [0, 4] for
+        # normalized vectors, map them to a [0, 1] relevance
+        return [
+            (document, 1.0 - distance / 4)
+            for document, distance in self.similarity_search_with_score(query, k, **kwargs)
+        ]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "IDMapVectorStore":
+        """Create a store holding some texts.
+
+        Args:
+            texts: The texts to add.
+            embedding: The embeddings used to embed queries and texts.
+            metadatas: The metadata of each text.
+            ids: The ids of the chunks.
+
+        Returns:
+            The store.
+        """
+        store = cls(embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def build_bm25(self) -> None:
+        """Build the BM25 index of the chunks of the store."""
+        keys = list(self.docstore)
+        self.bm25 = BM25Index.build(keys, (self.docstore[key].page_content for key in keys))
+
+    def hybrid_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        rrf_k: int = 60,
+        nprobe: Optional[int] = None,
+        selector: Optional[faiss.IDSelector] = None,
+        mask: Optional[np.ndarray] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        """Returns the documents that best match a query by vector and BM25 search.
+
+        The top `fetch_k` results of both searches are fused with reciprocal
+        rank fusion. Without a BM25 index, this is a similarity search.
+
+        Args:
+            query: The query.
+            k: The number of documents to return.
+            fetch_k: The number of results of each search to fuse.
+            rrf_k: The rank constant of reciprocal rank fusion.
+            nprobe: The number of clusters an IVF index scans.
+            selector: If set, only the chunks whose keys it selects are searched
+                by vector.
+            mask: If set, only the chunks whose BM25 documents it selects are
+                searched by BM25.
+        """
+        embedding = self.embedding.embed_query(query)
+        dense = [key for key, _ in self._search(embedding, fetch_k, nprobe, selector)]
+        if self.bm25 is None:
+            return [self.docstore[key] for key in dense[:k]]
+        sparse, _ = self.bm25.search(query, fetch_k, mask)
+        keys = reciprocal_rank_fusion([dense, sparse.tolist()], k, rrf_k)
+        return [self.docstore[key] for key in keys]
+
+    def as_retriever(self, **kwargs: Any) -> VectorStoreRetriever:
+        """Returns a retriever of the store, using hybrid search if it has a BM25 index."""
+        if self.bm25 is None:
+            return super().as_retriever(**kwargs)
+        return as_hybrid_retriever(self, **kwargs)
@@ -0,0 +1,138 @@
+from logging import getLogger
+from typing import Optional
+
+import faiss
+import numpy as np
+
+logger = getLogger(__name__)
+
+# "flat" searches exhaustively and exactly. "ivf" partitions the vectors
+# into clusters and only scans the `nprobe` closest ones at query time.
+# "ivfpq" additionally compresses the vectors with product quantization,
+# and "sq8" scans every vector but stores each dimension in one byte.
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "sq8")
+
+# below these sizes a trained index is not worth it, or can't be trained
+# well: k-means wants at least 39 points per centroid, and product
+# quantization trains 256 centroids per sub-vector
+MIN_TRAINING_POINTS = {"flat": 0, "ivf": 1024, "ivfpq": 39 * 256, "sq8": 1}
+
+# the number of training points sampled per IVF cluster, and in total
+TRAINING_POINTS_PER_CLUSTER = 64
+MAX_TRAINING_POINTS = 100_000
+
+
+def check_index_type(index_type: str) -> None:
+    """Raise a ValueError if an index type is not supported."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(
+            f"Unknown index type {index_type}, expected one of {', '.join(INDEX_TYPES)}."
+        )
+
+
+def num_clusters(num_vectors: int) -> int:
+    """Returns the number of IVF clusters for an index of some size."""
+    return max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+
+
+def num_subquantizers(dim: int) -> int:
+    """Returns the number of PQ sub-vectors, about one per 8 dimensions.
+
+    The number has to divide the number of dimensions.
+    """
+    m = max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def training_sample(vectors: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    """Returns a random sample of vectors to train an index with.
+
+    The sample is drawn with a fixed seed, so the same vectors always
+    produce the same index.
+
+    Args:
+        vectors: The vectors to sample from.
+        size: The size of the sample.
+        seed: The seed of the random generator.
+    """
+    if len(vectors) <= size:
+        return vectors
+    rows = np.random.default_rng(seed).choice(len(vectors), size, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def create_index(index_type: str, vectors: np.ndarray) -> faiss.Index:
+    """Create an empty index for vectors addressed by int64 keys, trained on a sample.
+
+    IVF indexes store the keys of their vectors themselves. The others are
+    wrapped in an IndexIDMap2, which needs an index that compacts itself
+    on removal. If there are too few vectors to train the requested type,
+    a flat index is created instead.
+
+    Args:
+        index_type: One of INDEX_TYPES.
+        vectors: The vectors the index is created for, used for training.
+
+    Returns:
+        The trained, empty index.
+    """
+    check_index_type(index_type)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    if num_vectors < MIN_TRAINING_POINTS[index_type]:
+        logger.info(
+            f"Only {num_vectors} vectors to train a {index_type} index with, "
+            "creating a flat index instead."
+        )
+        index_type = "flat"
+
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    if index_type == "sq8":
+        index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit))
+        sample_size = MAX_TRAINING_POINTS
+    else:
+        nlist = num_clusters(num_vectors)
+        if index_type == "ivf":
+            index = faiss.index_factory(dim, f"IVF{nlist},Flat")
+            sample_size = TRAINING_POINTS_PER_CLUSTER * nlist
+        else:
+            index = faiss.index_factory(dim, f"IVF{nlist},PQ{num_subquantizers(dim)}")
+            sample_size = max(TRAINING_POINTS_PER_CLUSTER * nlist, 39 * 256)
+    index.train(training_sample(vectors, min(sample_size, MAX_TRAINING_POINTS)))
+    return index
+
+
+def is_fallback(index: faiss.Index, index_type: str) -> bool:
+    """Returns whether an index is a flat index standing in for a trained one."""
+    return index_type != "flat" and _is_flat(index)
+
+
+def _is_flat(index: faiss.Index) -> bool:
+    """Returns whether an index is an IndexIDMap2 around an IndexFlat."""
+    if not isinstance(index, faiss.IndexIDMap2):
+        return False
+    return isinstance(faiss.downcast_index(index.index), faiss.IndexFlat)
+
+
+def search_parameters(
+    index: faiss.Index,
+    nprobe: Optional[int],
+    selector: Optional[faiss.IDSelector] = None,
+):
+    """Returns the search parameters of a query, or None if it needs none.
+
+    Args:
+        index: The index to search.
+        nprobe: The number of clusters to scan, for IVF indexes.
+        selector: If set, restricts the search to the keys it selects.
+    """
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        if selector is None:
+            return faiss.SearchParametersIVF(nprobe=nprobe)
+        return faiss.SearchParametersIVF(nprobe=nprobe, sel=selector)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
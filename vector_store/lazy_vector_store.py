@@ -0,0 +1,253 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores.base import VectorStore, VectorStoreRetriever
+
+from vector_store.hybrid import as_hybrid_retriever
+from vector_store.persistence import EMBEDDING_FILE, load_store, resolve, store_size
+
+
+class ResidencyMetrics:
+    """The counters of the stores of one owner in a StoreResidency."""
+
+    def __init__(self):
+        """Create a ResidencyMetrics object."""
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        self.resident_bytes = 0
+        self.resident_stores = 0
+
+    def to_dict(self) -> Dict[str, float]:
+        """Returns the counters as a dict."""
+        return dict(self.__dict__)
+
+
+class StoreResidency:
+    """The file-backed vector stores loaded in a process, under a memory budget.
+
+    Stores are loaded on first use and kept in least recently used order.
+    When the stores loaded take more than `memory_budget` bytes, as
+    measured by the size of their files, the least recently used ones are
+    dropped, and loaded again if they are used again. Every store has an
+    owner, like the agent it belongs to, and loads, hits and evictions are
+    counted per owner.
+    """
+
+    def __init__(self, memory_budget: int, in_memory: bool = False):
+        """Create a StoreResidency object.
+
+        Args:
+            memory_budget: The maximum size of the loaded stores, in bytes.
+                A store larger than the budget is still loaded, alone.
+            in_memory: Whether stores are read into memory instead of being
+                memory-mapped, which makes the first searches faster and the
+                budget a hard limit rather than one the page cache enforces.
+        """
+        self.memory_budget = memory_budget
+        self.in_memory = in_memory
+        self._lock = threading.Lock()
+        # by path, in least recently used order, with their owner and size
+        self._stores: "OrderedDict[str, Tuple[Any, str, int]]" = OrderedDict()
+        # held while a store is loaded, so that it is loaded once
+        self._loading: Dict[str, threading.Lock] = {}
+        self._metrics: Dict[str, ResidencyMetrics] = {}
+        self.resident_bytes = 0
+
+    def _owner_metrics(self, owner: str) -> ResidencyMetrics:
+        """Returns the metrics of an owner. Must be called with the lock held."""
+        if owner not in self._metrics:
+            self._metrics[owner] = ResidencyMetrics()
+        return self._metrics[owner]
+
+    def is_resident(self, path: str) -> bool:
+        """Whether the store in a directory is loaded."""
+        with self._lock:
+            return path in self._stores
+
+    def fits(self, path: str, uri: Optional[str]) -> bool:
+        """Whether a store can be loaded without evicting the loaded ones.
+
+        Args:
+            path: The local directory the store was loaded from.
+            uri: The artifact URI the store was copied from, if any.
+        """
+        local_path, _ = resolve(path, uri)
+        size = store_size(local_path)
+        with self._lock:
+            return self.resident_bytes + size <= self.memory_budget
+
+    def get(self, path: str, uri: Optional[str], owner: str) -> Any:
+        """Returns a store, loading it if it isn't loaded.
+
+        Args:
+            path: The local directory the store was loaded from.
+            uri: The artifact URI the store was copied from, if any.
+            owner: The owner the store is accounted to.
+        """
+        with self._lock:
+            entry = self._stores.get(path)
+            if entry is not None:
+                self._stores.move_to_end(path)
+                self._owner_metrics(owner).hits += 1
+                return entry[0]
+            loading = self._loading.setdefault(path, threading.Lock())
+
+        with loading:
+            # another thread may have loaded it while we waited
+            with self._lock:
+                entry = self._stores.get(path)
+                if entry is not None:
+                    self._stores.move_to_end(path)
+                    self._owner_metrics(owner).hits += 1
+                    return entry[0]
+            start = time.perf_counter()
+            local_path, uri = resolve(path, uri)
+            store = load_store(local_path, uri)
+            if self.in_memory:
+                store._make_writable()
+            size = store_size(local_path)
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._stores[path] = (store, owner, size)
+                self.resident_bytes += size
+                metrics = self._owner_metrics(owner)
+                metrics.loads += 1
+                metrics.load_seconds += seconds
+                metrics.resident_bytes += size
+                metrics.resident_stores += 1
+                self._evict()
+                self._loading.pop(path, None)
+            return store
+
+    def _evict(self) -> None:
+        """Drop stores until the loaded ones fit. Must be called with the lock held."""
+        # the most recently used store is kept even if it alone is too large
+        while self.resident_bytes > self.memory_budget and len(self._stores) > 1:
+            _, (_, owner, size) = self._stores.popitem(last=False)
+            self.resident_bytes -= size
+            metrics = self._owner_metrics(owner)
+            metrics.evictions += 1
+            metrics.resident_bytes -= size
+            metrics.resident_stores -= 1
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Returns the metrics of each owner."""
+        with self._lock:
+            return {owner: metrics.to_dict() for owner, metrics in self._metrics.items()}
+
+
+class LazyVectorStore(VectorStore):
+    """A file-backed vector store that is only loaded when it is searched.
+
+    The store is held by a StoreResidency, which may drop it when other
+    stores are used more, so the stand-in only keeps a reference to its
+    files. Any attribute it doesn't define is taken from the loaded store.
+    """
+
+    def __init__(
+        self, path: str, uri: Optional[str], owner: str, residency: StoreResidency
+    ):
+        """Create a LazyVectorStore object.
+
+        Args:
+            path: The local directory of the store.
+            uri: The artifact URI the store was copied from, if any.
+            owner: The owner the store is accounted to, like an agent.
+            residency: The residency that loads the store.
+        """
+        self.path = path
+        self.uri = uri
+        self.owner = owner
+        self.residency = residency
+        self._embedding: Optional[Embeddings] = None
+
+    def __reduce_ex__(self, protocol: int) -> Any:
+        from vector_store.persistence import open_store
+
+        return open_store, (self.path, self.uri)
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for attributes the stand-in doesn't have
+        if name.startswith("__") or name in ("path", "uri", "owner", "residency"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __len__(self) -> int:
+        return len(self.load())
+
+    def load(self) -> Any:
+        """Returns the store, loading it if needed."""
+        return self.residency.get(self.path, self.uri, self.owner)
+
+    @property
+    def embedding(self) -> Embeddings:
+        # read on its own, so that embedding a query doesn't load the store
+        if self._embedding is None:
+            local_path, _ = resolve(self.path, self.uri)
+            with open(os.path.join(local_path, EMBEDDING_FILE), "rb") as f:
+                self._embedding = pickle.load(f)
+        return self._embedding
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        raise NotImplementedError("A LazyVectorStore is read-only.")
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.load().similarity_search_with_score_by_vector(embedding, k, **kwargs)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return self.load().similarity_search_by_vector(embedding, k, **kwargs)
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.load().similarity_search_with_score(query, k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.load().similarity_search(query, k, **kwargs)
+
+    def _similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.load()._similarity_search_with_relevance_scores(query, k, **kwargs)
+
+    def hybrid_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        """Returns the documents that best match a query, see IDMapVectorStore."""
+        return self.load().hybrid_search(query, k, **kwargs)
+
+    def as_retriever(self, **kwargs: Any) -> VectorStoreRetriever:
+        """Returns a retriever of the store, searching with "hybrid" by default.
+
+        The store is loaded by the first search, not by this.
+        """
+        return as_hybrid_retriever(self, **kwargs)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> "LazyVectorStore":
+        raise NotImplementedError("Open a saved store with a StoreResidency instead.")
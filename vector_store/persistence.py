@@ -0,0 +1,348 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Mapping, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+
+from knowledge.http_cache import CACHE_DIR
+from vector_store.bm25_index import BM25Index
+
+INDEX_FILE = "index.faiss"
+KEYS_FILE = "keys.npy"
+EMBEDDING_FILE = "embedding.pkl"
+CONFIG_FILE = "config.json"
+BITSETS_FILE = "bitsets.npy"
+BM25_DIR = "bm25"
+# IO_FLAG_MMAP only maps the inverted lists of IVF indexes, while the
+# codes of flat and scalar-quantized indexes would be read into memory.
+# IO_FLAG_MMAP_IFC maps the codes of every index type, but older FAISS
+# versions don't have it.
+INDEX_READ_FLAGS = (
+    getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+)
+
+# opens the stores unpickled from a reference to their files, see store_opener
+_store_opener: ContextVar[Optional[Callable[[str, Optional[str]], Any]]] = ContextVar(
+    "store_opener", default=None
+)
+
+
+def _write_column(directory: str, name: str, values: Iterator[str]) -> None:
+    """Write a column of strings as concatenated UTF-8 bytes plus offsets."""
+    offsets = [0]
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        for value in values:
+            data = value.encode()
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    np.save(os.path.join(directory, f"{name}.offsets.npy"), np.array(offsets, dtype=np.int64))
+
+
+def _find_row(row_keys: np.ndarray, key: int) -> Optional[int]:
+    """Returns the row of a key in sorted keys, or None if it is not present."""
+    row = int(np.searchsorted(row_keys, key))
+    if row < len(row_keys) and row_keys[row] == key:
+        return row
+    return None
+
+
+class StringColumn(Mapping):
+    """A read-only, memory-mapped column of strings keyed by chunk key.
+
+    Rows are sorted by key, so a lookup is a binary search over the
+    memory-mapped keys followed by a slice of the memory-mapped data.
+    Nothing is read from disk until a row is accessed.
+    """
+
+    def __init__(self, directory: str, name: str, keys: np.ndarray):
+        """Create a StringColumn object.
+
+        Args:
+            directory: The directory holding the column.
+            name: The name of the column.
+            keys: The sorted keys of the rows.
+        """
+        self.row_keys = keys
+        self.offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode="r")
+        path = os.path.join(directory, f"{name}.bin")
+        if os.path.getsize(path) > 0:
+            self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+
+    def __getitem__(self, key: int) -> str:
+        row = _find_row(self.row_keys, key)
+        if row is None:
+            raise KeyError(key)
+        return self.data[self.offsets[row] : self.offsets[row + 1]].tobytes().decode()
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, int) and _find_row(self.row_keys, key) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.row_keys.tolist())
+
+    def __len__(self) -> int:
+        return len(self.row_keys)
+
+
+class ColumnarDocstore(Mapping):
+    """A read-only docstore that builds Documents from memory-mapped columns."""
+
+    def __init__(self, texts: StringColumn, metadatas: StringColumn):
+        """Create a ColumnarDocstore object.
+
+        Args:
+            texts: The column holding the content of the chunks.
+            metadatas: The column holding the metadata of the chunks as JSON.
+        """
+        self.texts = texts
+        self.metadatas = metadatas
+
+    def __getitem__(self, key: int) -> Document:
+        return Document(
+            page_content=self.texts[key], metadata=json.loads(self.metadatas[key])
+        )
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.texts
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.texts)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+
+class BitsetColumn(Mapping):
+    """A read-only, memory-mapped column of version bitsets keyed by chunk key.
+
+    The bitsets are stored as a matrix of uint64 words, one row per key.
+    """
+
+    def __init__(self, keys: np.ndarray, words: np.ndarray):
+        """Create a BitsetColumn object.
+
+        Args:
+            keys: The sorted keys of the rows.
+            words: The matrix of the words of each bitset.
+        """
+        self.row_keys = keys
+        self.words = words
+
+    def __getitem__(self, key: int) -> int:
+        row = _find_row(self.row_keys, key)
+        if row is None:
+            raise KeyError(key)
+        return sum(int(word) << (64 * i) for i, word in enumerate(self.words[row]))
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, int) and _find_row(self.row_keys, key) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.row_keys.tolist())
+
+    def __len__(self) -> int:
+        return len(self.row_keys)
+
+    def keys_with_bit(self, bit: int) -> np.ndarray:
+        """Returns the keys of the rows that have a bit set."""
+        column = self.words[:, bit // 64] >> np.uint64(bit % 64)
+        return np.asarray(self.row_keys[(column & np.uint64(1)) == 1], dtype=np.int64)
+
+
+def _write_bitsets(directory: str, bitsets: Iterator[int], num_bits: int) -> None:
+    """Write bitsets as a matrix of uint64 words."""
+    num_words = max(1, (num_bits + 63) // 64)
+    words = [
+        [(bits >> (64 * i)) & 0xFFFFFFFFFFFFFFFF for i in range(num_words)]
+        for bits in bitsets
+    ]
+    np.save(
+        os.path.join(directory, BITSETS_FILE),
+        np.array(words, dtype=np.uint64).reshape(-1, num_words),
+    )
+
+
+def save_store(store, directory: str) -> None:
+    """Write an IDMapVectorStore to a directory in a memory-mappable format.
+
+    The index is written in the FAISS file format and the documents, chunk
+    ids and, for a SharedVectorStore, version bitsets in columnar side
+    files sorted by chunk key, next to the arrays of the BM25 index.
+
+    Args:
+        store: The IDMapVectorStore to write.
+        directory: The directory to write to.
+    """
+    from vector_store.shared_vector_store import SharedVectorStore
+
+    shared = isinstance(store, SharedVectorStore)
+    os.makedirs(directory, exist_ok=True)
+    if store.index is not None:
+        faiss.write_index(store.index, os.path.join(directory, INDEX_FILE))
+    with open(os.path.join(directory, EMBEDDING_FILE), "wb") as f:
+        pickle.dump(store.embedding, f)
+    config = {"index_type": store.index_type, "nprobe": store.nprobe}
+    if shared:
+        config["versions"] = store.versions
+    with open(os.path.join(directory, CONFIG_FILE), "w") as f:
+        json.dump(config, f)
+
+    keys = sorted(store.docstore)
+    np.save(os.path.join(directory, KEYS_FILE), np.array(keys, dtype=np.int64))
+    _write_column(directory, "texts", (store.docstore[k].page_content for k in keys))
+    _write_column(
+        directory, "metadatas", (json.dumps(store.docstore[k].metadata) for k in keys)
+    )
+    _write_column(directory, "chunk_ids", (store.chunk_ids[k] for k in keys))
+    if shared:
+        _write_bitsets(
+            directory, (store.version_bits[k] for k in keys), len(store.versions)
+        )
+    if store.bm25 is not None:
+        store.bm25.save(os.path.join(directory, BM25_DIR))
+
+
+def load_store(directory: str, uri: Optional[str] = None):
+    """Open an IDMapVectorStore written by save_store without reading it into memory.
+
+    The index and the columns are memory-mapped, so loading is near-instant
+    and processes that open the same files share their pages in the page
+    cache instead of each holding a private copy. With FAISS versions that
+    lack IO_FLAG_MMAP_IFC, only the inverted lists of IVF indexes are
+    mapped, and the codes of "flat" and "sq8" indexes are read into memory,
+    see INDEX_READ_FLAGS.
+
+    Args:
+        directory: The local directory holding the store.
+        uri: The artifact URI the directory was copied from, if any, so that
+            a pickled reference to the store can be resolved elsewhere.
+
+    Returns:
+        The IDMapVectorStore, backed by the files in the directory.
+    """
+    from vector_store.id_map_vector_store import IDMapVectorStore
+    from vector_store.shared_vector_store import SharedVectorStore
+
+    config = {}
+    # stores written before index types were configurable have no config
+    if os.path.exists(os.path.join(directory, CONFIG_FILE)):
+        with open(os.path.join(directory, CONFIG_FILE)) as f:
+            config = json.load(f)
+    versions = config.pop("versions", None)
+    cls = IDMapVectorStore if versions is None else SharedVectorStore
+    with open(os.path.join(directory, EMBEDDING_FILE), "rb") as f:
+        store = cls(pickle.load(f), **config)
+    index_path = os.path.join(directory, INDEX_FILE)
+    if os.path.exists(index_path):
+        store.index = faiss.read_index(index_path, INDEX_READ_FLAGS)
+    keys = np.load(os.path.join(directory, KEYS_FILE), mmap_mode="r")
+    store.docstore = ColumnarDocstore(
+        StringColumn(directory, "texts", keys), StringColumn(directory, "metadatas", keys)
+    )
+    store.chunk_ids = StringColumn(directory, "chunk_ids", keys)
+    if versions is not None:
+        store.versions = versions
+        store.version_bits = BitsetColumn(
+            keys, np.load(os.path.join(directory, BITSETS_FILE), mmap_mode="r")
+        )
+    if os.path.isdir(os.path.join(directory, BM25_DIR)):
+        store.bm25 = BM25Index.load(os.path.join(directory, BM25_DIR))
+    store.path = directory
+    store.uri = uri
+    return store
+
+
+def localize(uri: str) -> str:
+    """Returns a local directory holding the files of an artifact URI.
+
+    Local URIs are returned as is. Remote ones are copied once into the
+    cache directory, so every process on the host maps the same files.
+
+    Args:
+        uri: The URI of the directory.
+
+    Returns:
+        The path of the local directory.
+    """
+    if "://" not in uri:
+        return uri
+    from zenml.utils import io_utils
+
+    local = os.path.join(
+        CACHE_DIR, "artifacts", hashlib.sha256(uri.encode()).hexdigest()[:32]
+    )
+    if not os.path.exists(local):
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(local))
+        io_utils.copy_dir(uri, tmp, overwrite=True)
+        try:
+            os.rename(tmp, local)
+        except OSError:
+            # another process copied it first
+            shutil.rmtree(tmp, ignore_errors=True)
+    return local
+
+
+def resolve(path: str, uri: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Returns a local directory for a store, copying it from its URI if needed.
+
+    Args:
+        path: The local directory the store was loaded from.
+        uri: The artifact URI the store was copied from, if any.
+    """
+    if os.path.exists(path) or uri is None:
+        return path, uri
+    return localize(uri), uri
+
+
+def open_store(path: str, uri: Optional[str]) -> Any:
+    """Returns the store a pickled reference to files points to.
+
+    File-backed stores pickle to a call of this function, so that how
+    they are opened can be changed with `store_opener`.
+
+    Args:
+        path: The local directory the store was loaded from.
+        uri: The artifact URI the store was copied from, if any.
+    """
+    opener = _store_opener.get()
+    if opener is not None:
+        return opener(path, uri)
+    return load_store(*resolve(path, uri))
+
+
+@contextmanager
+def store_opener(opener: Callable[[str, Optional[str]], Any]) -> Iterator[None]:
+    """Open the file-backed stores unpickled in the context with a function.
+
+    For example, a model server unpickles tools with stores that are only
+    loaded when they are searched.
+
+    Args:
+        opener: A function taking the path and URI of a store and
+            returning the store, or a stand-in for it.
+    """
+    token = _store_opener.set(opener)
+    try:
+        yield
+    finally:
+        _store_opener.reset(token)
+
+
+def store_size(path: str) -> int:
+    """Returns the size in bytes of the files of a store."""
+    size = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(directory, name))
+    return size
@@ -0,0 +1,28 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+# FAISS releases the GIL while it searches, so searches run in parallel on
+# threads without blocking the event loop of the serving path
+DEFAULT_SEARCH_THREADS = 8
+
+_search_executor: Optional[ThreadPoolExecutor] = None
+_search_executor_lock = threading.Lock()
+
+
+def get_search_executor() -> ThreadPoolExecutor:
+    """Returns the thread pool vector searches run in, creating it if needed."""
+    global _search_executor
+    with _search_executor_lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(
+                DEFAULT_SEARCH_THREADS, thread_name_prefix="vector-search"
+            )
+        return _search_executor
+
+
+def set_search_executor(executor: ThreadPoolExecutor) -> None:
+    """Set the thread pool vector searches run in, for example to change its size."""
+    global _search_executor
+    with _search_executor_lock:
+        _search_executor = executor
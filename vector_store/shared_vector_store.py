@@ -0,0 +1,339 @@
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores.base import VectorStore, VectorStoreRetriever
+
+from vector_store.hybrid import as_hybrid_retriever
+from vector_store.id_map_vector_store import IDMapVectorStore, chunk_key
+
+
+class SharedVectorStore(IDMapVectorStore):
+    """An IDMapVectorStore holding the chunks of several versions of the docs.
+
+    Every chunk is stored once, however many versions it appears in, along
+    with a bitset of these versions: bit i is set if the chunk belongs to
+    `versions[i]`. Searches can be restricted to the chunks of a version,
+    which is what the VersionView of each version does. Since consecutive
+    versions share most of their chunks, this takes a fraction of the
+    memory of one store per version, and adding a version mostly means
+    setting bits.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        dim: Optional[int] = None,
+        index_type: str = "flat",
+        nprobe: int = 16,
+    ):
+        """Create a SharedVectorStore object.
+
+        Args:
+            embedding: The embeddings used to embed queries and texts.
+            dim: The number of dimensions of the vectors of a flat index.
+            index_type: The type of the index.
+            nprobe: The number of clusters an IVF index scans per query.
+        """
+        super().__init__(embedding, dim=dim, index_type=index_type, nprobe=nprobe)
+        self.versions: List[str] = []
+        self.version_bits: Mapping[int, int] = {}
+        # the FAISS selector and BM25 mask of the chunks of each version,
+        # built on first search
+        self._filters: Dict[str, Tuple[faiss.IDSelector, Optional[np.ndarray]]] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = super().__getstate__()
+        state.pop("_filters", None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        super().__setstate__(state)
+        self._filters = {}
+
+    def _make_writable(self) -> None:
+        if self.path is not None:
+            self.version_bits = dict(self.version_bits)
+        super()._make_writable()
+
+    def copy(self) -> "SharedVectorStore":
+        """Returns an independent copy of the store."""
+        store = super().copy()
+        store.versions = list(self.versions)
+        store.version_bits = dict(self.version_bits)
+        return store
+
+    def _bit(self, version: str) -> int:
+        """Returns the bit of a version, assigning one to new versions."""
+        if version not in self.versions:
+            self.versions.append(version)
+        return 1 << self.versions.index(version)
+
+    def version_keys(self, version: str) -> np.ndarray:
+        """Returns the keys of the chunks of a version."""
+        if version not in self.versions:
+            return np.zeros(0, dtype=np.int64)
+        bit = self.versions.index(version)
+        keys_with_bit = getattr(self.version_bits, "keys_with_bit", None)
+        if keys_with_bit is not None:
+            # memory-mapped bitsets can be scanned without a Python loop
+            return keys_with_bit(bit)
+        return np.array(
+            [key for key, bits in self.version_bits.items() if bits >> bit & 1],
+            dtype=np.int64,
+        )
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        documents: Sequence[Document],
+        version: Optional[str] = None,
+    ) -> None:
+        """Add chunks, replacing any chunks with the same ids.
+
+        Replaced chunks keep their versions.
+
+        Args:
+            ids: The ids of the chunks.
+            vectors: A matrix with the vector of each chunk.
+            documents: The documents of the chunks.
+            version: If set, the version the chunks are added to.
+        """
+        self._make_writable()
+        bits = {
+            key: self.version_bits.get(key, 0)
+            for key in (chunk_key(chunk_id) for chunk_id in ids)
+        }
+        super().upsert(ids, vectors, documents)
+        self.version_bits.update(bits)
+        if version is not None:
+            self.tag(version, ids)
+
+    def _remove_keys(self, keys: np.ndarray) -> None:
+        super()._remove_keys(keys)
+        for key in keys.tolist():
+            self.version_bits.pop(key, None)
+
+    def tag(self, version: str, ids: Iterable[str]) -> None:
+        """Add chunks that are in the store to a version.
+
+        Args:
+            version: The version.
+            ids: The ids of the chunks.
+        """
+        self._make_writable()
+        bit = self._bit(version)
+        for key in (chunk_key(chunk_id) for chunk_id in ids):
+            if key in self.version_bits:
+                self.version_bits[key] |= bit
+        self._filters.pop(version, None)
+
+    def untag(self, version: str, ids: Iterable[str]) -> None:
+        """Remove chunks from a version, deleting chunks left without a version.
+
+        Args:
+            version: The version.
+            ids: The ids of the chunks.
+        """
+        if version not in self.versions:
+            return
+        self._make_writable()
+        mask = ~self._bit(version)
+        orphans = []
+        for key in (chunk_key(chunk_id) for chunk_id in ids):
+            if key in self.version_bits:
+                self.version_bits[key] &= mask
+                if self.version_bits[key] == 0:
+                    orphans.append(key)
+        if orphans:
+            self._remove_keys(np.array(orphans, dtype=np.int64))
+        self._filters.pop(version, None)
+
+    def copy_version(self, source: str, destination: str) -> None:
+        """Add the chunks of a version to another one.
+
+        Args:
+            source: The version to copy the chunks of.
+            destination: The version to add them to.
+        """
+        keys = self.version_keys(source)
+        self._make_writable()
+        bit = self._bit(destination)
+        for key in keys.tolist():
+            self.version_bits[key] |= bit
+        self._filters.pop(destination, None)
+
+    def _filter(self, version: str) -> Tuple[faiss.IDSelector, Optional[np.ndarray]]:
+        """Returns the FAISS selector and BM25 mask of the chunks of a version."""
+        version_filter = self._filters.get(version)
+        if version_filter is None:
+            keys = self.version_keys(version)
+            mask = None if self.bm25 is None else self.bm25.mask(keys)
+            version_filter = (faiss.IDSelectorBatch(keys), mask)
+            self._filters[version] = version_filter
+        return version_filter
+
+    def build_bm25(self) -> None:
+        """Build the BM25 index of the chunks of all versions."""
+        super().build_bm25()
+        self._filters = {}
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        version: Optional[str] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        """Returns the documents closest to a vector along with their L2 distance.
+
+        Args:
+            embedding: The vector to search with.
+            k: The number of documents to return.
+            version: If set, only the chunks of this version are searched.
+        """
+        if version is not None:
+            if version not in self.versions:
+                return []
+            kwargs["selector"], _ = self._filter(version)
+        return super().similarity_search_with_score_by_vector(embedding, k, **kwargs)
+
+    def hybrid_search(
+        self, query: str, k: int = 4, version: Optional[str] = None, **kwargs: Any
+    ) -> List[Document]:
+        """Returns the documents that best match a query by vector and BM25 search.
+
+        Args:
+            query: The query.
+            k: The number of documents to return.
+            version: If set, only the chunks of this version are searched.
+        """
+        if version is not None:
+            if version not in self.versions:
+                return []
+            kwargs["selector"], kwargs["mask"] = self._filter(version)
+        return super().hybrid_search(query, k, **kwargs)
+
+    def view(self, version: str) -> "VersionView":
+        """Returns a vector store of the chunks of a version."""
+        return VersionView(self, version)
+
+
+class VersionView(VectorStore):
+    """The chunks of one version of a SharedVectorStore, as a vector store.
+
+    The sources of chunks shared by several versions may be templates with
+    a "{version}" placeholder, which is filled in with the version of the
+    view.
+    """
+
+    def __init__(self, store: SharedVectorStore, version: str):
+        """Create a VersionView object.
+
+        Args:
+            store: The store holding the chunks.
+            version: The version whose chunks are searched.
+        """
+        self.store = store
+        self.version = version
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.store.embedding
+
+    def __len__(self) -> int:
+        return len(self.store.version_keys(self.version))
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Embed texts and upsert them into the version."""
+        ids = self.store.add_texts(texts, metadatas=metadatas, ids=ids)
+        self.store.tag(self.version, ids)
+        return ids
+
+    def _localize(self, document: Document) -> Document:
+        """Returns a document with the version of the view in its source."""
+        source = document.metadata.get("source")
+        if not isinstance(source, str) or "{version}" not in source:
+            return document
+        metadata = dict(document.metadata)
+        metadata["source"] = source.replace("{version}", self.version)
+        return Document(page_content=document.page_content, metadata=metadata)
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return [
+            (self._localize(document), distance)
+            for document, distance in self.store.similarity_search_with_score_by_vector(
+                embedding, k, version=self.version, **kwargs
+            )
+        ]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score_by_vector(
+                embedding, k, **kwargs
+            )
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.store.embedding.embed_query(query), k, **kwargs
+        )
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(
+            self.store.embedding.embed_query(query), k, **kwargs
+        )
+
+    def _similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return [
+            (document, 1.0 - distance / 4)
+            for document, distance in self.similarity_search_with_score(query, k, **kwargs)
+        ]
+
+    def hybrid_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        """Returns the documents of the version that best match a query."""
+        return [
+            self._localize(document)
+            for document in self.store.hybrid_search(
+                query, k, version=self.version, **kwargs
+            )
+        ]
+
+    def as_retriever(self, **kwargs: Any) -> VectorStoreRetriever:
+        """Returns a retriever of the version, searching with "hybrid" by default.
+
+        Without a BM25 index, hybrid search is a similarity search. Unlike
+        checking for the index, this doesn't touch the store, which may be
+        loaded lazily.
+        """
+        return as_hybrid_retriever(self, **kwargs)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> "VersionView":
+        raise NotImplementedError(
+            "Create a SharedVectorStore and use its view of a version instead."
+        )
@@ -0,0 +1,145 @@
+#  Copyright (c) ZenML GmbH 2023. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Tuple, Type, Union
+from weakref import WeakKeyDictionary
+
+from zenml.enums import ArtifactType
+from zenml.io import fileio
+from zenml.materializers.base_materializer import BaseMaterializer
+from zenml.utils import io_utils
+
+from knowledge.manifest import ManifestStore
+from vector_store.id_map_vector_store import IDMapVectorStore
+from vector_store.persistence import load_store, localize, save_store
+from vector_store.shared_vector_store import SharedVectorStore, VersionView
+
+VERSIONS_FILE = "versions.json"
+
+# the staged manifest collections of the stores the steps output, which
+# are committed once the stores are saved
+_staged: "WeakKeyDictionary[IDMapVectorStore, Tuple[ManifestStore, List[str]]]" = (
+    WeakKeyDictionary()
+)
+
+
+def commit_on_save(
+    store: IDMapVectorStore, manifest: ManifestStore, collection: str
+) -> None:
+    """Commit the staged copy of a manifest collection once a store is saved.
+
+    The steps write the manifest changes of a run to a staging copy of
+    each collection, see `ManifestStore.stage`. These only describe the
+    store once it is saved, so they are committed by the materializer after
+    writing the artifact. A run that fails, or is cancelled, before that
+    leaves the manifest as it was.
+
+    Args:
+        store: The store the manifest changes were applied to.
+        manifest: The manifest the collection is in.
+        collection: The collection to commit.
+    """
+    _, collections = _staged.setdefault(store, (manifest, []))
+    collections.append(collection)
+
+
+class VectorStoresMaterializer(BaseMaterializer):
+    """Materializes a dict of IDMapVectorStores or VersionViews with version as key.
+
+    Every store is written to its own directory of the artifact in a format
+    FAISS can memory-map, with its documents in columnar side files. Loading
+    the artifact maps the files instead of unpickling the indexes, and the
+    loaded stores pickle to references to these files, so tools that wrap
+    them stay small too. A SharedVectorStore is written once, however
+    many versions have a view of it.
+
+    This materializer is not registered as the default for dicts and has to
+    be set explicitly on the steps that output vector stores.
+    """
+
+    ASSOCIATED_TYPES = (dict,)
+    ASSOCIATED_ARTIFACT_TYPE = ArtifactType.DATA
+    SKIP_REGISTRATION = True
+
+    def load(
+        self, data_type: Type[Any]
+    ) -> Dict[str, Union[IDMapVectorStore, VersionView]]:
+        """Opens the vector stores of the artifact.
+
+        Args:
+            data_type: The type of the artifact.
+
+        Returns:
+            A dictionary with version as key and the memory-mapped store, or
+            the view of the version of a shared store, as value.
+        """
+        local = localize(self.uri)
+        with open(os.path.join(local, VERSIONS_FILE)) as f:
+            entries = json.load(f)
+        if entries and isinstance(entries[0], str):
+            # artifacts written before stores could be shared list versions
+            entries = [{"version": v, "store": i} for i, v in enumerate(entries)]
+
+        stores: Dict[int, IDMapVectorStore] = {}
+        vector_stores = {}
+        for entry in entries:
+            i = entry["store"]
+            if i not in stores:
+                stores[i] = load_store(
+                    os.path.join(local, str(i)), uri=os.path.join(self.uri, str(i))
+                )
+            if isinstance(stores[i], SharedVectorStore):
+                vector_stores[entry["version"]] = stores[i].view(entry["version"])
+            else:
+                vector_stores[entry["version"]] = stores[i]
+        return vector_stores
+
+    def save(self, data: Dict[str, Union[IDMapVectorStore, VersionView]]) -> None:
+        """Writes the vector stores to the artifact.
+
+        The staged manifest collections of the stores are committed once
+        the artifact is written, see `commit_on_save`.
+
+        Args:
+            data: A dictionary with version as key and the store, or the view
+                of the version of a shared store, as value.
+        """
+        stores: List[IDMapVectorStore] = []
+        entries = []
+        for version, vector_store in data.items():
+            if isinstance(vector_store, VersionView):
+                vector_store = vector_store.store
+            # versions are not necessarily valid directory names, so stores
+            # are written to numbered directories
+            i = next((i for i, s in enumerate(stores) if s is vector_store), len(stores))
+            if i == len(stores):
+                stores.append(vector_store)
+            entries.append({"version": version, "store": i})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, VERSIONS_FILE), "w") as f:
+                json.dump(entries, f)
+            for i, store in enumerate(stores):
+                save_store(store, os.path.join(tmp, str(i)))
+            if not fileio.exists(self.uri):
+                fileio.makedirs(self.uri)
+            io_utils.copy_dir(tmp, self.uri, overwrite=True)
+
+        for store in stores:
+            manifest, collections = _staged.pop(store, (None, []))
+            for collection in collections:
+                manifest.commit(collection)
@@ -7,48 +7,84 @@ from agent.agent import URL, Agent
 from steps.url_scraper import url_scraper
 from steps.web_url_loader import web_url_loader
 from steps.index_generator import index_generator
-from steps.get_tools import get_tools
+from steps.streaming_index_generator import streaming_index_generator
+from steps.get_tools import branch_step_name, get_tools
 from steps.get_agent import get_agent
+from steps.compile_tools import compile_tools
 
 PIPELINE_NAME = "index_creation_pipeline"
 
+
+def _index_branch(project_name: str, version: str, urls: List[URL], streaming: bool) -> str:
+    """Adds the branch that indexes a version, and returns its last step."""
+    if streaming:
+        index_id = branch_step_name("streaming_index_generator", version)
+        streaming_index_generator(project_name, {version: urls}, id=index_id)
+        return index_id
+
+    index_id = branch_step_name("index_generator", version)
+    # url_scraper passes the URLs that are not to be scraped through
+    scraped_urls = url_scraper({version: urls}, id=branch_step_name("url_scraper", version))
+    documents = web_url_loader(scraped_urls, id=branch_step_name("web_url_loader", version))
+    index_generator(project_name, documents, id=index_id)
+    return index_id
+
+
 @pipeline(name=PIPELINE_NAME)
 def index_creation_pipeline(
     project_name: str,
     urls: Dict[str, List[URL]],
-    agent: Agent
+    agent: Agent,
+    streaming: bool = True,
+    shared_index: bool = False,
 ) -> None:
     """Pipeline to create the index for the agent to use.
 
+    Every version gets its own branch of url_scraper, web_url_loader and
+    index_generator steps, so that the versions are indexed in parallel
+    by orchestrators that run independent steps concurrently. The steps
+    are never cached, since pages change while their URLs stay the same:
+    every run fetches the pages again and applies only the delta of their
+    content to the index. The branches join in get_tools.
+
+    With `streaming`, a branch is a single streaming_index_generator step
+    instead, which streams the pages from the crawl into the index without
+    holding the URLs and documents of the version in memory.
+
+    With `shared_index`, the versions are not branched: a single chain of
+    steps indexes all of them into one SharedVectorStore, which each
+    branch would otherwise build a full copy of. A shared index can't be
+    streamed.
+
     Args:
         project_name: name of the project
         urls: dictionary with version as key and list of URLs as value
         agent: The agent object that triggered this pipeline.
+        streaming: Whether the branches stream the pages into the index.
+        shared_index: Whether to store all versions in a single index.
+
+    Raises:
+        ValueError: If both `streaming` and `shared_index` are set.
     """
-    # create scrapable and non-scrapable URLs maps
-    # depending on the value of url.scrape
-    scrapable_urls = {}
-    non_scrapable_urls = {}
-    for version in urls:
-        scrapable_urls[version] = []
-        non_scrapable_urls[version] = []
-        for url in urls[version]:
-            if url.scrape:
-                scrapable_urls[version].append(url)
-            else:
-                non_scrapable_urls[version].append(url)
-    
-    scraped_urls = url_scraper(scrapable_urls)
-    # merge scraped_urls and non_scrapable_urls
-    for version in non_scrapable_urls:
-        scraped_urls[version].extend(non_scrapable_urls[version])
-    documents = web_url_loader(scraped_urls)
-    vector_stores = index_generator(documents)
+    if shared_index:
+        if streaming:
+            raise ValueError("A shared index can't be streamed, unset streaming.")
+        # url_scraper passes the URLs that are not to be scraped through
+        documents = web_url_loader(url_scraper(urls))
+        index_generator(project_name, documents, shared_index=True)
+        index_steps = ["index_generator"]
+    else:
+        index_steps = [
+            _index_branch(project_name, version, urls[version], streaming) for version in urls
+        ]
+
     # TODO the last step should be get agent
     # which will take all the tools from the previous agent
     # and create a new agent based on the values of the current agent
     # values being the prompt that is being used, etc.
-    all_tools = get_tools(project_name, vector_stores, scraped_urls)
+    all_tools = get_tools(project_name, index_steps, after=index_steps)
     agent = get_agent(agent)
+    # the tools and prompt that deployments of this version load
+    compile_tools(agent, all_tools)
 
     return agent
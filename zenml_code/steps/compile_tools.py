@@ -0,0 +1,42 @@
+#  Copyright (c) ZenML GmbH 2023. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from typing import Any, Dict
+
+from zenml import step
+
+from agent.tool_registry import ToolRegistry
+from tools.versioned_vector_store import VersionedVectorStoreTool
+
+
+# TODO making the types Agent and ToolRegistry leads to some forward Ref errors
+@step(enable_cache=True)
+def compile_tools(
+    agent: Any,
+    versioned_tools: Dict[str, VersionedVectorStoreTool],
+) -> Any:
+    """Compiles the tools and prompt of this version of the agent.
+
+    Deployments of the version load the compiled registry instead of
+    building the tool descriptions and prompt again.
+
+    Args:
+        agent: The agent object that triggered the pipeline.
+        versioned_tools: A dictionary with version as key and
+            VersionedVectorStoreTool object as value.
+
+    Returns:
+        The ToolRegistry of the knowledge tools and the user-supplied tools.
+    """
+    return ToolRegistry(list(versioned_tools.values()) + agent.user_tools())
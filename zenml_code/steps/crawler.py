@@ -0,0 +1,209 @@
+#  Copyright (c) ZenML GmbH 2023. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from logging import getLogger
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from jobs.progress import advance
+from knowledge.http_client import get_http_client
+from knowledge.page_store import PageStore
+from steps.url_scraping_utils import extract_links
+
+logger = getLogger(__name__)
+
+
+class Crawler:
+    """A breadth-first crawler with a bounded pool of fetch workers.
+
+    Unlike the recursive `crawl` function, the crawler keeps an explicit
+    frontier queue so that the depth of a site never touches the Python
+    recursion limit, and it keeps up to `max_workers` fetches in flight
+    at once. Fetching and link extraction happen in the worker threads,
+    while the frontier and the set of seen URLs are only ever touched by
+    the scheduling thread, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 16,
+        max_per_host: int = 8,
+        max_depth: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        fetch: Optional[Callable[[str], str]] = None,
+        page_store: Optional[PageStore] = None,
+    ):
+        """Create a Crawler object.
+
+        Args:
+            max_workers: The maximum number of pages fetched concurrently.
+            max_per_host: The maximum number of concurrent fetches against
+                a single host.
+            max_depth: The maximum link distance from the start URL. If None,
+                the crawl is not bounded by depth. Pages at the maximum
+                depth are returned without being fetched.
+            max_pages: The maximum number of pages to return. If None, the
+                crawl is not bounded by size.
+            fetch: A callable that takes a URL and returns the body of the
+                page. Defaults to a GET through the shared HTTP client, in
+                which case the links of pages that have not changed since
+                the last crawl are taken from the HTTP cache.
+            page_store: The store to write the fetched bodies to, so that
+                later steps can read them instead of fetching them again.
+                Only used with the default fetch.
+        """
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.fetch = fetch
+        self.page_store = page_store
+
+    def _visit(self, url: str, base: str) -> Tuple[List[str], Optional[str]]:
+        """Fetch a page and return the valid links on it.
+
+        Args:
+            url: The URL to visit.
+            base: The base URL to compare against.
+
+        Returns:
+            The valid links on the page and the digest of its body in the
+            page store, if it was stored.
+        """
+        if self.fetch is not None:
+            return extract_links(self.fetch(url), url, base), None
+
+        client = get_http_client()
+        response = client.get(url)
+        digest = None
+        if self.page_store is not None and response.status_code == 200:
+            digest = self.page_store.put(response.content, response.charset)
+
+        annotation = f"links:{base}"
+        if annotation in response.annotations:
+            return response.annotations[annotation], digest
+        links = extract_links(response.text, url, base)
+        client.annotate(response, annotation, links)
+        return links, digest
+
+    def _next_dispatchable(
+        self, frontier: Deque[Tuple[str, int]], per_host: Dict[str, int]
+    ) -> Optional[Tuple[str, int]]:
+        """Pop the first frontier entry whose host has spare capacity.
+
+        Args:
+            frontier: The queue of URLs waiting to be fetched.
+            per_host: The number of in-flight fetches per host.
+
+        Returns:
+            The URL and its depth, or None if every queued host is saturated.
+        """
+        for _ in range(len(frontier)):
+            url, depth = frontier.popleft()
+            if per_host.get(urlparse(url).netloc, 0) < self.max_per_host:
+                return url, depth
+            frontier.append((url, depth))
+        return None
+
+    def crawl(self, url: str, base: str) -> Set[str]:
+        """Crawl a URL and its links, retrieving all valid links with the same base.
+
+        Args:
+            url: The URL to start crawling from.
+            base: The base URL to compare against.
+
+        Returns:
+            A set of all valid links with the same base.
+        """
+        return set(self.crawl_pages(url, base))
+
+    def crawl_pages(self, url: str, base: str) -> Dict[str, Optional[str]]:
+        """Crawl a URL and its links, keeping track of the stored bodies.
+
+        Args:
+            url: The URL to start crawling from.
+            base: The base URL to compare against.
+
+        Returns:
+            A dict with all valid links with the same base as keys and the
+            digests of their bodies in the page store as values. The digest
+            is None for pages that were not stored.
+        """
+        return dict(self.iter_pages(url, base))
+
+    def iter_pages(self, url: str, base: str) -> Iterator[Tuple[str, Optional[str]]]:
+        """Crawl a URL and its links, yielding the pages as they are fetched.
+
+        The crawl only advances while the pages are consumed, so a slow
+        consumer holds back the crawl instead of pages piling up.
+
+        Args:
+            url: The URL to start crawling from.
+            base: The base URL to compare against.
+
+        Returns:
+            An iterator of (page, digest) tuples for all valid links with the
+            same base, where digest is the digest of the body of the page in
+            the page store, or None if it was not stored.
+        """
+        seen: Set[str] = {url}
+        frontier: Deque[Tuple[str, int]] = deque([(url, 0)])
+        in_flight: Dict[Future, Tuple[str, int]] = {}
+        per_host: Dict[str, int] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                while frontier or in_flight:
+                    # fill the pool up to capacity, respecting the per-host limit
+                    while frontier and len(in_flight) < self.max_workers:
+                        entry = self._next_dispatchable(frontier, per_host)
+                        if entry is None:
+                            break
+                        if self.max_depth is not None and entry[1] >= self.max_depth:
+                            # the links of pages at the maximum depth are
+                            # discarded, so there is no need to fetch them,
+                            # later steps load them on their own
+                            advance("pages_crawled")
+                            yield entry[0], None
+                            continue
+                        host = urlparse(entry[0]).netloc
+                        per_host[host] = per_host.get(host, 0) + 1
+                        in_flight[executor.submit(self._visit, entry[0], base)] = entry
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        page, depth = in_flight.pop(future)
+                        per_host[urlparse(page).netloc] -= 1
+                        try:
+                            links, digest = future.result()
+                        except Exception as e:
+                            logger.warning(f"Failed to crawl {page}: {e}")
+                            # later steps try to load it on their own
+                            yield page, None
+                            continue
+                        advance("pages_crawled")
+                        yield page, digest
+
+                        for link in links:
+                            if self.max_pages is not None and len(seen) >= self.max_pages:
+                                break
+                            if link not in seen:
+                                seen.add(link)
+                                frontier.append((link, depth + 1))
+            finally:
+                # the consumer stopped early, don't start the queued fetches
+                for future in in_flight:
+                    future.cancel()
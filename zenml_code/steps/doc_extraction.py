@@ -0,0 +1,217 @@
+#  Copyright (c) ZenML GmbH 2023. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from logging import getLogger
+from typing import Any, List, Optional, Tuple
+
+logger = getLogger(__name__)
+
+# the start of each section in the text of a page, with its heading path
+Sections = List[Tuple[int, str]]
+
+# the main content region of the documentation layouts the fast path
+# knows, most specific first, as (layout, XPath) pairs
+MAIN_REGIONS = (
+    # MkDocs with the Material theme
+    ("mkdocs-material", "//article[contains(concat(' ', @class, ' '), ' md-content__inner ')]"),
+    # Sphinx with the Read the Docs theme and its derivatives
+    ("sphinx", "//div[@itemprop='articleBody']"),
+    # legacy GitBook
+    ("gitbook", "//section[contains(concat(' ', @class, ' '), ' markdown-section ')]"),
+    # Sphinx with the basic themes, like Alabaster, and MkDocs with its
+    # built-in themes
+    ("sphinx-mkdocs", "//div[@role='main']"),
+)
+# the main content region of pages generated by GitBook, which have no
+# stable class names
+GITBOOK_REGION = "//main"
+GENERATOR = "//meta[@name='generator']/@content"
+
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "dd", "details", "div", "dl",
+    "dt", "figcaption", "figure", "header", "li", "main", "ol", "p", "section",
+    "summary", "ul",
+}
+SKIPPED_TAGS = {
+    "button", "footer", "form", "iframe", "input", "nav", "noscript", "script",
+    "select", "style", "svg", "template",
+}
+# elements of the main region that are not content, like the permalinks
+# next to headings and edit buttons
+NOISE = (
+    "//a[contains(concat(' ', @class, ' '), ' headerlink ')]",
+    "//*[contains(concat(' ', @class, ' '), ' md-content__button ')]",
+    "//*[contains(concat(' ', @class, ' '), ' md-source-file ')]",
+    "//*[contains(concat(' ', @class, ' '), ' rst-footer-buttons ')]",
+    "//*[@aria-hidden='true']",
+)
+
+
+def _normalize(text: str) -> str:
+    """Collapse the whitespace of inline text."""
+    return " ".join(text.split())
+
+
+class _SectionWriter:
+    """Turns the elements of a main region into blocks of text and sections."""
+
+    def __init__(self):
+        """Create a _SectionWriter object."""
+        self.blocks: List[str] = []
+        self.sections: Sections = []
+        self._length = 0
+        self._path: List[Tuple[int, str]] = []
+        self._section_path: Optional[str] = None
+        self._inline: List[str] = []
+
+    def _emit(self, text: str) -> None:
+        """Add a block of text, starting a section if the heading path changed."""
+        if self.blocks:
+            # blocks are separated by a blank line, like Unstructured does
+            self._length += 2
+        path = " > ".join(heading for _, heading in self._path)
+        if path != self._section_path:
+            self._section_path = path
+            self.sections.append((self._length, path))
+        self.blocks.append(text)
+        self._length += len(text)
+
+    def _flush(self) -> None:
+        """Emit the inline text seen since the last block."""
+        text = _normalize("".join(self._inline))
+        self._inline = []
+        if text:
+            self._emit(text)
+
+    def _heading(self, element: Any, level: int) -> None:
+        """Start the section of a heading."""
+        text = _normalize(element.text_content())
+        if not text:
+            return
+        while self._path and self._path[-1][0] >= level:
+            self._path.pop()
+        self._path.append((level, text))
+        self._emit(text)
+
+    def _table(self, element: Any) -> None:
+        """Emit a table, one line per row."""
+        rows = []
+        for row in element.iter("tr"):
+            cells = [_normalize(cell.text_content()) for cell in row if cell.tag in ("td", "th")]
+            if any(cells):
+                rows.append(" | ".join(cells))
+        if rows:
+            self._emit("\n".join(rows))
+
+    def write(self, element: Any) -> None:
+        """Write an element and its descendants."""
+        tag = element.tag
+        # comments and processing instructions
+        if not isinstance(tag, str) or tag in SKIPPED_TAGS:
+            return
+        if tag in HEADING_TAGS:
+            self._flush()
+            self._heading(element, HEADING_TAGS[tag])
+            return
+        if tag == "pre":
+            self._flush()
+            # code is kept verbatim
+            code = element.text_content().strip("\n")
+            if code.strip():
+                self._emit(code)
+            return
+        if tag == "table":
+            self._flush()
+            self._table(element)
+            return
+        if tag == "br":
+            self._inline.append(" ")
+            return
+
+        block = tag in BLOCK_TAGS
+        if block:
+            self._flush()
+        if element.text:
+            self._inline.append(element.text)
+        for child in element:
+            self.write(child)
+            if child.tail:
+                self._inline.append(child.tail)
+        if block:
+            self._flush()
+
+    def close(self) -> str:
+        """Returns the text of all blocks."""
+        self._flush()
+        return "\n\n".join(self.blocks)
+
+
+def _main_region(document: Any) -> Tuple[Optional[str], Any]:
+    """Returns the layout of a page and its main content region, if it is known."""
+    for layout, xpath in MAIN_REGIONS:
+        regions = document.xpath(xpath)
+        if regions:
+            return layout, regions[0]
+    generator = " ".join(document.xpath(GENERATOR)).lower()
+    if "gitbook" in generator:
+        regions = document.xpath(GITBOOK_REGION)
+        if regions:
+            return "gitbook", regions[0]
+    return None, None
+
+
+def extract_doc_page(html: str) -> Optional[Tuple[str, Sections]]:
+    """Extract the text of a documentation page, if its layout is known.
+
+    This is a fast path for pages generated by MkDocs, Sphinx and GitBook:
+    the page is parsed with lxml, only its main content region is kept,
+    without the navigation, and it is turned into blocks of text in one
+    pass. Headings and code blocks are kept, and the text is split in
+    sections, each with the path of the headings it is under, like
+    "Installation > Using pip".
+
+    Args:
+        html: The body of the page.
+
+    Returns:
+        The text of the page and the start of each section in it with its
+        heading path, or None if the layout of the page is not known, or
+        lxml is not installed, in which case the page should be parsed
+        with Unstructured.
+    """
+    try:
+        import lxml.html
+    except ImportError:
+        return None
+
+    try:
+        parser = lxml.html.HTMLParser(encoding="utf-8")
+        document = lxml.html.document_fromstring(html.encode("utf-8"), parser=parser)
+    except Exception as e:
+        logger.debug(f"Failed to parse a page with lxml: {e}")
+        return None
+    _, region = _main_region(document)
+    if region is None:
+        return None
+    for xpath in NOISE:
+        for element in region.xpath("." + xpath):
+            element.drop_tree()
+
+    writer = _SectionWriter()
+    writer.write(region)
+    text = writer.close()
+    if not text:
+        return None
+    return text, writer.sections
@@ -12,6 +12,7 @@
 #  or implied. See the License for the specific language governing
 #  permissions and limitations under the License.
 
+import re
 from typing import Dict, List
 
 from langchain.docstore.document import Document
@@ -20,24 +21,41 @@ from langchain.text_splitter import (
     CharacterTextSplitter,
 )
 from langchain.vectorstores import FAISS, VectorStore
-from zenml import step
-from knowledge.url import URL
+from zenml import get_step_context, step
+from zenml.client import Client
+from knowledge.manifest import ManifestStore
 
 from tools.versioned_vector_store import VersionedVectorStoreTool
 import zenml_code.zenml_utils as zenml_utils
 
 
-@step(enable_cache=True)
+def branch_step_name(step_name: str, version: str) -> str:
+    """Returns the name of a step in the branch of a version of the pipeline.
+
+    Args:
+        step_name: The name of the step, like "index_generator".
+        version: The version the branch processes.
+    """
+    return f"{step_name}_{re.sub(r'[^A-Za-z0-9_]', '_', version)}"
+
+
+# the vector stores come from the branches of the current run, which
+# are not inputs, so a cached run would miss the branches that changed
+@step(enable_cache=False)
 def get_tools(
     project_name: str,
-    versioned_vector_stores: Dict[str, VectorStore],
-    all_urls: Dict[str, List[URL]],
+    index_steps: List[str],
 ) -> Dict[str, VersionedVectorStoreTool]:
     """Returns all the tools available for each version.
 
+    The versions are indexed by the branches of the pipeline, whose last
+    steps are named after their version by `branch_step_name`, or by a
+    single index_generator step for a shared index. This step runs after
+    all of them and joins their vector stores.
+
     Args:
-        versioned_vector_stores: A dictionary with version as key and VectorStore object as value.
-        all_urls: A dictionary with version as key and list of URLs as value.
+        project_name: The name of the project.
+        index_steps: The names of the steps that indexed the versions.
 
     Returns:
         A dictionary with version as key and VersionedVectorStoreTool object as value.
@@ -47,18 +65,25 @@ def get_tools(
     # TODO figure out how to get the current pipeline name in step
     existing_tools = zenml_utils.get_existing_tools(pipeline_name="index_creation_pipeline")
 
+    run = Client().get_pipeline_run(get_step_context().pipeline_run.id)
+    versioned_vector_stores: Dict[str, VectorStore] = {}
+    for index_step in index_steps:
+        # a version without any chunk has no vector store
+        versioned_vector_stores.update(run.steps[index_step].output.load())
+
+    manifest = ManifestStore()
     # update the existing vector stores with the new ones
     for version in versioned_vector_stores:
         existing_tools[version] = VersionedVectorStoreTool(
             name=f"{project_name}-{version}",
-            vector_store=versioned_vector_stores[version],
+            vectorstore=versioned_vector_stores[version],
             version=version,
             description="Use this tool to answer questions about "
             f"project {project_name} at version {version}.",
             # TODO add more description
-            # add the hash of all urls for that version
-            # to the tool
-            urls=[url.get_hash() for url in all_urls[version]],
+            # the indexed urls of that version are recorded in the
+            # manifest under the name of the tool
+            manifest=manifest,
         )
 
     return existing_tools
@@ -12,47 +12,548 @@
 #  or implied. See the License for the specific language governing
 #  permissions and limitations under the License.
 
-from typing import Dict, List
+import bisect
+import hashlib
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
 
 from langchain.docstore.document import Document
 from langchain.embeddings import OpenAIEmbeddings
+from langchain.embeddings.base import Embeddings
 from langchain.text_splitter import (
     CharacterTextSplitter,
+    TextSplitter,
 )
-from langchain.vectorstores import FAISS, VectorStore
+from langchain.vectorstores import VectorStore
+from packaging.version import InvalidVersion, Version
 from zenml import step
+
+from embeddings.cached_embeddings import CachedEmbeddings
+from embeddings.embedding_engine import EmbeddingEngine
+from embeddings.hashing_embeddings import HashingEmbeddings
+from jobs.progress import advance
+from knowledge.manifest import ManifestEntry, ManifestStore
+from knowledge.url import URL
+from materializers.vector_store_materializer import (
+    VectorStoresMaterializer,
+    commit_on_save,
+)
+from tools.versioned_vector_store import VersionedVectorStoreTool
+from vector_store.id_map_vector_store import IDMapVectorStore, chunk_key
+from vector_store.shared_vector_store import SharedVectorStore, VersionView
 import zenml_code.zenml_utils as zenml_utils
 
+# "openai" embeds with OpenAI, "hashing" with local hashing-based
+# embeddings that need no network access
+EMBEDDING_BACKENDS = ("openai", "hashing")
+
+
+def _source_template(source: str, version: str) -> str:
+    """Returns the URL of a page with its version replaced by "{version}".
+
+    That's the same as how Documentation builds the URL of every version
+    from a template, so the same page of two versions has the same template.
+
+    Args:
+        source: The URL of the page.
+        version: The version the page belongs to.
+    """
+    pattern = rf"(?<![\w.]){re.escape(version)}(?![\w.])"
+    return re.sub(pattern, "{version}", source)
+
+
+def _page_key(source: str, version: str) -> str:
+    """Returns the key of a page that is the same in every version.
+
+    Args:
+        source: The URL of the page.
+        version: The version the page belongs to.
+    """
+    return URL(_source_template(source, version)).get_hash()
+
+
+def _chunk_ids(page_key: str, chunks: List[Document]) -> List[str]:
+    """Returns ids for the chunks of a page derived from their content.
+
+    A chunk that is unchanged between two revisions of a page keeps its
+    id, so only the chunks that actually changed need to be indexed. The
+    heading path of a chunk is part of its content, as it is stored with
+    it, so a chunk whose section was renamed gets a new id.
+
+    Args:
+        page_key: The key of the page.
+        chunks: The chunks of the page.
+    """
+    ids = []
+    occurrences: Dict[str, int] = {}
+    for chunk in chunks:
+        content = chunk.page_content
+        heading_path = chunk.metadata.get("heading_path")
+        if heading_path:
+            content += "\0" + heading_path
+        digest = hashlib.sha256(content.encode()).hexdigest()[:16]
+        # identical chunks within a page still need distinct ids
+        occurrences[digest] = occurrences.get(digest, 0) + 1
+        ids.append(f"{page_key}-{digest}-{occurrences[digest]}")
+    return ids
+
+
+def _split_page(text_splitter: TextSplitter, document: Document) -> List[Document]:
+    """Split a page into chunks, giving each the heading path of its section.
+
+    Pages extracted by the fast path of doc_extraction have the start of
+    each of their sections in their "sections" metadata. A chunk gets the
+    heading path of the section it starts in as its "heading_path".
+
+    Args:
+        text_splitter: The splitter to chunk the page with.
+        document: The page.
+    """
+    chunks = text_splitter.split_documents([document])
+    sections = document.metadata.get("sections")
+    if not sections:
+        return chunks
+    starts = [start for start, _ in sections]
+    position = 0
+    for chunk in chunks:
+        del chunk.metadata["sections"]
+        found = document.page_content.find(chunk.page_content, position)
+        if found != -1:
+            position = found
+        section = bisect.bisect_right(starts, position) - 1
+        if section >= 0 and sections[section][1]:
+            chunk.metadata["heading_path"] = sections[section][1]
+    return chunks
+
+
+def _version_key(version: str) -> Tuple[int, object]:
+    """Returns a sort key for versions, falling back to string order."""
+    try:
+        return (0, Version(version))
+    except InvalidVersion:
+        return (1, version)
+
+
+def _nearest_version(version: str, versions: Iterable[str]) -> Optional[str]:
+    """Returns the version a new version's chunks should start from.
+
+    That's the version itself if it exists. Otherwise, it's the closest
+    earlier version, or the closest later one, since consecutive versions
+    of the docs share most of their content.
+
+    Args:
+        version: The version to find a base for.
+        versions: The existing versions.
+    """
+    versions = list(versions)
+    if version in versions:
+        return version
+    earlier = [v for v in versions if _version_key(v) < _version_key(version)]
+    if earlier:
+        return max(earlier, key=_version_key)
+    if versions:
+        return min(versions, key=_version_key)
+    return None
+
+
+def _base_tool(
+    version: str,
+    existing_tools: Dict[str, VersionedVectorStoreTool],
+    manifest: ManifestStore,
+    index_type: str,
+) -> Optional[VersionedVectorStoreTool]:
+    """Returns the existing tool a version's vector store should start from.
+
+    Tools whose store doesn't support upserts, that were created before the
+    manifest existed, or whose index is of another type can't be used as a
+    base.
+
+    Args:
+        version: The version to generate a vector store for.
+        existing_tools: The existing tools with version as key.
+        manifest: The manifest of all indexed URLs.
+        index_type: The type of index the vector store should have.
+    """
+    candidates = {
+        tool.version: tool
+        for tool in existing_tools.values()
+        if isinstance(tool.vectorstore, IDMapVectorStore)
+        and tool.vectorstore.index_type == index_type
+        and manifest.has_collection(tool.name)
+    }
+    base_version = _nearest_version(version, candidates)
+    return candidates.get(base_version)
+
+
+def _embeddings(embedding_backend: str) -> Embeddings:
+    """Returns the embeddings of a backend, one of EMBEDDING_BACKENDS.
+
+    Chunks that are shared between versions, or that were embedded by an
+    earlier run, are taken from the cache instead of being embedded again.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    if embedding_backend not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend {embedding_backend}, "
+            f"expected one of {EMBEDDING_BACKENDS}."
+        )
+    if embedding_backend == "hashing":
+        return CachedEmbeddings(HashingEmbeddings())
+    return CachedEmbeddings(OpenAIEmbeddings())
+
+
+def _retarget_sources(vector_store: IDMapVectorStore, base_version: str, version: str) -> None:
+    """Point the sources of chunks copied from another version at a version.
+
+    A new version starts with the chunks of the closest existing version,
+    and the pages that are unchanged keep them, so their sources would
+    otherwise cite the pages of the other version.
+
+    Args:
+        vector_store: The copied store, modified in place.
+        base_version: The version the chunks were copied from.
+        version: The version the store is for.
+    """
+    for key, document in vector_store.docstore.items():
+        source = _source_template(document.metadata["source"], base_version)
+        if "{version}" not in source:
+            continue
+        metadata = dict(document.metadata)
+        metadata["source"] = source.replace("{version}", version)
+        # the documents are shared with the store that was copied
+        vector_store.docstore[key] = Document(
+            page_content=document.page_content, metadata=metadata
+        )
+
+
+def _start_store(
+    collection: str,
+    version: str,
+    existing_tools: Dict[str, VersionedVectorStoreTool],
+    manifest: ManifestStore,
+    embeddings: Embeddings,
+    index_type: str,
+    nprobe: int,
+) -> Tuple[IDMapVectorStore, str]:
+    """Returns the store the delta of a version is applied to.
+
+    That's a copy of the store of the base tool of the version, see
+    `_base_tool`, with the sources of its chunks pointed at the version,
+    or an empty store if there is none. A staging copy of
+    the manifest collection of the version is set up to match, see
+    `ManifestStore.stage`, which the delta is recorded in.
+
+    Args:
+        collection: The manifest collection of the version.
+        version: The version.
+        existing_tools: The existing tools with version as key.
+        manifest: The manifest of all indexed URLs.
+        embeddings: The embeddings of a new store.
+        index_type: The type of index the vector store should have.
+        nprobe: The number of clusters IVF indexes scan per query.
+
+    Returns:
+        The store and the name of the staging collection.
+    """
+    base_tool = _base_tool(version, existing_tools, manifest, index_type)
+    if base_tool is None:
+        staging = manifest.stage(collection)
+        return IDMapVectorStore(embeddings, index_type=index_type, nprobe=nprobe), staging
+    # never modify the store of an existing tool in place
+    vector_store = base_tool.vectorstore.copy()
+    vector_store.nprobe = nprobe
+    if base_tool.version != version:
+        _retarget_sources(vector_store, base_tool.version, version)
+    return vector_store, manifest.stage(collection, base_tool.name)
+
+
+def _base_shared_store(
+    existing_tools: Dict[str, VersionedVectorStoreTool], index_type: str
+) -> Optional[SharedVectorStore]:
+    """Returns the existing shared store the new one should start from.
+
+    That's the store most existing tools are a view of, if its index is of
+    the right type.
+
+    Args:
+        existing_tools: The existing tools with version as key.
+        index_type: The type of index the vector store should have.
+    """
+    stores = [
+        tool.vectorstore.store
+        for tool in existing_tools.values()
+        if isinstance(tool.vectorstore, VersionView)
+        and tool.vectorstore.store.index_type == index_type
+    ]
+    if not stores:
+        return None
+    return max(stores, key=lambda store: sum(s is store for s in stores))
+
+
+class _Delta(NamedTuple):
+    """The changes to apply to the chunks of a version."""
+
+    # manifest keys of the pages that are gone
+    removed_pages: List[str]
+    # ids of the chunks the version no longer has
+    stale_ids: Set[str]
+    # ids and chunks the version didn't have yet
+    new_ids: List[str]
+    new_chunks: List[Document]
+    # manifest entries of the changed pages
+    new_entries: Dict[str, ManifestEntry]
+
+
+def _delta(
+    collection: str,
+    version: str,
+    documents: List[Document],
+    manifest: ManifestStore,
+    text_splitter: CharacterTextSplitter,
+) -> _Delta:
+    """Compare the documents of a version to the manifest of its collection.
+
+    Pages whose content is unchanged are skipped. The chunks of removed
+    pages are stale and, for changed pages, the chunks that are not in the
+    manifest yet are new while the ones that are gone are stale. Pages
+    that failed to load, see web_loading_utils.failed_document, keep what
+    was indexed from them before.
+
+    Args:
+        collection: The manifest collection of the version.
+        version: The version.
+        documents: The documents of the version.
+        manifest: The manifest of all indexed URLs.
+        text_splitter: The splitter to chunk the documents with.
+    """
+    failed = {
+        _page_key(document.metadata["source"], version)
+        for document in documents
+        if document.metadata.get("load_failed")
+    }
+    documents_by_key = {
+        _page_key(document.metadata["source"], version): document
+        for document in documents
+        if not document.metadata.get("load_failed")
+    }
+    diff = manifest.diff(
+        collection,
+        {
+            page_key: document.metadata.get("content_hash")
+            for page_key, document in documents_by_key.items()
+        },
+    )
+
+    removed_pages = [page_key for page_key in diff.removed if page_key not in failed]
+    stale_ids = set(manifest.chunk_ids(collection, removed_pages))
+    new_chunks, new_ids = [], []
+    new_entries = {}
+    for page_key in diff.changed:
+        document = documents_by_key[page_key]
+        chunks = _split_page(text_splitter, document)
+        ids = _chunk_ids(page_key, chunks)
+        old_ids = set(manifest.chunk_ids(collection, [page_key]))
+        stale_ids.update(old_ids.difference(ids))
+        for chunk, chunk_id in zip(chunks, ids):
+            if chunk_id not in old_ids:
+                new_chunks.append(chunk)
+                new_ids.append(chunk_id)
+        new_entries[page_key] = ManifestEntry(
+            url=document.metadata["source"],
+            content_hash=document.metadata.get("content_hash") or "",
+            fetched_at=document.metadata.get("fetched_at", 0.0),
+            chunk_ids=ids,
+        )
+    return _Delta(
+        removed_pages=removed_pages,
+        stale_ids=stale_ids,
+        new_ids=new_ids,
+        new_chunks=new_chunks,
+        new_entries=new_entries,
+    )
+
 
-@step(enable_cache=True)
-def index_generator(documents: Dict[str, List[Document]]) -> Dict[str, VectorStore]:
+def _add_chunks(
+    vector_store: IDMapVectorStore,
+    engine: EmbeddingEngine,
+    ids: List[str],
+    chunks: List[Document],
+) -> None:
+    """Embed chunks and upsert them into a vector store."""
+    texts = [chunk.page_content for chunk in chunks]
+    if vector_store.index is None and texts:
+        # a new index is trained on the vectors of its first upsert, so
+        # it gets all of them at once
+        vector_store.upsert(ids, engine.embed_all(texts), chunks)
+        advance("chunks_embedded", len(texts))
+        return
+    for start, vectors in engine.embed(texts):
+        end = start + len(vectors)
+        vector_store.upsert(ids[start:end], vectors, chunks[start:end])
+        advance("chunks_embedded", len(vectors))
+
+
+# the delta depends on the manifest, which is not an input, so a cached
+# run would return the stores of a previous run
+@step(enable_cache=False, output_materializers=VectorStoresMaterializer)
+def index_generator(
+    project_name: str,
+    documents: Dict[str, List[Document]],
+    embedding_backend: str = "openai",
+    index_type: str = "flat",
+    nprobe: int = 16,
+    shared_index: bool = False,
+) -> Dict[str, VectorStore]:
     """Generates a vector store for each version.
 
+    The vector store of a version starts from the existing store of that
+    version or, for a new version, from a copy of the store of the closest
+    existing version. Only the delta is then applied to it: pages whose
+    content is unchanged are skipped, chunks of removed pages are deleted
+    and, for changed pages, only the chunks that are not in the store yet
+    are embedded and upserted. The ManifestStore is updated to match once
+    the stores are saved, see `commit_on_save`.
+
+    With `shared_index`, all versions are stored in a single
+    SharedVectorStore instead, where chunks common to several versions are
+    stored once, and each version of the documents gets a view of it. The
+    store holds every version, so the step must be given all of them at
+    once, not run in a branch per version.
+
+    A BM25 index is built next to every vector index that changed, so
+    that the tools retrieve chunks with hybrid search.
+
     Args:
+        project_name: The name of the project the documents belong to.
         documents: A dictionary with version as key and list of Document objects as value.
+        embedding_backend: "openai" to embed with OpenAI, or "hashing" to use
+            local hashing-based embeddings that need no network access.
+        index_type: The type of the FAISS index of the stores: "flat" for
+            exact search, "ivf" or "ivfpq" to only scan the closest clusters,
+            the latter with compressed vectors, or "sq8" for exact search over
+            vectors stored in one byte per dimension. See
+            benchmarks/index_benchmark.py to pick one.
+        nprobe: The number of clusters IVF indexes scan per query.
+        shared_index: Whether to store all versions in a single index.
 
     Returns:
         A dictionary with version as key and VectorStore object as value.
     """
     # check if a tool (and in turn, a vector store) already
     # exists for some versions
-    existing_vector_stores = zenml_utils.get_existing_tools(versions=documents.keys())
+    existing_tools = zenml_utils.get_existing_tools(
+        pipeline_name="index_creation_pipeline"
+    )
+    manifest = ManifestStore()
+    embeddings = _embeddings(embedding_backend)
+    engine = EmbeddingEngine(embeddings)
+    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+
+    if shared_index:
+        return _generate_shared(
+            project_name,
+            documents,
+            existing_tools,
+            manifest,
+            engine,
+            text_splitter,
+            SharedVectorStore(embeddings, index_type=index_type, nprobe=nprobe),
+        )
+
     versioned_vector_stores = {}
     for version in documents:
-        versioned_vector_stores[version] = None
-        embeddings = OpenAIEmbeddings()
-
-        text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-        compiled_texts = text_splitter.split_documents(documents)
+        # manifest entries are grouped by the name of the tool
+        collection = f"{project_name}-{version}"
+        vector_store, staging = _start_store(
+            collection, version, existing_tools, manifest, embeddings, index_type, nprobe
+        )
 
-        if version in existing_vector_stores:
-            vector_store = existing_vector_stores[version]
-            # TODO check what function the vector store impl
-            # for upserting is called
-            vector_store.add_texts(compiled_texts, embeddings)
-        else:
-            vector_store = FAISS.from_documents(compiled_texts, embeddings)
+        delta = _delta(staging, version, documents[version], manifest, text_splitter)
+        vector_store.delete(list(delta.stale_ids))
+        _add_chunks(vector_store, engine, delta.new_ids, delta.new_chunks)
 
+        if len(vector_store) == 0:
+            continue
+        if vector_store.bm25 is None:
+            vector_store.build_bm25()
+        manifest.delete(staging, delta.removed_pages)
+        manifest.upsert(staging, delta.new_entries)
+        commit_on_save(vector_store, manifest, collection)
         versioned_vector_stores[version] = vector_store
 
     return versioned_vector_stores
+
+
+def _generate_shared(
+    project_name: str,
+    documents: Dict[str, List[Document]],
+    existing_tools: Dict[str, VersionedVectorStoreTool],
+    manifest: ManifestStore,
+    engine: EmbeddingEngine,
+    text_splitter: CharacterTextSplitter,
+    empty_store: SharedVectorStore,
+) -> Dict[str, VectorStore]:
+    """Applies the delta of every version to a single SharedVectorStore.
+
+    The store starts from a copy of the existing shared store. A new
+    version starts with the chunks of the closest existing version. Stale
+    chunks are removed from the version, and deleted once no version has
+    them, and only new chunks that no version has yet are embedded.
+
+    Returns:
+        A dictionary with the versions of the documents as key and their
+        view as value. The other versions of the store are left out, their
+        existing tools view the same chunks already.
+    """
+    base_store = _base_shared_store(existing_tools, empty_store.index_type)
+    if base_store is None:
+        store = empty_store
+    else:
+        # never modify the store of existing tools in place
+        store = base_store.copy()
+        store.nprobe = empty_store.nprobe
+
+    for version in documents:
+        collection = f"{project_name}-{version}"
+        if version in store.versions:
+            staging = manifest.stage(collection, collection)
+        else:
+            base_version = _nearest_version(version, store.versions)
+            if base_version is None:
+                staging = manifest.stage(collection)
+            else:
+                staging = manifest.stage(collection, f"{project_name}-{base_version}")
+                store.copy_version(base_version, version)
+
+        delta = _delta(staging, version, documents[version], manifest, text_splitter)
+        store.untag(version, delta.stale_ids)
+        # chunks that other versions have are only tagged, not embedded
+        missing = [
+            i
+            for i, chunk_id in enumerate(delta.new_ids)
+            if chunk_key(chunk_id) not in store.docstore
+        ]
+        chunks = []
+        for i in missing:
+            # a chunk is stored once for all versions, so its source is
+            # stored as a template that views fill in with their version
+            chunk = delta.new_chunks[i]
+            metadata = dict(chunk.metadata)
+            metadata["source"] = _source_template(metadata["source"], version)
+            chunks.append(Document(page_content=chunk.page_content, metadata=metadata))
+        _add_chunks(store, engine, [delta.new_ids[i] for i in missing], chunks)
+        store.tag(version, delta.new_ids)
+
+        manifest.delete(staging, delta.removed_pages)
+        manifest.upsert(staging, delta.new_entries)
+        commit_on_save(store, manifest, collection)
+
+    if store.bm25 is None:
+        store.build_bm25()
+    return {
+        version: store.view(version)
+        for version in documents
+        if len(store.version_keys(version)) > 0
+    }
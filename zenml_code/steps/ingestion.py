@@ -0,0 +1,386 @@
+#  Copyright (c) ZenML GmbH 2023. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import contextvars
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+from logging import getLogger
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+from urllib.parse import urlparse
+
+from langchain.docstore.document import Document
+from langchain.text_splitter import TextSplitter
+
+from embeddings.embedding_engine import EmbeddingEngine
+from jobs.progress import advance
+from knowledge.manifest import ManifestEntry, ManifestStore
+from knowledge.page_store import PageStore
+from knowledge.url import URL
+from steps.crawler import Crawler
+from steps.index_generator import _add_chunks, _chunk_ids, _page_key, _split_page
+from steps.url_scraping_utils import get_nested_readme_urls
+from steps.web_loading_utils import (
+    DEFAULT_EXTRACTOR,
+    DEFAULT_PARSE_TIMEOUT,
+    _page_document,
+    parse_stored_body,
+    parse_stored_page,
+    parser_pool,
+    store_page,
+)
+from vector_store.id_map_vector_store import IDMapVectorStore
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+# the number of chunks embedded and written to the index at once
+DEFAULT_BATCH_SIZE = 256
+# the number of items each stage may get ahead of the next one
+DEFAULT_QUEUE_SIZE = 64
+# how often a blocked producer checks whether its consumer went away
+_POLL_INTERVAL = 0.1
+_DONE = object()
+
+
+def _put(buffer: "queue.Queue", item: object, stopped: threading.Event) -> bool:
+    """Put an item in a bounded queue, unless the consumer went away."""
+    while not stopped.is_set():
+        try:
+            buffer.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(items: Iterable[T], size: int = DEFAULT_QUEUE_SIZE) -> Iterator[T]:
+    """Consume an iterable in a background thread, at most `size` items ahead.
+
+    This decouples a stage from the one consuming it: the producer runs
+    while the consumer is busy, and blocks once it is `size` items ahead.
+    Errors of the producer are raised in the consumer. The producer runs
+    in a copy of the current context, so it reports progress to the
+    current job.
+
+    Args:
+        items: The iterable to consume.
+        size: The maximum number of items waiting to be consumed.
+
+    Returns:
+        An iterator of the items, in order.
+    """
+    buffer: "queue.Queue[Tuple[object, Optional[BaseException]]]" = queue.Queue(size)
+    stopped = threading.Event()
+
+    def produce() -> None:
+        iterator = iter(items)
+        error = None
+        try:
+            for item in iterator:
+                if not _put(buffer, (item, None), stopped):
+                    return
+        except BaseException as e:
+            error = e
+        finally:
+            # stops the crawl of a consumer that went away
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        _put(buffer, (_DONE, error), stopped)
+
+    thread = threading.Thread(
+        target=contextvars.copy_context().run, args=(produce,), daemon=True
+    )
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def map_ordered(
+    function: Callable[[T], U], items: Iterable[T], executor: Executor, ahead: int
+) -> Iterator[U]:
+    """Apply a function to items on an executor, yielding results in order.
+
+    At most `ahead` items are submitted before their results are consumed.
+
+    Args:
+        function: The function to apply.
+        items: The items.
+        executor: The executor the function runs on.
+        ahead: The maximum number of items in flight.
+    """
+    iterator = iter(items)
+    in_flight: Deque[Future] = deque()
+    try:
+        while True:
+            while len(in_flight) < ahead:
+                item = next(iterator, _DONE)
+                if item is _DONE:
+                    break
+                in_flight.append(executor.submit(function, item))
+            if not in_flight:
+                return
+            yield in_flight.popleft().result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+class IngestionEngine:
+    """Streams the pages of a version from the web into a vector store.
+
+    Pages go through bounded stages: the crawl, which yields pages as they
+    are fetched, the load, which fetches the pages that weren't crawled on
+    `parse_workers` threads and parses pages on a pool of
+    `parse_processes` processes, like ParallelPageLoader, and the split and
+    embed, which write every `batch_size` new chunks straight into the
+    vector store. Each stage runs while the next one is busy and
+    stops once it is `queue_size` items ahead, so network I/O, parsing and
+    embedding overlap while only a bounded number of pages and chunks are
+    held in memory, whatever the size of the site.
+
+    The delta is the same as the one index_generator applies: pages whose
+    content is unchanged are skipped, before they are even parsed when the
+    crawler stored their body, only the chunks that are not in the store
+    yet are embedded, and the chunks of pages that are gone are deleted.
+    Pages that fail to load keep what was indexed from them before.
+    The manifest collection is updated as batches are written, which is
+    why it should be a staging collection that is only committed once the
+    store is saved, see `ManifestStore.stage`.
+    """
+
+    def __init__(
+        self,
+        engine: EmbeddingEngine,
+        text_splitter: TextSplitter,
+        manifest: ManifestStore,
+        page_store: Optional[PageStore] = None,
+        crawler: Optional[Crawler] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        parse_workers: int = 4,
+        parse_processes: Optional[int] = None,
+        parse_timeout: Optional[float] = DEFAULT_PARSE_TIMEOUT,
+        extractor: str = DEFAULT_EXTRACTOR,
+    ):
+        """Create an IngestionEngine object.
+
+        Args:
+            engine: The engine that embeds the chunks.
+            text_splitter: The splitter to chunk the pages with.
+            manifest: The manifest of all indexed URLs.
+            page_store: The store the crawled pages are written to.
+                Defaults to the default PageStore.
+            crawler: The crawler of the URLs to scrape. Defaults to a
+                Crawler writing to the page store.
+            batch_size: The number of new chunks embedded and written to
+                the store at once. Pages are never split between batches.
+            queue_size: The maximum number of pages a stage gets ahead of
+                the next one.
+            parse_workers: The number of pages loaded at once.
+            parse_processes: The number of processes pages are parsed on.
+                Defaults to the number of CPUs.
+            parse_timeout: The longest a page may take to parse, in
+                seconds. If None, parsing is not limited.
+            extractor: The extractor pages are parsed with, see
+                web_loading_utils.
+        """
+        self.engine = engine
+        self.text_splitter = text_splitter
+        self.manifest = manifest
+        self.page_store = page_store or PageStore()
+        self.crawler = crawler
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.parse_workers = parse_workers
+        self.parse_processes = parse_processes
+        self.parse_timeout = parse_timeout
+        self.extractor = extractor
+
+    def discover(self, urls: Iterable[URL]) -> Iterator[URL]:
+        """Yield the pages of some URLs as they are found, like url_scraper.
+
+        URLs ending with a slash are crawled, other URLs to scrape are
+        GitHub repositories whose READMEs are added, and URLs that are not
+        to be scraped are yielded as they are. Every page is yielded once.
+
+        Args:
+            urls: The URLs of a version.
+        """
+        yielded: Set[str] = set()
+        for url in urls:
+            if not url.scrape:
+                pages: Iterable[URL] = [url]
+            elif url.url.endswith("/"):
+                crawler = self.crawler or Crawler(page_store=self.page_store)
+                pages = (
+                    URL(page, content_hash=digest)
+                    for page, digest in crawler.iter_pages(url.url, urlparse(url.url).netloc)
+                )
+            else:
+                pages = chain(
+                    [url], (URL(readme) for readme in get_nested_readme_urls(url.url))
+                )
+            for page in pages:
+                if page.url not in yielded:
+                    yielded.add(page.url)
+                    yield page
+
+    def _load(
+        self, parser: Executor, collection: str, version: str, url: URL
+    ) -> Tuple[str, Optional[Document]]:
+        """Load a page unless it is unchanged, parsing it on the parser pool.
+
+        Returns:
+            The key of the page and its document. The document is None if
+            the page is unchanged, or if it couldn't be loaded, in which
+            case what was indexed from it before is kept.
+        """
+        page_key = _page_key(url.url, version)
+        entry = self.manifest.get(collection, page_key)
+        if (
+            entry is not None
+            and url.content_hash is not None
+            and entry.content_hash == url.content_hash
+        ):
+            return page_key, None
+        try:
+            digest, parsed = store_page(url, self.page_store, self.extractor)
+            if entry is not None and entry.content_hash == digest:
+                return page_key, None
+            if parsed:
+                # only read from the store, not worth a round trip
+                text, sections = parse_stored_body(self.page_store, digest, self.extractor)
+            else:
+                text, sections = parser.submit(
+                    parse_stored_page,
+                    self.page_store.root,
+                    digest,
+                    self.extractor,
+                    self.parse_timeout,
+                ).result()
+        except Exception as e:
+            logger.error(f"Error fetching or processing {url.url}, exception: {e}")
+            return page_key, None
+        return page_key, _page_document(url.url, digest, text, sections)
+
+    def ingest(
+        self,
+        collection: str,
+        version: str,
+        urls: Iterable[URL],
+        vector_store: IDMapVectorStore,
+    ) -> None:
+        """Apply the delta of the pages of a version to its vector store.
+
+        Args:
+            collection: The manifest collection of the version, usually a
+                staging collection.
+            version: The version.
+            urls: The URLs of the version, as given to url_scraper.
+            vector_store: The store of the version, modified in place.
+        """
+        # the keys of the pages the version still has, which is all that
+        # is kept for every page
+        seen: Set[str] = set()
+        ids: List[str] = []
+        chunks: List[Document] = []
+        entries: Dict[str, ManifestEntry] = {}
+
+        def flush() -> None:
+            _add_chunks(vector_store, self.engine, ids, chunks)
+            # only pages whose chunks are all in the store are recorded
+            self.manifest.upsert(collection, entries)
+            ids.clear()
+            chunks.clear()
+            entries.clear()
+
+        with parser_pool(self.parse_processes) as parser, ThreadPoolExecutor(
+            max_workers=self.parse_workers
+        ) as executor:
+            pages = prefetch(self.discover(urls), self.queue_size)
+            loaded = prefetch(
+                map_ordered(
+                    partial(self._load, parser, collection, version),
+                    pages,
+                    executor,
+                    2 * self.parse_workers,
+                ),
+                self.queue_size,
+            )
+            try:
+                for page_key, document in loaded:
+                    advance("pages_loaded")
+                    if page_key in seen:
+                        continue
+                    seen.add(page_key)
+                    if document is None:
+                        continue
+
+                    page_chunks = _split_page(self.text_splitter, document)
+                    page_ids = _chunk_ids(page_key, page_chunks)
+                    old_ids = set(self.manifest.chunk_ids(collection, [page_key]))
+                    stale_ids = old_ids.difference(page_ids)
+                    if stale_ids:
+                        vector_store.delete(list(stale_ids))
+                    for chunk, chunk_id in zip(page_chunks, page_ids):
+                        if chunk_id not in old_ids:
+                            chunks.append(chunk)
+                            ids.append(chunk_id)
+                    entries[page_key] = ManifestEntry(
+                        url=document.metadata["source"],
+                        content_hash=document.metadata.get("content_hash") or "",
+                        fetched_at=document.metadata.get("fetched_at", 0.0),
+                        chunk_ids=page_ids,
+                    )
+                    if len(ids) >= self.batch_size:
+                        flush()
+                flush()
+            finally:
+                # stop the stages if the ingestion failed
+                loaded.close()
+                pages.close()
+
+        removed = self.manifest.diff(collection, dict.fromkeys(seen)).removed
+        vector_store.delete(self.manifest.chunk_ids(collection, removed))
+        self.manifest.delete(collection, removed)
+        logger.info(
+            f"Ingested {len(seen)} pages of {collection}, removed {len(removed)}."
+        )
@@ -0,0 +1,99 @@
+#  Copyright (c) ZenML GmbH 2023. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from typing import Dict, List
+
+from langchain.text_splitter import CharacterTextSplitter
+from langchain.vectorstores import VectorStore
+from zenml import step
+
+from agent.agent import URL
+from embeddings.embedding_engine import EmbeddingEngine
+from knowledge.manifest import ManifestStore
+from materializers.vector_store_materializer import (
+    VectorStoresMaterializer,
+    commit_on_save,
+)
+from steps.index_generator import _embeddings, _start_store
+from steps.ingestion import DEFAULT_BATCH_SIZE, IngestionEngine
+from steps.web_loading_utils import DEFAULT_EXTRACTOR
+import zenml_code.zenml_utils as zenml_utils
+
+
+# the pages may have changed since the last run although the seed URLs
+# haven't, so the step always runs and applies the delta
+@step(enable_cache=False, output_materializers=VectorStoresMaterializer)
+def streaming_index_generator(
+    project_name: str,
+    urls: Dict[str, List[URL]],
+    embedding_backend: str = "openai",
+    index_type: str = "flat",
+    nprobe: int = 16,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    extractor: str = DEFAULT_EXTRACTOR,
+) -> Dict[str, VectorStore]:
+    """Scrapes, loads and indexes the URLs of each version in one pass.
+
+    This does the work of url_scraper, web_url_loader and index_generator,
+    but streams the pages through an IngestionEngine instead of building
+    the lists of URLs and documents of a version, so the memory it uses
+    doesn't grow with the size of the site, and no intermediate artifacts
+    are written.
+
+    Args:
+        project_name: The name of the project the URLs belong to.
+        urls: A dictionary with version as key and list of URLs as value.
+        embedding_backend: "openai" to embed with OpenAI, or "hashing" to use
+            local hashing-based embeddings that need no network access.
+        index_type: The type of the FAISS index of the stores, see
+            index_generator.
+        nprobe: The number of clusters IVF indexes scan per query.
+        batch_size: The number of new chunks embedded and written to the
+            store at once.
+        extractor: "auto" or "unstructured", see web_loading_utils.
+
+    Returns:
+        A dictionary with version as key and VectorStore object as value.
+    """
+    existing_tools = zenml_utils.get_existing_tools(
+        pipeline_name="index_creation_pipeline"
+    )
+    manifest = ManifestStore()
+    embeddings = _embeddings(embedding_backend)
+    ingestion = IngestionEngine(
+        EmbeddingEngine(embeddings),
+        CharacterTextSplitter(chunk_size=1000, chunk_overlap=0),
+        manifest,
+        batch_size=batch_size,
+        extractor=extractor,
+    )
+
+    versioned_vector_stores = {}
+    for version in urls:
+        # manifest entries are grouped by the name of the tool
+        collection = f"{project_name}-{version}"
+        vector_store, staging = _start_store(
+            collection, version, existing_tools, manifest, embeddings, index_type, nprobe
+        )
+        ingestion.ingest(staging, version, urls[version], vector_store)
+
+        if len(vector_store) == 0:
+            continue
+        if vector_store.bm25 is None:
+            vector_store.build_bm25()
+        # the manifest only describes the store once it is saved
+        commit_on_save(vector_store, manifest, collection)
+        versioned_vector_stores[version] = vector_store
+
+    return versioned_vector_stores
@@ -19,30 +19,42 @@ from steps.url_scraping_utils import get_all_pages, get_nested_readme_urls
 from zenml import step
 
 
-@step(enable_cache=True)
+# the pages may have changed since the last run although the seed URLs
+# haven't, so the crawl always runs
+@step(enable_cache=False)
 def url_scraper(
     scrapable_urls: Dict[str, List[URL]],
 ) -> Dict[str, List[URL]]:
     """Generates a list of relevant URLs to scrape.
 
+    Crawled pages are written to the PageStore and the returned URLs carry
+    the digest of their body, so that the loader doesn't fetch them again.
+    URLs that are not to be scraped are returned as they are.
+
     Args:
         scrapable_urls: A dictionary with version as key and list of URLs as value.
 
     Returns:
         A dictionary with version as key and list of URLs
     """
-    # create a new dict with all the keys from scrapable_urls
-    # and empty lists as values
     for version in scrapable_urls:
-        for url in scrapable_urls[version]:
+        # iterate over a copy since crawled pages are appended to the list
+        for url in list(scrapable_urls[version]):
+            if not url.scrape:
+                continue
             if url.url.endswith("/"):
                 # TODO think about how to incorporate
                 # READMEs. Is this method okay?
                 scrapable_urls[version].extend(get_all_pages(url.url))
             else:
-                scrapable_urls[version].extend(get_nested_readme_urls(url.url))
-            # remove duplicates
-            scrapable_urls[version] = list(
-                dict.fromkeys(scrapable_urls[version])
-            )
+                scrapable_urls[version].extend(
+                    URL(readme_url) for readme_url in get_nested_readme_urls(url.url)
+                )
+        # remove duplicates, preferring the crawled URLs that reference
+        # a stored body
+        deduplicated = {}
+        for url in scrapable_urls[version]:
+            if url.content_hash is not None or url.url not in deduplicated:
+                deduplicated[url.url] = url
+        scrapable_urls[version] = list(deduplicated.values())
     return scrapable_urls
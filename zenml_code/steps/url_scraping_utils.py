@@ -13,14 +13,18 @@
 #  permissions and limitations under the License.
 
 from logging import getLogger
-from typing import List, Set, Tuple
+from typing import TYPE_CHECKING, List, Optional, Set, Tuple
 from urllib.parse import urljoin, urlparse
 
-import requests
 from bs4 import BeautifulSoup
 
+from knowledge.http_client import get_http_client
+from knowledge.page_store import PageStore
 from knowledge.url import URL
 
+if TYPE_CHECKING:
+    from steps.crawler import Crawler
+
 logger = getLogger(__name__)
 
 
@@ -39,19 +43,19 @@ def is_valid_url(url: str, base: str) -> bool:
     return bool(parsed.netloc) and parsed.netloc == base
 
 
-def get_all_links(url: str, base: str) -> List[str]:
+def extract_links(html: str, url: str, base: str) -> List[str]:
     """
-    Retrieve all valid links from a given URL with the same base.
+    Extract all valid links with the same base from the body of a page.
 
     Args:
-        url (str): The URL to retrieve links from.
+        html (str): The body of the page.
+        url (str): The URL the page was fetched from.
         base (str): The base URL to compare against.
 
     Returns:
         List[str]: A list of valid links with the same base.
     """
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = BeautifulSoup(html, "html.parser")
     links = []
 
     for link in soup.find_all("a", href=True):
@@ -65,6 +69,21 @@ def get_all_links(url: str, base: str) -> List[str]:
     return links
 
 
+def get_all_links(url: str, base: str) -> List[str]:
+    """
+    Retrieve all valid links from a given URL with the same base.
+
+    Args:
+        url (str): The URL to retrieve links from.
+        base (str): The base URL to compare against.
+
+    Returns:
+        List[str]: A list of valid links with the same base.
+    """
+    response = get_http_client().get(url)
+    return extract_links(response.text, url, base)
+
+
 def crawl(url: str, base: str, visited: Set[str] = None) -> Set[str]:
     """
     Recursively crawl a URL and its links, retrieving all valid links with the same base.
@@ -90,22 +109,29 @@ def crawl(url: str, base: str, visited: Set[str] = None) -> Set[str]:
     return visited
 
 
-def get_all_pages(url: str) -> List[URL]:
+def get_all_pages(url: str, crawler: Optional["Crawler"] = None) -> List[URL]:
     """
     Retrieve all pages with the same base as the given URL.
 
     Args:
         url (str): The URL to retrieve pages from.
+        crawler (Crawler): The crawler to use. Defaults to a Crawler with
+            the default worker pool and limits that writes the fetched
+            bodies to the default PageStore.
 
     Returns:
-        List[URL]: A list of URLs with the same base.
+        List[URL]: A list of URLs with the same base, referencing their
+            bodies in the page store.
     """
+    from steps.crawler import Crawler
+
     logger.debug(f"Scraping all pages from {url}...")
     base_url = urlparse(url).netloc
-    pages = crawl(url, base_url)
+    crawler = crawler or Crawler(page_store=PageStore())
+    pages = crawler.crawl_pages(url, base_url)
     logger.debug(f"Found {len(pages)} pages.")
     logger.debug("Done scraping pages.")
-    return [URL(page) for page in pages]
+    return [URL(page, content_hash=digest) for page, digest in pages.items()]
 
 
 def get_readme_urls(repo_url: str) -> Tuple[List[str], List[str]]:
@@ -119,7 +145,7 @@ def get_readme_urls(repo_url: str) -> Tuple[List[str], List[str]]:
         Tuple[List[str], List[str]]: A tuple containing two lists: folder links and README links.
     """
     headers = {"Accept": "application/vnd.github+json"}
-    r = requests.get(repo_url, headers=headers)
+    r = get_http_client().get(repo_url, headers=headers)
     soup = BeautifulSoup(r.text, "html.parser")
 
     folder_links = []
@@ -0,0 +1,532 @@
+#  Copyright (c) ZenML GmbH 2023. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import codecs
+import hashlib
+import json
+import os
+import re
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from logging import getLogger
+from multiprocessing import get_context
+from typing import Deque, Iterator, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from jobs.progress import advance
+from knowledge.http_client import get_http_client
+from knowledge.page_store import PageStore
+from knowledge.url import URL
+from steps.doc_extraction import Sections, extract_doc_page
+
+logger = getLogger(__name__)
+
+# the longest a single page may take to parse, in seconds
+DEFAULT_PARSE_TIMEOUT = 60.0
+# "auto" extracts the pages of the documentation layouts doc_extraction
+# knows with its fast path, and parses the others with Unstructured,
+# "unstructured" parses all pages with Unstructured
+EXTRACTORS = ("auto", "unstructured")
+DEFAULT_EXTRACTOR = "auto"
+# the charset declared by a <meta> tag, which browsers look for in the
+# first 1024 bytes of a page
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_:.-]+)""", re.I)
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def decode_html(body: bytes, charset: Optional[str] = None) -> str:
+    """
+    Decode the body of an HTML page the way a browser would.
+
+    A byte order mark wins over the charset declared by the server, which
+    wins over a <meta> charset. Bodies without any of them are decoded as
+    UTF-8 if they are valid UTF-8, and as Windows-1252 otherwise, which is
+    what HTML defaults to.
+
+    Args:
+        body (bytes): The body of the page.
+        charset (str): The charset declared by the server, if any.
+
+    Returns:
+        str: The decoded page.
+    """
+    for bom, encoding in BOMS:
+        if body.startswith(bom):
+            return body.decode(encoding, errors="replace")
+    match = META_CHARSET.search(body[:1024])
+    for candidate in (charset, match and match.group(1).decode("ascii")):
+        if not candidate:
+            continue
+        try:
+            return body.decode(candidate, errors="replace")
+        except LookupError:
+            logger.debug(f"Unknown charset {candidate}, ignoring it.")
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        return body.decode("cp1252", errors="replace")
+
+
+def html_to_text(html: str) -> str:
+    """
+    Partition an HTML page with Unstructured and join its elements into text.
+
+    Args:
+        html (str): The body of the page.
+
+    Returns:
+        str: The text of the page, the same as UnstructuredURLLoader produces.
+    """
+    from unstructured.partition.html import partition_html
+
+    elements = partition_html(text=html)
+    return "\n\n".join([str(el) for el in elements])
+
+
+def parse_html(html: str, extractor: str = DEFAULT_EXTRACTOR) -> Tuple[str, Sections]:
+    """
+    Parse an HTML page into text with an extractor.
+
+    Args:
+        html (str): The body of the page.
+        extractor (str): One of EXTRACTORS.
+
+    Returns:
+        Tuple[str, Sections]: The text of the page and the start of each of
+            its sections with its heading path. Pages parsed with
+            Unstructured have no sections.
+    """
+    if extractor not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor {extractor}, expected one of {EXTRACTORS}.")
+    if extractor == "auto":
+        page = extract_doc_page(html)
+        if page is not None:
+            return page
+    return html_to_text(html), []
+
+
+def _derived_names(extractor: str) -> Tuple[str, str]:
+    """Returns the names the text and sections of a page are stored under."""
+    if extractor == "unstructured":
+        return "text", "sections"
+    return f"{extractor}_text", f"{extractor}_sections"
+
+
+def parse_stored_body(
+    page_store: PageStore,
+    digest: str,
+    extractor: str = DEFAULT_EXTRACTOR,
+    timeout: Optional[float] = None,
+) -> Tuple[str, Sections]:
+    """
+    Parse a body of the page store, unless it was parsed before.
+
+    The text and sections are stored next to the body, so a page is only
+    ever parsed once no matter how many versions or runs it shows up in.
+
+    Args:
+        page_store (PageStore): The store holding the page.
+        digest (str): The digest of the body of the page in the store.
+        extractor (str): One of EXTRACTORS.
+        timeout (float): The longest the parse may take, in seconds.
+
+    Returns:
+        Tuple[str, Sections]: The text and sections of the page.
+    """
+    text_name, sections_name = _derived_names(extractor)
+    text = page_store.get_derived(digest, text_name)
+    if text is not None:
+        sections = page_store.get_derived(digest, sections_name)
+        return text, json.loads(sections) if sections else []
+    with _time_limit(timeout):
+        text, sections = parse_html(
+            decode_html(page_store.get(digest), page_store.charset(digest)), extractor
+        )
+    # the text is stored last, as it marks the page as parsed
+    page_store.put_derived(digest, sections_name, json.dumps(sections))
+    page_store.put_derived(digest, text_name, text)
+    return text, sections
+
+
+def _page_document(url: str, content_hash: str, text: str, sections: Sections) -> Document:
+    """Returns the Document of a parsed page.
+
+    The heading paths of its sections are given to its chunks when it is
+    split, see index_generator.
+    """
+    metadata = {"source": url, "content_hash": content_hash, "fetched_at": time.time()}
+    if sections:
+        metadata["sections"] = sections
+    return Document(page_content=text, metadata=metadata)
+
+
+def failed_document(url: str) -> Document:
+    """Returns the placeholder Document of a page that failed to load.
+
+    index_generator keeps what it indexed from the page before, instead of
+    treating the page as removed, so a transient error doesn't wipe the
+    page from the index.
+    """
+    return Document(page_content="", metadata={"source": url, "load_failed": True})
+
+
+def load_stored_page(
+    url: str, digest: str, page_store: PageStore, extractor: str = DEFAULT_EXTRACTOR
+) -> Document:
+    """
+    Load a page that was stored by the crawler into a Document.
+
+    The parsed text is stored next to the body, so a page is only ever
+    parsed once no matter how many versions or runs it shows up in.
+
+    Args:
+        url (str): The URL of the page.
+        digest (str): The digest of the body of the page in the store.
+        page_store (PageStore): The store holding the page.
+        extractor (str): One of EXTRACTORS.
+
+    Returns:
+        Document: The text of the page with the URL as its source and the
+            hash of the page as its content hash.
+    """
+    text, sections = parse_stored_body(page_store, digest, extractor)
+    return _page_document(url, digest, text, sections)
+
+
+def load_url(url: str, extractor: str = DEFAULT_EXTRACTOR) -> Document:
+    """
+    Load a URL into a Document through the shared HTTP client.
+
+    If the page has not changed since it was last loaded, both the download
+    and the parse are skipped and the text is taken from the HTTP cache.
+
+    Args:
+        url (str): The URL to load.
+        extractor (str): One of EXTRACTORS.
+
+    Returns:
+        Document: The text of the page with the URL as its source and the
+            hash of the page as its content hash.
+
+    Raises:
+        HTTPClientError: If the page couldn't be fetched, or the server
+            responded with an error, like a 404.
+    """
+    client = get_http_client()
+    response = client.get(url)
+    # error pages are not documentation
+    response.raise_for_status()
+    text_name, sections_name = _derived_names(extractor)
+    text = response.annotations.get(text_name)
+    sections = response.annotations.get(sections_name, [])
+    if text is None:
+        text, sections = parse_html(decode_html(response.content, response.charset), extractor)
+        client.annotate(response, sections_name, sections)
+        client.annotate(response, text_name, text)
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    return _page_document(url, content_hash, text, sections)
+
+
+def load_page(
+    url: URL, page_store: PageStore, extractor: str = DEFAULT_EXTRACTOR
+) -> Document:
+    """
+    Load a URL into a Document, from the page store if its body is there.
+
+    Args:
+        url (URL): The URL to load.
+        page_store (PageStore): The store holding the crawled pages.
+        extractor (str): One of EXTRACTORS.
+
+    Returns:
+        Document: The text of the page.
+    """
+    if url.content_hash is not None and url.content_hash in page_store:
+        return load_stored_page(url.url, url.content_hash, page_store, extractor)
+    return load_url(url.url, extractor)
+
+
+def load_urls(
+    urls: List[URL],
+    page_store: Optional[PageStore] = None,
+    extractor: str = DEFAULT_EXTRACTOR,
+    keep_failed: bool = False,
+) -> List[Document]:
+    """
+    Load a list of URLs into Documents, skipping the ones that fail.
+
+    URLs that reference a body in the page store are parsed from the store,
+    all others are fetched from the network.
+
+    Args:
+        urls (List[URL]): The URLs to load.
+        page_store (PageStore): The store holding the crawled pages.
+            Defaults to the default PageStore.
+        extractor (str): One of EXTRACTORS.
+        keep_failed (bool): Whether the URLs that fail get a placeholder
+            Document instead of being skipped, see failed_document.
+
+    Returns:
+        List[Document]: The Documents of the URLs that could be loaded.
+    """
+    page_store = page_store or PageStore()
+    documents = []
+    for url in urls:
+        try:
+            documents.append(load_page(url, page_store, extractor))
+        except Exception as e:
+            logger.error(f"Error fetching or processing {url.url}, exception: {e}")
+            if keep_failed:
+                documents.append(failed_document(url.url))
+        advance("pages_loaded")
+    return documents
+
+
+@contextmanager
+def _time_limit(seconds: Optional[float]) -> Iterator[None]:
+    """Raise a TimeoutError in the block if it runs for longer than `seconds`.
+
+    The limit is enforced with SIGALRM, so it only applies in the main
+    thread on platforms that have it, like the processes of a pool.
+    """
+    if (
+        not seconds
+        or not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise TimeoutError(f"Parsing took longer than {seconds}s.")
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def parse_stored_page(
+    root: str, digest: str, extractor: str, timeout: Optional[float]
+) -> Tuple[str, Sections]:
+    """
+    Parse a body of the page store, in a worker process.
+
+    The worker reads the body from the store itself, so only the digest
+    and the text cross the process boundary, and stores the text next to
+    the body like load_stored_page does.
+
+    Args:
+        root (str): The root of the page store.
+        digest (str): The digest of the body.
+        extractor (str): One of EXTRACTORS.
+        timeout (float): The longest the parse may take, in seconds.
+
+    Returns:
+        Tuple[str, Sections]: The text and sections of the page.
+
+    Raises:
+        TimeoutError: If the parse took longer than the timeout.
+    """
+    return parse_stored_body(PageStore(root), digest, extractor, timeout)
+
+
+def parser_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Returns a pool of processes to parse pages on with parse_stored_page.
+
+    The processes are started by a fork server rather than forked from
+    this process, since forking a process with running threads, like the
+    ones fetching pages, can leave their locks held in the child.
+
+    Args:
+        max_workers: The number of processes. Defaults to the number of CPUs.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count() or 1,
+        mp_context=get_context("forkserver"),
+    )
+
+
+def store_page(url: URL, page_store: PageStore, extractor: str) -> Tuple[str, bool]:
+    """Fetch a page into the page store, unless its body is there already.
+
+    Args:
+        url: The URL of the page.
+        page_store: The store holding the crawled pages.
+        extractor: One of EXTRACTORS.
+
+    Returns:
+        The digest of the body of the page, and whether it was parsed
+        with the extractor before.
+
+    Raises:
+        HTTPClientError: If the page couldn't be fetched, or the server
+            answered with an error page.
+    """
+    if url.content_hash is not None and url.content_hash in page_store:
+        digest = url.content_hash
+    else:
+        response = get_http_client().get(url.url)
+        # error pages are not documentation
+        response.raise_for_status()
+        digest = page_store.put(response.content, response.charset)
+    text_name, _ = _derived_names(extractor)
+    return digest, page_store.get_derived(digest, text_name) is not None
+
+
+class ParallelPageLoader:
+    """Loads URLs into Documents, parsing the pages on a pool of processes.
+
+    Parsing HTML is CPU-bound, so load_urls keeps a single core busy.
+    This loader fetches pages on a pool of threads, writes their bodies to
+    the page store, and parses them on a pool of processes that read the
+    bodies from the store, so pages are never pickled. A page that takes
+    longer than `timeout` to parse is skipped, and the documents are
+    returned in the order of the URLs.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        timeout: Optional[float] = DEFAULT_PARSE_TIMEOUT,
+        fetch_workers: int = 8,
+        page_store: Optional[PageStore] = None,
+        extractor: str = DEFAULT_EXTRACTOR,
+    ):
+        """Create a ParallelPageLoader object.
+
+        Args:
+            max_workers: The number of parsing processes. Defaults to the
+                number of CPUs.
+            timeout: The longest a page may take to parse, in seconds. If
+                None, parsing is not limited.
+            fetch_workers: The number of pages fetched at once.
+            page_store: The store holding the crawled pages. Defaults to
+                the default PageStore.
+            extractor: One of EXTRACTORS.
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.fetch_workers = fetch_workers
+        self.page_store = page_store or PageStore()
+        self.extractor = extractor
+
+    def _fetch(self, url: URL) -> Tuple[str, bool]:
+        """Returns the digest of the body of a page and whether it was parsed before."""
+        return store_page(url, self.page_store, self.extractor)
+
+    def _fetched(
+        self, urls: List[URL], executor: ThreadPoolExecutor
+    ) -> Iterator[Tuple[URL, Optional[str], bool]]:
+        """Fetch pages in order, a bounded number of them at once.
+
+        The digest of the pages that failed to fetch is None.
+        """
+        in_flight: Deque[Tuple[URL, Future]] = deque()
+        pending = iter(urls)
+        while True:
+            for url in islice(pending, 2 * self.fetch_workers - len(in_flight)):
+                in_flight.append((url, executor.submit(self._fetch, url)))
+            if not in_flight:
+                return
+            url, future = in_flight.popleft()
+            try:
+                digest, parsed = future.result()
+            except Exception as e:
+                logger.error(f"Error fetching or processing {url.url}, exception: {e}")
+                yield url, None, False
+                continue
+            yield url, digest, parsed
+
+    def _document(
+        self, url: URL, digest: Optional[str], future: Optional[Future]
+    ) -> Optional[Document]:
+        """Returns the document of a page once it is parsed, or None if it failed."""
+        advance("pages_loaded")
+        if future is None:
+            # the fetch failed, which was logged already
+            return None
+        try:
+            text, sections = future.result()
+        except Exception as e:
+            logger.error(f"Error fetching or processing {url.url}, exception: {e}")
+            return None
+        return _page_document(url.url, digest, text, sections)
+
+    def load(self, urls: List[URL], keep_failed: bool = False) -> List[Document]:
+        """
+        Load a list of URLs into Documents, skipping the ones that fail.
+
+        Args:
+            urls (List[URL]): The URLs to load.
+            keep_failed (bool): Whether the URLs that fail get a placeholder
+                Document instead of being skipped, see failed_document.
+
+        Returns:
+            List[Document]: The Documents of the URLs that could be loaded,
+                in the order of the URLs.
+        """
+        documents: List[Tuple[URL, Optional[Document]]] = []
+        if not urls:
+            return documents
+        max_workers = self.max_workers or os.cpu_count() or 1
+        with parser_pool(max_workers) as parser:
+            # parse a bounded number of pages ahead of the ones returned
+            ahead = 2 * max_workers
+            parsing: Deque[Tuple[URL, Optional[str], Optional[Future]]] = deque()
+            with ThreadPoolExecutor(max_workers=self.fetch_workers) as fetcher:
+                for url, digest, parsed in self._fetched(urls, fetcher):
+                    if digest is None:
+                        future = None
+                    elif parsed:
+                        # only read from the store, not worth a round trip
+                        future = Future()
+                        future.set_result(
+                            parse_stored_body(self.page_store, digest, self.extractor)
+                        )
+                    else:
+                        future = parser.submit(
+                            parse_stored_page,
+                            self.page_store.root,
+                            digest,
+                            self.extractor,
+                            self.timeout,
+                        )
+                    parsing.append((url, digest, future))
+                    if len(parsing) >= ahead:
+                        url, digest, future = parsing.popleft()
+                        documents.append((url, self._document(url, digest, future)))
+            while parsing:
+                url, digest, future = parsing.popleft()
+                documents.append((url, self._document(url, digest, future)))
+        if keep_failed:
+            return [
+                document if document is not None else failed_document(url.url)
+                for url, document in documents
+            ]
+        return [document for _, document in documents if document is not None]
+
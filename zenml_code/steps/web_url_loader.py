@@ -12,29 +12,56 @@
 #  or implied. See the License for the specific language governing
 #  permissions and limitations under the License.
 
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from langchain.docstore.document import Document
-from langchain.document_loaders import UnstructuredURLLoader
 from zenml import step
 
 from agent.agent import URL
+from steps.web_loading_utils import (
+    DEFAULT_EXTRACTOR,
+    DEFAULT_PARSE_TIMEOUT,
+    ParallelPageLoader,
+)
 
 
-@step(enable_cache=True)
-def web_url_loader(all_urls: Dict[str, List[URL]]) -> Dict[str, List[Document]]:
+# the pages may have changed since the last run although their URLs
+# haven't, so they are always loaded, see index_generator for the delta
+@step(enable_cache=False)
+def web_url_loader(
+    all_urls: Dict[str, List[URL]],
+    parse_workers: Optional[int] = None,
+    parse_timeout: Optional[float] = DEFAULT_PARSE_TIMEOUT,
+    extractor: str = DEFAULT_EXTRACTOR,
+) -> Dict[str, List[Document]]:
     """Loads documents from a list of URLs for each version.
 
+    Pages that were crawled by the url_scraper step are parsed from the
+    PageStore instead of being fetched again. Pages are parsed on a pool
+    of processes, see ParallelPageLoader. Pages of the documentation
+    layouts doc_extraction knows are extracted with its fast path, with
+    the heading path of each section, unless `extractor` is
+    "unstructured".
+
+    Pages that fail to load get a placeholder document, so that
+    index_generator keeps what it indexed from them before.
+
     Args:
         all_urls: A dictionary with version as key and list of URLs as value.
+        parse_workers: The number of parsing processes. Defaults to the
+            number of CPUs.
+        parse_timeout: The longest a page may take to parse, in seconds.
+            Pages that take longer fail to load.
+        extractor: "auto" or "unstructured", see web_loading_utils.
 
     Returns:
         A dictionary with version as key and list of Document objects as value.
     """
+    loader = ParallelPageLoader(
+        max_workers=parse_workers, timeout=parse_timeout, extractor=extractor
+    )
     documents = {}
     for version in all_urls:
-        documents[version] = UnstructuredURLLoader(
-            urls=[url.url for url in all_urls[version]]
-        ).load()
-    
-    return documents
\ No newline at end of file
+        documents[version] = loader.load(all_urls[version], keep_failed=True)
+
+    return documents
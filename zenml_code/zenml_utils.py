@@ -1,20 +1,174 @@
 from __future__ import annotations
-from typing import Dict, List, Optional
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
 from zenml.client import Client
+from zenml.enums import ExecutionStatus
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from agent.agent import Agent, InfraConfig
+    from agent.tool_registry import ToolRegistry
 
+from agent.answer_cache import drop_answer_caches
+from jobs.job_runner import register_job_kind
 from tools.versioned_vector_store import VersionedVectorStoreTool
-from zenml_code.pipelines.pipeline import index_creation_pipeline
+from zenml_code.pipelines.pipeline import PIPELINE_NAME, index_creation_pipeline
 
 
-"""
-TODO
-make this into a ZenML helper class, a singleton and store the 
-pipeline models across calls. to optimize number of DB queries
-"""
+class ZenMLMetadata:
+    """A cache of the pipeline runs and step outputs read from ZenML.
+
+    Every lookup of the last run of a pipeline is a few queries to the
+    ZenML store, and loading a step output reads and unpickles an artifact,
+    which for the tools means loading their vector stores. The last run of
+    each (pipeline, version) is looked up once and the outputs of its steps
+    are loaded once, keyed by (pipeline, version, run id), so they are
+    shared by all callers in the process. Only completed runs count: the
+    outputs of a run that is still going, like the one a step of the
+    pipeline looks up its existing tools from, are not there yet.
+
+    A new run becomes visible once the pipeline is invalidated, which
+    `trigger_pipeline` does when its run finishes. Runs made by other
+    processes become visible once the last run is looked up again, at most
+    `last_run_ttl` seconds later. Only the id of the last run is looked up
+    again, the outputs of a run that is still the last one stay cached.
+    Either way, the answers cached for the agent of the pipeline are
+    dropped, since they came from the tools of the previous run.
+    """
+
+    def __init__(self, last_run_ttl: float = 60.0):
+        """Create a ZenMLMetadata object.
+
+        Args:
+            last_run_ttl: How long the last run of a pipeline is cached
+                for, in seconds.
+        """
+        self.last_run_ttl = last_run_ttl
+        self._lock = threading.Lock()
+        # the id of the last completed run of each (pipeline, version), None
+        # if the pipeline has none, and when it was looked up
+        self._last_runs: Dict[
+            Tuple[str, Optional[int]], Tuple[Optional[UUID], float]
+        ] = {}
+        self._runs: Dict[UUID, Any] = {}
+        # by (pipeline, version, run id, step)
+        self._outputs: Dict[Tuple[str, Optional[int], UUID, str], Any] = {}
+
+    def last_run(self, pipeline_name: str, pipeline_version: Optional[int] = None) -> Any:
+        """Returns the last completed run of a pipeline, or None if it has none.
+
+        Args:
+            pipeline_name: The name of the pipeline.
+            pipeline_version: The version of the pipeline. Defaults to the
+                latest one.
+
+        Raises:
+            KeyError: If the pipeline does not exist.
+        """
+        key = (pipeline_name, pipeline_version)
+        with self._lock:
+            if key in self._last_runs:
+                run_id, looked_up_at = self._last_runs[key]
+                if time.monotonic() - looked_up_at < self.last_run_ttl:
+                    return None if run_id is None else self._runs[run_id]
+
+        # pipelines that do not exist yet are not cached
+        pipeline_model = Client().get_pipeline(
+            name_id_or_prefix=pipeline_name, version=pipeline_version
+        )
+        # the runs are sorted from the most recent one
+        run = next(
+            (run for run in pipeline_model.runs if run.status == ExecutionStatus.COMPLETED),
+            None,
+        )
+        run_id = None if run is None else run.id
+        with self._lock:
+            previous = self._last_runs.get(key)
+            self._last_runs[key] = (run_id, time.monotonic())
+            if run is not None:
+                self._runs[run.id] = run
+            if previous is not None and previous[0] != run_id:
+                self._forget(pipeline_name, pipeline_version, previous[0])
+        return run
+
+    def _forget(
+        self, pipeline_name: str, pipeline_version: Optional[int], run_id: Optional[UUID]
+    ) -> None:
+        """Forget a replaced last run. Must be called with the lock held."""
+        drop_answer_caches(pipeline_name)
+        for key in list(self._outputs):
+            if key[:3] == (pipeline_name, pipeline_version, run_id):
+                del self._outputs[key]
+        # the run may still be the last one of the pipeline at another version
+        if all(last_run[0] != run_id for last_run in self._last_runs.values()):
+            self._runs.pop(run_id, None)
+
+    def step_output(
+        self,
+        pipeline_name: str,
+        step_name: str,
+        pipeline_version: Optional[int] = None,
+        cache: bool = True,
+    ) -> Any:
+        """Returns the output of a step of the last run of a pipeline.
+
+        Args:
+            pipeline_name: The name of the pipeline.
+            step_name: The name of the step.
+            pipeline_version: The version of the pipeline. Defaults to the
+                latest one.
+            cache: Whether the output is taken from and kept in the cache.
+                Callers that manage the memory of what they load, like the
+                model host, load a fresh copy.
+
+        Returns:
+            The output of the step, or None if the pipeline has no runs.
+
+        Raises:
+            KeyError: If the pipeline does not exist.
+            ValueError: If the output of the step can't be loaded.
+        """
+        run = self.last_run(pipeline_name, pipeline_version)
+        if run is None:
+            return None
+        if not cache:
+            return run.steps[step_name].output.load()
+        key = (pipeline_name, pipeline_version, run.id, step_name)
+        with self._lock:
+            if key in self._outputs:
+                return self._outputs[key]
+
+        output = run.steps[step_name].output.load()
+        with self._lock:
+            # keep the output loaded first if another thread raced us
+            return self._outputs.setdefault(key, output)
+
+    def invalidate(self, pipeline_name: Optional[str] = None) -> None:
+        """Forget the runs and step outputs of a pipeline, and the answer caches of its agent.
+
+        Args:
+            pipeline_name: The name of the pipeline. If None, everything
+                is forgotten.
+        """
+        drop_answer_caches(pipeline_name)
+        with self._lock:
+            for key in list(self._last_runs):
+                if pipeline_name is None or key[0] == pipeline_name:
+                    run_id, _ = self._last_runs.pop(key)
+                    self._runs.pop(run_id, None)
+            for key in list(self._outputs):
+                if pipeline_name is None or key[0] == pipeline_name:
+                    del self._outputs[key]
+
+
+_metadata = ZenMLMetadata()
+
+
+def get_metadata() -> ZenMLMetadata:
+    """Returns the ZenML metadata cache of the process."""
+    return _metadata
 
 
 def get_existing_tools(
@@ -32,31 +186,26 @@ def get_existing_tools(
     Returns:
         The tools that already exist in the agent's toolkit.
     """
-    all_tools = {}
     try:
-        pipeline_model = Client().get_pipeline(
-            name_id_or_prefix=pipeline_name, version=pipeline_version
+        # the output of the get_tools step of the last run
+        all_tools = get_metadata().step_output(
+            pipeline_name, "get_tools", pipeline_version=pipeline_version
         )
     except KeyError:
         # TODO should this be handled here or thrown to
         # the upper classes to be handled there?
-        return all_tools
+        return {}
+    except ValueError:
+        return {}
 
-    if pipeline_model.runs is not None:
-        # get the last run
-        last_run = pipeline_model.runs[0]
-        # get the agent_creator step
-        all_tools_step = last_run.steps["get_tools"]
-
-        # get the output of the step
-        try:
-            all_tools = all_tools_step.output.load()
-            if versions is not None:
-                all_tools = {version: all_tools[version] for version in versions}
-        except ValueError:
-            all_tools = {}
-
-    return all_tools
+    if all_tools is None:
+        return {}
+    # the loaded tools are shared, callers get their own dict
+    if versions is None:
+        return dict(all_tools)
+    return {
+        version: all_tools[version] for version in versions if version in all_tools
+    }
 
 
 def get_existing_agent(
@@ -64,44 +213,74 @@ def get_existing_agent(
     pipeline_version: Optional[int] = None,
 ) -> Agent:
     """Returns an agent for the specified pipeline name and version."""
-    pipeline_model = Client().get_pipeline(
-        name_id_or_prefix=pipeline_name, version=pipeline_version
-    )
-
     agent = None
-    if pipeline_model.runs is not None:
-        # get the last run
-        last_run = pipeline_model.runs[0]
-        # get the agent_creator step
-        agent_step = last_run.steps["get_agent"]
-
-        # get the output of the step
-        try:
-            agent = agent_step.output.load()
-        except ValueError:
-            # TODO should this be handled here or thrown to
-            # the upper classes to be handled there?
-            pass
+    try:
+        # the output of the get_agent step of the last run
+        agent = get_metadata().step_output(
+            pipeline_name, "get_agent", pipeline_version=pipeline_version
+        )
+    except ValueError:
+        # TODO should this be handled here or thrown to
+        # the upper classes to be handled there?
+        pass
 
     return agent
 
 
+def get_existing_tool_registry(
+    pipeline_name: str,
+    pipeline_version: Optional[int] = None,
+    cache: bool = True,
+) -> Optional[ToolRegistry]:
+    """Returns the compiled tools of a pipeline version, if it has them.
+
+    Args:
+        pipeline_name: The name of the pipeline.
+        pipeline_version: The version of the pipeline.
+        cache: Whether the registry is shared with the other callers in
+            the process, or loaded afresh.
+
+    Returns:
+        The tool registry, or None if the pipeline has no runs or its last
+        run has no compile_tools step.
+    """
+    try:
+        return get_metadata().step_output(
+            pipeline_name, "compile_tools", pipeline_version=pipeline_version, cache=cache
+        )
+    except (KeyError, ValueError):
+        return None
+
+
 def trigger_pipeline(
     pipeline_name: str,
     project_name: str,
     urls: Dict[str, List[str]],
     infra_config: InfraConfig,
-    agent: Agent,
+    agent_config: Optional[str] = None,
 ) -> None:
     """Trigger the pipeline to create the index for the agent to use.
 
     Args:
+        pipeline_name: name of the pipeline, which is the name of the agent
         project_name: name of the project
         urls: dictionary with version as key and list of URLs as value
         infra_config: infrastructure configuration for the pipeline
+        agent_config: configuration of the agent
     """
+    from agent.agent import Agent
+
+    # the job only stores the name of the agent, see Agent.for_job
+    agent = Agent.for_job(pipeline_name, config=agent_config)
     # infra config will be used to set the stack in the future.
-    # TODO call this index_creation_pipeline in a separate thread
-    # to avoid blocking the main thread
+    # this blocks until the run finishes, Agent.educate runs it as a job
     # TODO find out how to name a pipeline in code
     index_creation_pipeline(project_name, urls, agent)
+    # the run has finished, so the last runs and the tools and agent
+    # loaded from them are stale
+    get_metadata().invalidate(pipeline_name)
+    get_metadata().invalidate(PIPELINE_NAME)
+
+
+# educate jobs run the pipeline on the workers of the job runner
+register_job_kind("educate", trigger_pipeline)